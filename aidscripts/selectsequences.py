@@ -9,6 +9,8 @@ import os, argparse
 from Bio import SeqIO
 import json
 import multiprocessing
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import profiling
 
 nproc = multiprocessing.cpu_count()
 # from keras.utils import np_utils
@@ -31,14 +33,16 @@ parser.add_argument('-l', '--length', type=int, default=0, help='the required mi
 parser.add_argument('-idcolumnname', '--idcolumnname', default="ID",
                     help='the column name of sequence id in the classification file.')
 
-args = parser.parse_args()
-fastafilename = args.input
-classificationfilename = args.classification
-taxa = args.taxa
-output = args.out
-n = args.number
-l = args.length
-classificationrank = args.classificationrank
+def ParseArguments(argv=None):
+    global args, fastafilename, classificationfilename, taxa, output, n, l, classificationrank
+    args = parser.parse_args(argv)
+    fastafilename = args.input
+    classificationfilename = args.classification
+    taxa = args.taxa
+    output = args.out
+    n = args.number
+    l = args.length
+    classificationrank = args.classificationrank
 
 
 # fastafilename=sys.argv[1]
@@ -196,91 +200,100 @@ def SelectClassName(seqid, description, rank, taxa, classnames):
 	return classname
 
 
-#####main###
-classificationpos = -1
-seqidpos = -1
-classnames = {}
-classification = {}
-header = ""
-if classificationfilename != "":
-    seqidpos, classificationpos, isError = GetPosition(classificationfilename, classificationrank)
-    # if isError==False:
-    # os.sys.exit()
-    classnames, classification, header = LoadClassification(classificationfilename, taxa, classificationpos, seqidpos)
-seqrecords = SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
-selectedrecords = []
-selectedclassnames = {}
-newclassificationfilename = ""
-if classificationfilename != "":
-    if "." in output:
-        newclassificationfilename = output[0:output.rindex(".")] + ".classification"
-    else:
-        newclassificationfilename = output + ".classification"
-newclassificationfile = None
-if newclassificationfilename != "":
-    newclassificationfile = open(newclassificationfilename, "w")
-    newclassificationfile.write(header)
-uniquesequences = {}
-for seqid in seqrecords.keys():
-	seqrec = seqrecords[seqid]
-	description = seqrec.description
-	classname=SelectClassName(seqid,description,classificationrank,taxa,classnames)
-	if classname != "":
-		if n == 0:  # no limit for number of sequences for a group
-			if len(str(seqrec.seq)) >= l:  # the length of the sequence must be >=l
-				if args.unique == "yes":  # select only unique sequences
-					try:
-						seqrec = uniquesequences[str(seqrec.seq)]
-					except KeyError:
-						uniquesequences.setdefault(str(seqrec.seq), seqrec)
-						selectedrecords.append(seqrec)
-						if newclassificationfilename != "":
-							newclassificationfile.write(classification[seqid])
-						pass
-				else:
-					selectedrecords.append(seqrec)
-					if newclassificationfilename != "":
-						newclassificationfile.write(classification[seqid])
-		else:
-			if not classname in selectedclassnames.keys():
-				selectedclassnames.setdefault(classname, 0)
-			if selectedclassnames[classname] < n:
-				if len(str(seqrec.seq)) > l:
-					if args.unique == "yes":  # select only unique sequences
-						try:
-							seqrec = uniquesequences[str(seqrec.seq)]
-						except KeyError:
-							uniquesequences.setdefault(str(seqrec.seq), seqrec)
-							selectedclassnames[classname] = selectedclassnames[classname] + 1
-							selectedrecords.append(seqrec)
-							if newclassificationfilename != "":
-								newclassificationfile.write(classification[seqid])
-					else:
-						selectedclassnames[classname] = selectedclassnames[classname] + 1
-						selectedrecords.append(seqrec)
-						if newclassificationfilename != "":
-							newclassificationfile.write(classification[seqid])
-    # else:
-    #     if args.unique == "yes":  # select only unique sequences
-    #         try:
-    #             seqrec = uniquesequences[str(seqrec.seq)]
-    #         except KeyError:
-    #             uniquesequences.setdefault(str(seqrec.seq), seqrec)
-    #             selectedrecords.append(seqrec)
-    #             if newclassificationfilename != "":
-    #                 newclassificationfile.write(classification[seqid])
-    #     else:
-    #         selectedrecords.append(seqrec)
-    #         if newclassificationfilename != "":
-    #             newclassificationfile.write(classification[seqid])
+def main(argv=None):
+    ParseArguments(argv)
+    classificationpos = -1
+    seqidpos = -1
+    classnames = {}
+    classification = {}
+    header = ""
+    if classificationfilename != "":
+        seqidpos, classificationpos, isError = GetPosition(classificationfilename, classificationrank)
+        # if isError==False:
+        # os.sys.exit()
+        with profiling.Stage("classification load") as stage:
+            classnames, classification, header = LoadClassification(classificationfilename, taxa, classificationpos, seqidpos)
+            stage.Count(sequences=len(classification), clades=len(classnames))
+    with profiling.Stage("fasta load") as stage:
+        seqrecords = SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
+        stage.Count(sequences=len(seqrecords))
+    selectedrecords = []
+    selectedclassnames = {}
+    newclassificationfilename = ""
+    if classificationfilename != "":
+        if "." in output:
+            newclassificationfilename = output[0:output.rindex(".")] + ".classification"
+        else:
+            newclassificationfilename = output + ".classification"
+    newclassificationfile = None
+    if newclassificationfilename != "":
+        newclassificationfile = open(newclassificationfilename, "w")
+        newclassificationfile.write(header)
+    uniquesequences = {}
+    for seqid in seqrecords.keys():
+        seqrec = seqrecords[seqid]
+        description = seqrec.description
+        classname=SelectClassName(seqid,description,classificationrank,taxa,classnames)
+        if classname != "":
+            if n == 0:  # no limit for number of sequences for a group
+                if len(str(seqrec.seq)) >= l:  # the length of the sequence must be >=l
+                    if args.unique == "yes":  # select only unique sequences
+                        try:
+                            seqrec = uniquesequences[str(seqrec.seq)]
+                        except KeyError:
+                            uniquesequences.setdefault(str(seqrec.seq), seqrec)
+                            selectedrecords.append(seqrec)
+                            if newclassificationfilename != "":
+                                newclassificationfile.write(classification[seqid])
+                            pass
+                    else:
+                        selectedrecords.append(seqrec)
+                        if newclassificationfilename != "":
+                            newclassificationfile.write(classification[seqid])
+            else:
+                if not classname in selectedclassnames.keys():
+                    selectedclassnames.setdefault(classname, 0)
+                if selectedclassnames[classname] < n:
+                    if len(str(seqrec.seq)) > l:
+                        if args.unique == "yes":  # select only unique sequences
+                            try:
+                                seqrec = uniquesequences[str(seqrec.seq)]
+                            except KeyError:
+                                uniquesequences.setdefault(str(seqrec.seq), seqrec)
+                                selectedclassnames[classname] = selectedclassnames[classname] + 1
+                                selectedrecords.append(seqrec)
+                                if newclassificationfilename != "":
+                                    newclassificationfile.write(classification[seqid])
+                        else:
+                            selectedclassnames[classname] = selectedclassnames[classname] + 1
+                            selectedrecords.append(seqrec)
+                            if newclassificationfilename != "":
+                                newclassificationfile.write(classification[seqid])
+        # else:
+        #     if args.unique == "yes":  # select only unique sequences
+        #         try:
+        #             seqrec = uniquesequences[str(seqrec.seq)]
+        #         except KeyError:
+        #             uniquesequences.setdefault(str(seqrec.seq), seqrec)
+        #             selectedrecords.append(seqrec)
+        #             if newclassificationfilename != "":
+        #                 newclassificationfile.write(classification[seqid])
+        #     else:
+        #         selectedrecords.append(seqrec)
+        #         if newclassificationfilename != "":
+        #             newclassificationfile.write(classification[seqid])
 
-# save to file:
-SeqIO.write(selectedrecords, output, "fasta")
-if newclassificationfilename != "":
-    newclassificationfile.close()
-if len(selectedrecords) > 0:
-    print("The selected sequences are saved in " + output + ".")
+    # save to file:
+    SeqIO.write(selectedrecords, output, "fasta")
     if newclassificationfilename != "":
-        print("The new classification filename is saved in " + newclassificationfilename + ".")
-else:
-    print("No sequences are selected.")
+        newclassificationfile.close()
+    if len(selectedrecords) > 0:
+        print("The selected sequences are saved in " + output + ".")
+        if newclassificationfilename != "":
+            print("The new classification filename is saved in " + newclassificationfilename + ".")
+    else:
+        print("No sequences are selected.")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,10 +8,10 @@ if sys.version_info[0] >= 3:
 import numpy as np
 import os
 from Bio import SeqIO
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import profiling
 #import json
 #import random
-import matplotlib.pyplot as plt
-plt.rc('font',size=6)
 
 import multiprocessing
 nproc=multiprocessing.cpu_count()
@@ -33,17 +33,18 @@ parser.add_argument('-prefix','--prefix',default="", help='The prefix of the out
 parser.add_argument('-idcolumnname','--idcolumnname',default="ID", help='the column name of sequence id in the classification file.')
 parser.add_argument('-display','--display',default="", help='If display=="yes" then the plot figure is displayed.')
 
-args=parser.parse_args()
-referencename= args.input
-classificationfilename=args.classification
-jsonvariationfilename =args.out
-labelno=args.numberofdisplayedlabels
-method=args.visualizationmethod
-outputpath=args.out
-prefix=args.prefix
-
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)
+def ParseArguments(argv=None):
+	global args,referencename,classificationfilename,jsonvariationfilename,labelno,method,outputpath,prefix
+	args=parser.parse_args(argv)
+	referencename= args.input
+	classificationfilename=args.classification
+	jsonvariationfilename =args.out
+	labelno=args.numberofdisplayedlabels
+	method=args.visualizationmethod
+	outputpath=args.out
+	prefix=args.prefix
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
 
 def GetBase(filename):
 	if not ("." in filename):
@@ -168,6 +169,8 @@ def SaveDistributionInTabFormat(output,classification):
 	outputfile.close()
 	
 def PlotPieChart(figoutput,title,classification,displayed):
+	import matplotlib.pyplot as plt
+	plt.rc('font',size=6)
 	values = classification.values() 
 	total= sum(values)
 	unseqno=0
@@ -219,6 +222,8 @@ def PlotPieChart(figoutput,title,classification,displayed):
 			plt.show()	
 
 def PlotNestedPieCharts(figoutput,title,classificationlist,labels):
+	import matplotlib.pyplot as plt
+	plt.rc('font',size=6)
 	#colors = plt.cm.Set1(np.linspace(0, 1,len(data)))	
 	# create a figure with two subplots
 	#pie chart
@@ -322,90 +327,101 @@ def GetPositionList(classificationfilename,ranklist):
 ##############################################################################
 # MAIN
 ##############################################################################
-path=sys.argv[0]
-path=path[:-(len(path)-path.rindex("/")-1)]
-displayed=True
-poslist=[]
+def main(argv=None):
+	global prefix
+	ParseArguments(argv)
+	path=sys.argv[0]
+	path=path[:-(len(path)-path.rindex("/")-1)]
+	displayed=True
+	poslist=[]
 
-if prefix=="":
-	prefix=GetBase(os.path.basename(referencename))
+	if prefix=="":
+		prefix=GetBase(os.path.basename(referencename))
 			
-ranklist=[]
-if "," in args.classificationranks:
-	ranklist=args.classificationranks.split(",")
-else:
-	ranklist=[args.classificationranks]	
+	ranklist=[]
+	if "," in args.classificationranks:
+		ranklist=args.classificationranks.split(",")
+	else:
+		ranklist=[args.classificationranks]	
 
-poslist=[]
-seqidpos=0
-if classificationfilename!="":
-	poslist,seqidpos,isError=GetPositionList(classificationfilename,ranklist)
-	if isError==True:
-		sys.exit()		
+	poslist=[]
+	seqidpos=0
+	if classificationfilename!="":
+		poslist,seqidpos,isError=GetPositionList(classificationfilename,ranklist)
+		if isError==True:
+			sys.exit()		
 
-displayed=False
-if len(ranklist)==1:
-	displayed=True
+	displayed=False
+	if len(ranklist)==1:
+		displayed=True
 	
-#load train seq records
-referencerecords = SeqIO.to_dict(SeqIO.parse(referencename, "fasta"))
-if method!="krona":
-	classificationlist=[]
-	labels=[]
-	for rank in ranklist:
-		jsonfilename = GetWorkingBase(prefix) + "." + rank + ".distribution"
-		figoutput=GetBase(jsonfilename) + ".distribution.png" 
-		#Load classes, classification:
+	#load train seq records
+	with profiling.Stage("fasta load") as stage:
+		referencerecords = SeqIO.to_dict(SeqIO.parse(referencename, "fasta"))
+		stage.Count(sequences=len(referencerecords))
+	if method!="krona":
+		classificationlist=[]
+		labels=[]
+		for rank in ranklist:
+			jsonfilename = GetWorkingBase(prefix) + "." + rank + ".distribution"
+			figoutput=GetBase(jsonfilename) + ".distribution.png" 
+			#Load classes, classification:
+			classificationdict={}
+			with profiling.Stage("classification load") as stage:
+				if classificationfilename!="":
+					pos=poslist[ranklist.index(rank)]
+					classificationdict=LoadClassification(referencerecords,classificationfilename,[pos],seqidpos)
+				else:
+					classificationdict=LoadClassificationFromDescription(referencerecords,[rank])
+				stage.Count(clades=len(classificationdict))
+			title=""
+			if rank.lower()== "species":
+				title=prefix + ": the distribution of the sequences at the species level"		
+			elif rank.lower()== "genus":
+				title=prefix + ": the distribution of the sequences at the genus level"	
+			elif rank.lower()== "family":
+				title=prefix + ": the distribution of the sequences at the family level"	
+			elif rank.lower()== "order":
+				title=prefix + ": the distribution of the sequences at the order level"	
+			elif rank.lower()== "class":
+				title=prefix + ": the distribution of the sequences at the class level"	
+			elif rank.lower()== "phylum":
+				title=prefix + ": the distribution of the sequences at the phylum level"	
+			elif rank.lower()== "kingdom":
+				title=prefix + ": the distribution of the sequences at the kingdom level"	
+			else:
+				title= prefix + ": the distribution of the the sequences of the groups at the columnname " + rank
+			#save classification	
+			SaveDistributionInTabFormat(jsonfilename + ".txt",classificationdict)	
+			newclassification=classificationdict.copy()
+			classificationlist.append(newclassification)
+			labels.append(rank)
+			#plot
+			with profiling.Stage("plotting"):
+				PlotPieChart(figoutput,title,classificationdict,displayed)
+			print("The results are saved in the json file  " + jsonfilename + " and tab file " + jsonfilename + ".txt. The figure is saved in " + figoutput + "."  )	
+		if len(ranklist)>1:
+			jsonfilename=""
+			jsonfilename = GetWorkingBase(prefix) + ".distribution"
+			figoutput=jsonfilename + ".png" 
+			print("The figure of the variations of all groups are saved in file " + figoutput + ".")
+			title=prefix + ": the distribution of the sequences"
+			with profiling.Stage("plotting"):
+				PlotNestedPieCharts(figoutput,title,classificationlist,labels)
+	else:
+		kronareport = GetWorkingBase(prefix) + ".krona.report"
+		kronahtml=GetBase(kronareport) + ".html"
 		classificationdict={}
 		if classificationfilename!="":
-			pos=poslist[ranklist.index(rank)]
-			classificationdict=LoadClassification(referencerecords,classificationfilename,[pos],seqidpos)
+			classificationdict=LoadClassification(referencerecords,classificationfilename,poslist,seqidpos)
 		else:
-			classificationdict=LoadClassificationFromDescription(referencerecords,[rank])
-		title=""
-		if rank.lower()== "species":
-			title=prefix + ": the distribution of the sequences at the species level"		
-		elif rank.lower()== "genus":
-			title=prefix + ": the distribution of the sequences at the genus level"	
-		elif rank.lower()== "family":
-			title=prefix + ": the distribution of the sequences at the family level"	
-		elif rank.lower()== "order":
-			title=prefix + ": the distribution of the sequences at the order level"	
-		elif rank.lower()== "class":
-			title=prefix + ": the distribution of the sequences at the class level"	
-		elif rank.lower()== "phylum":
-			title=prefix + ": the distribution of the sequences at the phylum level"	
-		elif rank.lower()== "kingdom":
-			title=prefix + ": the distribution of the sequences at the kingdom level"	
-		else:
-			title= prefix + ": the distribution of the the sequences of the groups at the columnname " + rank
-		#save classification	
-		SaveDistributionInTabFormat(jsonfilename + ".txt",classificationdict)	
-		newclassification=classificationdict.copy()
-		classificationlist.append(newclassification)
-		labels.append(rank)
-		#plot
-		PlotPieChart(figoutput,title,classificationdict,displayed)
-		print("The results are saved in the json file  " + jsonfilename + " and tab file " + jsonfilename + ".txt. The figure is saved in " + figoutput + "."  )	
-	if len(ranklist)>1:
-		jsonfilename=""
-		jsonfilename = GetWorkingBase(prefix) + ".distribution"
-		figoutput=jsonfilename + ".png" 
-		print("The figure of the variations of all groups are saved in file " + figoutput + ".")
-		title=prefix + ": the distribution of the sequences"
-		PlotNestedPieCharts(figoutput,title,classificationlist,labels)
-else:
-	kronareport = GetWorkingBase(prefix) + ".krona.report"
-	kronahtml=GetBase(kronareport) + ".html"
-	classificationdict={}
-	if classificationfilename!="":
-		classificationdict=LoadClassification(referencerecords,classificationfilename,poslist,seqidpos)
-	else:
-		classificationdict=LoadClassificationFromDescription(referencerecords,ranklist)
-	KronaPieCharts(classificationdict,kronareport,kronahtml)
-	print("The krona report and html are saved in iles " + kronareport + " and " + kronahtml + ".") 
+			classificationdict=LoadClassificationFromDescription(referencerecords,ranklist)
+		with profiling.Stage("plotting"):
+			KronaPieCharts(classificationdict,kronareport,kronahtml)
+		print("The krona report and html are saved in iles " + kronareport + " and " + kronahtml + ".") 
 		
 	
 			
 
-
+if __name__ == "__main__":
+	main()
@@ -5,9 +5,9 @@
 import os
 import sys, argparse
 from Bio import SeqIO
-import matplotlib.pyplot as plt
-plt.rc('font',size=6)
 import numpy as np
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import profiling
 
 parser=argparse.ArgumentParser(prog='getSeqLengthDistribution.py',  
 							   usage="%(prog)s [options] -i fastafile -l intervallength -out outputname",
@@ -22,15 +22,16 @@ parser.add_argument('-prefix','--prefix',default="", help='The prefix of the out
 parser.add_argument('-label','--label',default="", help='The label to display in the figure.')
 parser.add_argument('-display','--display',default="", help='If display=="yes" then the plot figure is displayed.')
 
-args=parser.parse_args()
-fastafilename= args.input
-il= args.intervallength
-outputpath=args.out
-prefix=args.prefix
-label=args.label
-
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)
+def ParseArguments(argv=None):
+	global args,fastafilename,il,outputpath,prefix,label
+	args=parser.parse_args(argv)
+	fastafilename= args.input
+	il= args.intervallength
+	outputpath=args.out
+	prefix=args.prefix
+	label=args.label
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
 	
 def GetBase(filename):
 	if not ("." in filename):
@@ -45,6 +46,8 @@ def GetWorkingBase(filename):
 	return path
 
 def BarPlot(datasetname,labels,sums):
+	import matplotlib.pyplot as plt
+	plt.rc('font',size=6)
 	x = np.arange(len(labels))  # the label locations
 	#width = 0.35  # the width of the bars
 	if len(labels) <50:
@@ -64,44 +67,52 @@ def BarPlot(datasetname,labels,sums):
 		plt.show()
 	
 ####MAIN
-if prefix=="":
-	prefix=GetBase(os.path.basename(fastafilename))
-outputfilename=GetWorkingBase(prefix) + ".length.txt"
-figoutput=GetBase(outputfilename)  + ".png"	
-seqrecords = list(SeqIO.parse(fastafilename, "fasta"))
-maxlength=0
-minlength=0
-for seqrecord in seqrecords:
-	if len(seqrecord.seq) > maxlength:
-		maxlength=len(seqrecord.seq)
-	if minlength==0:
-		minlength=len(seqrecord.seq) 
-	elif len(seqrecord.seq)	< minlength:	
-		minlength=len(seqrecord.seq)
-outputfile=open(outputfilename,"w")
-aver=0
-n=int(maxlength/il) + 1
-sums=[0] * n
-for seqrecord in seqrecords:
-	l=len(str(seqrecord.seq))
-	i=int(l/il)
-	sums[i]= sums[i] + 1
-j=0
-#save sequence length distribution
-outputfile.write("Interval\tNumber of sequences\n")
-intervals=[]
-labels=[]
-for i in range(0,n):
-	outputfile.write("[" + str(j) + "," + str(j+il) + ")" + "\t" + str(sums[i]) + "\n")
-	intervals.append(j)
-	labels.append("[" + str(j) + "," + str(j+il) + ")")
-	j=j+il
-outputfile.close()
-print("The minimum sequence length is " + str(minlength))
-print("The maximum sequence length is " + str(maxlength))
-print("The distribution and its figure are saved in files " + outputfilename + " and " + figoutput + ".")
-#plot
-if label=="":
-	label=prefix
-BarPlot(label,labels,sums)
+def main(argv=None):
+	global prefix,label,figoutput
+	ParseArguments(argv)
+	if prefix=="":
+		prefix=GetBase(os.path.basename(fastafilename))
+	outputfilename=GetWorkingBase(prefix) + ".length.txt"
+	figoutput=GetBase(outputfilename)  + ".png"	
+	with profiling.Stage("fasta load") as stage:
+		seqrecords = list(SeqIO.parse(fastafilename, "fasta"))
+		stage.Count(sequences=len(seqrecords))
+	maxlength=0
+	minlength=0
+	for seqrecord in seqrecords:
+		if len(seqrecord.seq) > maxlength:
+			maxlength=len(seqrecord.seq)
+		if minlength==0:
+			minlength=len(seqrecord.seq) 
+		elif len(seqrecord.seq)	< minlength:	
+			minlength=len(seqrecord.seq)
+	outputfile=open(outputfilename,"w")
+	aver=0
+	n=int(maxlength/il) + 1
+	sums=[0] * n
+	for seqrecord in seqrecords:
+		l=len(str(seqrecord.seq))
+		i=int(l/il)
+		sums[i]= sums[i] + 1
+	j=0
+	#save sequence length distribution
+	outputfile.write("Interval\tNumber of sequences\n")
+	intervals=[]
+	labels=[]
+	for i in range(0,n):
+		outputfile.write("[" + str(j) + "," + str(j+il) + ")" + "\t" + str(sums[i]) + "\n")
+		intervals.append(j)
+		labels.append("[" + str(j) + "," + str(j+il) + ")")
+		j=j+il
+	outputfile.close()
+	print("The minimum sequence length is " + str(minlength))
+	print("The maximum sequence length is " + str(maxlength))
+	print("The distribution and its figure are saved in files " + outputfilename + " and " + figoutput + ".")
+	#plot
+	if label=="":
+		label=prefix
+	with profiling.Stage("plotting"):
+		BarPlot(label,labels,sums)
 
+if __name__ == "__main__":
+	main()
@@ -10,7 +10,14 @@ if sys.version_info[0] >= 3:
 	unicode = str
 import os, argparse
 import multiprocessing
+import json
+import shutil
 from Bio import SeqIO
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.blast import RunBlast,ReadBlastLines,MakeBlastDb,RunBlastn,BlastError
+from lib.blastcache import BlastCache
+from lib.simmatrix import SaveSim,SaveBinarySim,LoadSims,LoadSimFromBlastHits,StreamSimFromBlastLines
+from lib import profiling
 
 nproc=multiprocessing.cpu_count()
 
@@ -24,15 +31,26 @@ parser.add_argument('-i','--input', required=True, help='the fasta file')
 parser.add_argument('-o','--out',default="dnabarcoder", help='The output folder.') 
 parser.add_argument('-ml','--minalignmentlength', type=int, default=400, help='Minimum sequence alignment length required for BLAST. For short barcode sequences like ITS2 (ITS1) sequences, minalignmentlength should be set to smaller, 50 for instance.')
 parser.add_argument('-ms','--minsim', type=float, default=0, help='The minimum similarity score that will be saved for the output.')
+parser.add_argument('-blastcache','--blastcache', default="", help='The folder to cache the BLAST results for the next runs. If blastcache=="", the BLAST results are not cached.')
+parser.add_argument('-blastcachesize','--blastcachesize', type=int, default=10000, help='The maximum size in MB of the BLAST cache. The least recently used results are removed first.')
+parser.add_argument('-f','--format', default="text", help='The format of the similarity file: text or binary. The binary format is loaded faster and memory-mapped.')
+parser.add_argument('-shards','--shards', type=int, default=1, help='The number of chunks of the query sequences to be compared to all the sequences separately. The similarity matrix of each chunk is saved in the folder <output>/<input>.sim.shards so that an interrupted computation can be resumed. The chunks are merged when all of them are done.')
+parser.add_argument('-shard','--shard', type=int, default=-1, help='If shard>=0, only the chunk with this index (from 0) is computed, without merging the chunks.')
+parser.add_argument('-ncpus','--ncpus', type=int, default=1, help='The number of chunks computed in parallel.')
+parser.add_argument('-jobs','--jobs', default="", help='If jobs!="", the commands to compute the chunks are saved in this file, one per line, to be run by a scheduler. The last command merges the chunks after all of them are done.')
 
-args=parser.parse_args()
-fastafilename= args.input
-mincoverage=args.minalignmentlength
-minsim=args.minsim
-outputpath=args.out
-
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)	
+def ParseArguments(argv=None):
+	global args,fastafilename,mincoverage,minsim,outputpath,blastcache
+	args=parser.parse_args(argv)
+	fastafilename= args.input
+	mincoverage=args.minalignmentlength
+	minsim=args.minsim
+	outputpath=args.out
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)	
+	blastcache=None
+	if args.blastcache!="":
+		blastcache=BlastCache(args.blastcache,args.blastcachesize*1024*1024)
 	
 def GetBase(filename):
 	return filename[:-(len(filename)-filename.rindex("."))] 
@@ -43,74 +61,163 @@ def GetWorkingBase(filename):
 	path=outputpath + "/" + basename
 	return path
 
-def SaveSim(simmatrix,simfilename,ms):
-	simfile=open(simfilename,"w")
-	for i in simmatrix.keys():
-		for j in simmatrix[i].keys():
-			if simmatrix[i][j] >= ms:
-				simfile.write(str(i) + " " + str(j) + " " + str(simmatrix[i][j]) + "\n")
-	simfile.close()
+def SaveSimFile(simmatrix,output,minsim):
+	if args.format=="binary":
+		SaveBinarySim(simmatrix,output,minsim)
+	else:
+		SaveSim(simmatrix,output,minsim)
 
-def ComputeSim(fastafilename,mincoverage,minsim):
-	#scorematrix = [[0 for x in range(len(seqrecords))] for y in range(len(seqrecords))] 
-#	simfilename=GetBase(fastafilename) + ".sim"
-#	simfile=open(simfilename,"w")
-	#blast
-	makedbcommand = "makeblastdb -in " + fastafilename + " -dbtype \'nucl\' " +  " -out db"
-	os.system(makedbcommand)
-	blastcommand = "blastn -query " + fastafilename + " -db  db -task blastn-short -outfmt 6 -out out.txt -num_threads " + str(nproc)
+def GetTask(mincoverage):
+	task="blastn-short"
 	if mincoverage >=400:
-		blastcommand = "blastn -query " + fastafilename + " -db  db -outfmt 6 -out out.txt -num_threads " + str(nproc)
-	os.system(blastcommand)
-	
-	seqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
-	simmatrix={}
-	for seqid in seqrecords.keys():
-		simmatrix.setdefault(seqid,{})
-		simmatrix[seqid][seqid]=1
-	
-	#read blast output
-	blastoutputfile = open("out.txt")
-	for line in blastoutputfile:
-		if line.rstrip()=="":
-			continue
-		words = line.split("\t")
-#		queryid = words[0].rstrip()
-#		refid = words[1].rstrip()
-		i = words[0].rstrip()
-		j = words[1].rstrip()
-#		i = seqids.index(queryid)
-#		j = seqids.index(refid)
-		pos1 = int(words[6])
-		pos2 = int(words[7])
-		iden = float(words[2]) 
-		sim=float(iden)/100
-		coverage=abs(pos2-pos1)
-		score=sim
-		if coverage < mincoverage:
-			score=float(score * coverage)/mincoverage
-		if j in simmatrix[i].keys():
-			if simmatrix[i][j] < score:
-				simmatrix[i][j]=round(score,4)
-				simmatrix[j][i]=round(score,4)
+		task="megablast"
+	return task
+
+def ComputeSim(fastafilename,mincoverage,minsim):
+	with profiling.Stage("fasta load") as stage:
+		seqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
+		stage.Count(sequences=len(seqrecords))
+	task=GetTask(mincoverage)
+	if blastcache!=None:
+		hits=blastcache.Load(seqrecords.values(),None,task)
+		if hits!=None:
+			print("The BLAST results of " + fastafilename + " are loaded from the cache " + args.blastcache + ".")
 		else:
-			simmatrix[i][j]=round(score,4)
-			simmatrix[j][i]=round(score,4)
-#		if scorematrix[i][j] < score:
-#			scorematrix[i][j]=score
-#			scorematrix[j][i]=score
-	os.system("rm out.txt")
+			hits=ReadBlastLines(RunBlast(fastafilename,fastafilename,task,nproc))
+			blastcache.Save(seqrecords.values(),None,task,hits)
+		return LoadSimFromBlastHits(hits,seqrecords.keys(),mincoverage)
+	#read the hits from the output of blast as they arrive, only the scores >= minsim are kept
+	return StreamSimFromBlastLines(RunBlast(fastafilename,fastafilename,task,nproc),seqrecords.keys(),mincoverage,minsim)
+
+def GetShardPath(fastafilename):
+	return GetWorkingBase(fastafilename) + ".sim.shards"
+
+def PrepareShards(fastafilename,shardpath,shardnumber,mincoverage,minsim):
+	#Split the sequences into chunks and make the BLAST database of all the sequences in the shard folder.
+	#The chunks of a previous run are kept if they have been computed with the same parameters.
+	stat=os.stat(fastafilename)
+	params={"fasta filename":os.path.abspath(fastafilename),"fasta size":stat.st_size,"fasta time":stat.st_mtime,"shards":shardnumber,"min alignment length":mincoverage,"min similarity":minsim}
+	paramfilename=shardpath + "/shards.json"
+	if os.path.exists(paramfilename):
+		with open(paramfilename) as json_file:
+			if json.load(json_file)==params:
+				return
+	if os.path.exists(shardpath):
+		shutil.rmtree(shardpath)
+	os.makedirs(shardpath)
+	seqrecords=list(SeqIO.parse(fastafilename, "fasta"))
+	chunksize=-(-len(seqrecords)//shardnumber)
+	for k in range(shardnumber):
+		SeqIO.write(seqrecords[k*chunksize:(k+1)*chunksize],shardpath + "/" + str(k) + ".fasta","fasta")
+	MakeBlastDb(fastafilename,shardpath + "/db")
+	#the parameters are saved last so that an interrupted preparation is redone
+	with open(paramfilename,"w") as json_file:
+		json.dump(params,json_file,indent=2)
+
+def ComputeShard(shardpath,k,mincoverage,minsim,nproc):
+	#compare the chunk k to all the sequences. The file k.done marks that k.sim is complete, so they are only written
+	#if blastn has succeeded.
+	donefilename=shardpath + "/" + str(k) + ".done"
+	if os.path.exists(donefilename):
+		return
+	simfilename=shardpath + "/" + str(k) + ".sim"
+	try:
+		simmatrix=StreamSimFromBlastLines(RunBlastn(shardpath + "/" + str(k) + ".fasta",shardpath + "/db",GetTask(mincoverage),nproc),[],mincoverage,minsim)
+	except BlastError as e:
+		raise BlastError("Cannot compute chunk " + str(k) + " of the similarity matrix. " + str(e))
+	SaveSim(simmatrix,simfilename + ".tmp",minsim)
+	os.replace(simfilename + ".tmp",simfilename)
+	open(donefilename,"w").close()
+	print("The similarity matrix of chunk " + str(k) + " is saved in " + simfilename + ".")
+
+def ComputeShardInWorker(params):
+	shardpath,k,mincoverage,minsim,nproc=params
+	ComputeShard(shardpath,k,mincoverage,minsim,nproc)
+	return k
+
+def ComputeShards(shardpath,shardnumber,mincoverage,minsim,ncpus):
+	shards=[]
+	for k in range(shardnumber):
+		if not os.path.exists(shardpath + "/" + str(k) + ".done"):
+			shards.append(k)
+	if ncpus <=1 or len(shards) <=1:
+		for k in shards:
+			ComputeShard(shardpath,k,mincoverage,minsim,nproc)
+		return
+	#the BLAST threads are shared by the workers
+	workernproc=max(1,int(nproc/ncpus))
+	pool=multiprocessing.get_context("fork").Pool(min(ncpus,len(shards)))
+	try:
+		for k in pool.imap_unordered(ComputeShardInWorker,[(shardpath,k,mincoverage,minsim,workernproc) for k in shards]):
+			pass
+	finally:
+		pool.close()
+		pool.join()
+
+def MergeShards(fastafilename,shardpath,shardnumber):
+	simfilenames=[]
+	for k in range(shardnumber):
+		if not os.path.exists(shardpath + "/" + str(k) + ".done"):
+			print("Chunk " + str(k) + " of " + fastafilename + " has not been computed yet.")
+			sys.exit(1)
+		simfilenames.append(shardpath + "/" + str(k) + ".sim")
+	with profiling.Stage("fasta load") as stage:
+		seqids=[seqrecord.id for seqrecord in SeqIO.parse(fastafilename, "fasta")]
+		stage.Count(sequences=len(seqids))
+	with profiling.Stage("sim load") as stage:
+		simmatrix=LoadSims(simfilenames).SubMatrix(seqids)
+		stage.Count(sequences=len(simmatrix),edges=simmatrix.EdgeNumber())
 	return simmatrix
 
-if __name__ == "__main__":
+def SaveJobs(jobfilename,shardnumber):
+	#the commands to compute the chunks, followed by the command merging them
+	command=sys.executable + " " + os.path.abspath(__file__) + " -i " + os.path.abspath(fastafilename) + " -o " + os.path.abspath(outputpath) + " -ml " + str(mincoverage) + " -ms " + str(minsim) + " -f " + args.format + " -shards " + str(shardnumber)
+	jobfile=open(jobfilename,"w")
+	for k in range(shardnumber):
+		jobfile.write(command + " -shard " + str(k) + "\n")
+	jobfile.write(command + "\n")
+	jobfile.close()
+
+def main(argv=None):
+	ParseArguments(argv)
+	output=GetWorkingBase(fastafilename) + ".sim"
+	if args.shards > 1:
+		shardpath=GetShardPath(fastafilename)
+		#a failed BLAST run leaves its chunk to be computed again, and the exit status tells the scheduler of the jobs
+		try:
+			#the parameters of the shards are only saved if the BLAST database has been made
+			PrepareShards(fastafilename,shardpath,args.shards,mincoverage,minsim)
+			if args.jobs!="":
+				SaveJobs(args.jobs,args.shards)
+				print("The commands to compute the chunks of the similarity matrix are saved in " + args.jobs + ".")
+				sys.exit()
+			if args.shard >=0:
+				ComputeShard(shardpath,args.shard,mincoverage,minsim,nproc)
+				sys.exit()
+			print("Computing similarity matrix using BLAST in " + str(args.shards) + " chunks..")
+			ComputeShards(shardpath,args.shards,mincoverage,minsim,args.ncpus)
+		except BlastError as e:
+			print(str(e))
+			sys.exit(1)
+		simmatrix=MergeShards(fastafilename,shardpath,args.shards)
+		SaveSimFile(simmatrix,output,minsim)
+		shutil.rmtree(shardpath)
+		print("The similarity file is saved in " + output + ".")
+		sys.exit()
 	#load sequences
 	base = sys.argv[0][0: sys.argv[0].rindex("/")+1]
-	simmatrix={}
+	simmatrix=None
 	print("Computing similarity matrix using BLAST..")
-	simmatrix=ComputeSim(fastafilename,mincoverage,minsim)
-	output=GetWorkingBase(fastafilename) + ".sim"
+	try:
+		simmatrix=ComputeSim(fastafilename,mincoverage,minsim)
+	except BlastError as e:
+		print(str(e))
+		sys.exit(1)
 	#save the simmatrix
-	SaveSim(simmatrix,output,minsim)
+	SaveSimFile(simmatrix,output,minsim)
 	print("The similarity file is saved in " + output + ".")		
-			
 		
+	
+
+if __name__ == "__main__":
+	main()
@@ -10,10 +10,14 @@ import os
 from Bio import SeqIO
 import json
 import random
-import matplotlib.pyplot as plt
-plt.rc('font',size=6)
-from matplotlib.patches import Polygon
 import multiprocessing
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.simmatrix import LoadSim,LoadSimFromBlastHits
+from lib.blast import ReadBlastOutput
+from lib.blastcache import BlastCache
+from lib.taxonomyindex import TaxonomyIndex
+from lib.quantilesketch import QuantileSketch
+from lib import profiling
 nproc=multiprocessing.cpu_count()
 
 parser=argparse.ArgumentParser(prog='computeVariation.py',  
@@ -27,32 +31,39 @@ parser.add_argument('-ml','--minalignmentlength', type=int, default=400, help='M
 parser.add_argument('-o','--out',default="dnabarcoder", help='The output folder.')
 parser.add_argument('-c','--classification', default="", help='the classification file in tab. format.')
 parser.add_argument('-rank','--classificationranks', default="species,genus,family,order,class,phylum", help='the classification ranks to compute variation, separated by ",".')
-parser.add_argument('-m','--maxSeqNo', type=int, default=0, help='The maximum number of randomly selected sequences of each class to be computed in the case the groups are too big.')
+parser.add_argument('-m','--maxSeqNo', type=int, default=0, help='The maximum number of sequences of each class to be computed exactly in the case the groups are too big. The median similarity score of a bigger group is estimated with a quantile sketch of all its scores in the similarity matrix, or computed for maxSeqNo randomly selected sequences if the group is not in the similarity matrix.')
+parser.add_argument('-sketchsize','--sketchsize', type=int, default=200, help='The size of the quantile sketches estimating the median similarity scores of the groups with more than maxSeqNo sequences. The median of a group of n scores is estimated within about 1.7n/sketchsize positions.')
 parser.add_argument('-plt','--plottype', default="boxplot", help='The type of plots. There are two options: boxplot and plot.')
 parser.add_argument('-sim','--simfilename', default="", help='The similarity matrix of the sequences if exists.')
+parser.add_argument('-blastcache','--blastcache', default="", help='The folder to cache the BLAST results for the next runs. If blastcache=="", the BLAST results are not cached.')
+parser.add_argument('-blastcachesize','--blastcachesize', type=int, default=10000, help='The maximum size in MB of the BLAST cache. The least recently used results are removed first.')
 parser.add_argument('-prefix','--prefix',default="", help='The prefix of the output files.')
 parser.add_argument('-label','--label',default="", help='The label to display in the figure.')
-parser.add_argument('-maxSimMatrixSize','--maxSimMatrixSize', type=int, default=20000, help='The maximum number of sequences to load or compute a full similarity matrix. In case the number of sequences is greater than this number, only similarity values greater than 0 will be loaded to avoid memory problems.')
+parser.add_argument('-maxSimMatrixSize','--maxSimMatrixSize', type=int, default=20000, help='Ignored, kept for compatibility. The similarity matrix is always loaded as a sparse matrix of the similarity values greater than 0.')
 parser.add_argument('-idcolumnname','--idcolumnname',default="ID", help='the column name of sequence id in the classification file.')
 parser.add_argument('-display','--display',default="", help='If display=="yes" then the plot figure is displayed.')
 
-args=parser.parse_args()
-referencename= args.input
-mincoverage = args.minalignmentlength
-classificationfilename=args.classification
-jsonvariationfilename =args.out
-plottype=args.plottype
-simfilename=args.simfilename
-prefix=args.prefix
-label=args.label
-
-
-maxSeqNo=0
-if args.maxSeqNo !=None:
-	maxSeqNo=args.maxSeqNo
-outputpath=args.out
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)	
+def ParseArguments(argv=None):
+	global args,referencename,mincoverage,classificationfilename,jsonvariationfilename,plottype,simfilename,prefix,label,maxSeqNo,sketchsize,outputpath,blastcache
+	args=parser.parse_args(argv)
+	referencename= args.input
+	mincoverage = args.minalignmentlength
+	classificationfilename=args.classification
+	jsonvariationfilename =args.out
+	plottype=args.plottype
+	simfilename=args.simfilename
+	prefix=args.prefix
+	label=args.label
+	maxSeqNo=0
+	if args.maxSeqNo !=None:
+		maxSeqNo=args.maxSeqNo
+	sketchsize=args.sketchsize
+	outputpath=args.out
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)	
+	blastcache=None
+	if args.blastcache!="":
+		blastcache=BlastCache(args.blastcache,args.blastcachesize*1024*1024)
 
 def GetBase(filename):
 	if not ("." in filename):
@@ -70,106 +81,96 @@ def GetWorkingBase(basename):
 	path=outputpath + "/" + basename
 	return path
 
-def LoadClassificationFromDescription(seqrecords,rank):
-	for seqid in seqrecords.keys():
-		description=seqrecords[seqid].description
-		species=""
-		genus=""
-		family=""
-		order=""
-		bioclass=""
-		phylum=""
-		kingdom=""
-		if " " in description:
-			description=description.split(" ")[1]
-		texts=description.split("|")
-		for text in texts:
-			text=text.rstrip()
-			taxa=text.split(";")	
-			for taxon in taxa:
-				if taxon.startswith("k__"):
-					kingdom=taxon.replace("k__","")
-				elif taxon.startswith("p__"):
-					phylum=taxon.replace("p__","")
-				elif taxon.startswith("c__"):
-					bioclass=taxon.replace("c__","")	
-				elif taxon.startswith("o__"):
-					order=taxon.replace("o__","")
-				elif taxon.startswith("f__"):
-					family=taxon.replace("f__","")	
-				elif taxon.startswith("g__"):
-					genus=taxon.replace("g__","")
-				elif taxon.startswith("s__") and (" " in taxon.replace("s__","") or "_" in taxon.replace("s__","")):
-					species=taxon.replace("s__","")
-					species=species.replace("_"," ")
-		if rank.lower()=="species":
-			classname=species
-		elif rank.lower()=="genus":
-			classname=genus
-		elif rank.lower()=="family":
-			classname=family
-		elif rank.lower()=="order":
-			classname=order
-		elif rank.lower()=="class":
-			classname=bioclass
-		elif rank.lower()=="phylum":
-			classname=phylum
-		elif rank.lower()=="kingdom":
-			classname=kingdom
-		if classname=="" or ("unidentified" in classname):
-			continue 
-		if seqid in seqrecords.keys():
-			if not (classname in classes.keys()):
-				classes.setdefault(classname,[])	
-			classes[classname].append(seqrecords[seqid])				
-	return classes
-
-def LoadClassification(seqrecords,classificationfilename,pos,seqidpos):
-	classes={}
-	if classificationfilename == "":
-		return classes
-	records= open(classificationfilename)
-	next(records)
-	for line in records:
-		elements=line.split("\t")
-		seqid = elements[seqidpos].replace(">","").rstrip()
+def GetTaxonName(description,rank):
+	classname=""
+	species=""
+	genus=""
+	family=""
+	order=""
+	bioclass=""
+	phylum=""
+	kingdom=""
+	if " " in description:
+		description=description.split(" ")[1]
+	texts=description.split("|")
+	for text in texts:
+		text=text.rstrip()
+		taxa=text.split(";")	
+		for taxon in taxa:
+			if taxon.startswith("k__"):
+				kingdom=taxon.replace("k__","")
+			elif taxon.startswith("p__"):
+				phylum=taxon.replace("p__","")
+			elif taxon.startswith("c__"):
+				bioclass=taxon.replace("c__","")	
+			elif taxon.startswith("o__"):
+				order=taxon.replace("o__","")
+			elif taxon.startswith("f__"):
+				family=taxon.replace("f__","")	
+			elif taxon.startswith("g__"):
+				genus=taxon.replace("g__","")
+			elif taxon.startswith("s__") and (" " in taxon.replace("s__","") or "_" in taxon.replace("s__","")):
+				species=taxon.replace("s__","")
+				species=species.replace("_"," ")
+	if rank.lower()=="species":
+		classname=species
+	elif rank.lower()=="genus":
+		classname=genus
+	elif rank.lower()=="family":
+		classname=family
+	elif rank.lower()=="order":
+		classname=order
+	elif rank.lower()=="class":
+		classname=bioclass
+	elif rank.lower()=="phylum":
+		classname=phylum
+	elif rank.lower()=="kingdom":
+		classname=kingdom
+	if "unidentified" in classname:
 		classname=""
-		if pos < len(elements):
-			 classname=elements[pos].rstrip()
-		if classname=="" or classname=="unidentified":
-			continue 
-		if seqid in seqrecords.keys():
-			if not (classname in classes.keys()):
-				classes.setdefault(classname,[])	
-			classes[classname].append(seqrecords[seqid])
-	records.close()			
-	return classes
+	return classname
 
-def LoadSim(simfilename):
-	simmatrix = {} #we use dictionary to reduce the memory constraints 
-	simfile = open(simfilename)
+def LoadTaxonomyIndex(seqrecords,ranklist):
+	#the taxa of the sequences at the ranks, in the order of the classification file or else of the fasta file
 	seqids=[]
-	for line in simfile:
-		numbers=line.rstrip().split(" ")
-		i=numbers[0]
-		j=numbers[1]
-		seqids.append(i)
-		seqids.append(j)
-		if i not in simmatrix.keys():
-			simmatrix.setdefault(i, {})
-		simmatrix[i][j]=float(numbers[2])
-	seqids=list(set(seqids))	
-	for seqid1 in seqids:
-		if not (seqid1 in simmatrix.keys()):
-			simmatrix.setdefault(seqid1, {})
-			simmatrix[seqid1][seqid1]=1	
-		if len(seqids) < args.maxSimMatrixSize: #load full matrix	
-			for seqid2 in seqids:
-				if not seqid2 in simmatrix[seqid1].keys():
-					#simmatrix[seqid1].setdefault(seqid2,0)
-					simmatrix[seqid1][seqid2]=0
-	simfile.close()		
-	return simmatrix
+	classnames=[]
+	for rank in ranklist:
+		classnames.append([])
+	if classificationfilename != "":
+		seqidpos,positionlist,isError=GetPositionList(classificationfilename,ranklist)	
+		if isError==True :
+			sys.exit()
+		added=set()
+		records= open(classificationfilename)
+		next(records)
+		for line in records:
+			elements=line.split("\t")
+			seqid = elements[seqidpos].replace(">","").rstrip()
+			if not (seqid in seqrecords.keys()) or (seqid in added):
+				continue
+			added.add(seqid)
+			seqids.append(seqid)
+			i=0
+			for pos in positionlist:
+				classname=""
+				if pos < len(elements):
+					 classname=elements[pos].rstrip()
+				classnames[i].append(classname)
+				i=i+1
+		records.close()
+	else:
+		seqids=list(seqrecords.keys())
+		i=0
+		for rank in ranklist:
+			for seqid in seqids:
+				classnames[i].append(GetTaxonName(seqrecords[seqid].description,rank))
+			i=i+1
+	taxonomyindex=TaxonomyIndex(seqids)
+	i=0
+	for rank in ranklist:
+		taxonomyindex.AddRank(rank.lower(),classnames[i])
+		i=i+1
+	return taxonomyindex
 
 def GetSeqIndex(seqname,seqrecords):
 	i=0
@@ -180,19 +181,31 @@ def GetSeqIndex(seqname,seqrecords):
 	return -1
 
 def ComputeSim(fastafilename,seqrecords,mincoverage):
+	task="blastn-short"
+	if mincoverage >=400:
+		task="megablast"
+	if blastcache!=None:
+		hits=blastcache.Load(seqrecords.values(),None,task)
+		if hits!=None:
+			print("The BLAST results of " + fastafilename + " are loaded from the cache " + args.blastcache + ".")
+			return LoadSimFromBlastHits(hits,seqrecords.keys(),mincoverage)
 	blastoutput = fastafilename + ".blast.out"		
 	blastdb=fastafilename + ".db"		
 	#blast
 	print("Comparing the sequences of " + fastafilename + " using Blast...")
 	makedbcommand = "makeblastdb -in " + fastafilename + " -dbtype \'nucl\' " +  " -out " + blastdb
 	print(makedbcommand)
-	os.system(makedbcommand)
+	with profiling.Stage("makeblastdb"):
+		dbstatus=os.system(makedbcommand)
 	blastcommand = "blastn -query " + fastafilename + " -db  " + blastdb + " -task blastn-short -outfmt 6 -out " + blastoutput + " -num_threads " + str(nproc)
 	if mincoverage >=400:
 		blastcommand = "blastn -query " + fastafilename + " -db " + blastdb + " -outfmt 6 -out " + blastoutput + " -num_threads " + str(nproc)
 	print(blastcommand)
-	os.system(blastcommand)
-	if not os.path.exists(blastoutput):
+	with profiling.Stage("blastn",sequences=len(seqrecords)):
+		status=os.system(blastcommand)
+	#the output of a failed run is incomplete, so it is not used
+	if dbstatus!=0 or status!=0 or not os.path.exists(blastoutput):
+		os.system("rm -f " + blastoutput + " " + blastdb + "*")
 		print("Cannot compare the sequences of " + fastafilename + " using Blast...")
 		logfile=open(GetWorkingBase((os.path.basename(args.input))) + ".predict.log","w")
 		logfile.write("Cannot compare the sequences of " + fastafilename + " using Blast...")
@@ -200,120 +213,235 @@ def ComputeSim(fastafilename,seqrecords,mincoverage):
 		logfile.write("No output for the BLAST command: " + blastcommand + "\n")
 		logfile.write("Please rerun prediction for " + os.path.basename(fastafilename) + ".")
 		logfile.close()
-		return {}
+		return None
 	print("Reading Blast results of " + fastafilename + "...")
-	simmatrix={}
-	for seqid1 in seqrecords.keys():
-		simmatrix.setdefault(seqid1,{})
-		for seqid2 in seqrecords.keys():
-			if seqid1==seqid2:
-				simmatrix[seqid1][seqid2]=1
-			elif len(seqrecords.keys()) < args.maxSimMatrixSize: #load full matrix	
-				simmatrix[seqid1][seqid2]=0
-	#read blast output
-	blastoutputfile = open(blastoutput)
-	score=0
-	for line in blastoutputfile:
-		if line.rstrip()=="":
-			continue
-		words = line.split("\t")
-		i = words[0].rstrip()
-		j = words[1].rstrip()
-		pos1 = int(words[6])
-		pos2 = int(words[7])
-		iden = float(words[2]) 
-		sim=float(iden)/100
-		coverage=abs(pos2-pos1)
-		score=sim
-		if coverage < mincoverage:
-			score=float(score * coverage)/mincoverage
-		if len(seqrecords.keys()) < args.maxSimMatrixSize: #the full sim matrix has been loaded 
-			if simmatrix[i][j] < score:
-				simmatrix[i][j]=round(score,4)
-				simmatrix[j][i]=round(score,4)
-		else:		
-			if j in simmatrix[i].keys():
-				if simmatrix[i][j] < score:
-					simmatrix[i][j]=round(score,4)
-					simmatrix[j][i]=round(score,4)
-			else:
-				simmatrix[i][j]=round(score,4)
-				simmatrix[j][i]=round(score,4)	
-		#simmatrix[j][i]=score
+	hits=ReadBlastOutput(blastoutput)
+	if blastcache!=None:
+		blastcache.Save(seqrecords.values(),None,task,hits)
+	simmatrix=LoadSimFromBlastHits(hits,seqrecords.keys(),mincoverage)
 	os.system("rm " + blastoutput)
 	os.system("rm " + blastdb + "*")
 	#os.system("rm " + blastdb + ".*")
 	return simmatrix
 
-def ComputeVariation(reffilename,mincoverage,simmatrix):
-	#load sequeces from the fasta files
-	records = SeqIO.to_dict(SeqIO.parse(reffilename, "fasta"))
-	keys=list(records.keys())
-	scorelist=[]
-	check=False
-	if simmatrix!={}:
-		check=True
-		for i in range(0,len(keys)-2):
-			if not keys[i] in simmatrix.keys():
-				check==False
-				break
-			for j in range(i+1,len(keys)-1):
-				if i!=j:
-					if not keys[j] in simmatrix[keys[i]].keys():
-						check==False
-						break
-					scorelist.append(simmatrix[keys[i]][keys[j]])	
-	if check==False:
-		scorematrix=ComputeSim(reffilename,records,mincoverage)
-		for i in range(0,len(keys)-2):
-			for j in range(i+1,len(keys)-1):
-				if i!=j:
-					scorelist.append(scorematrix[keys[i]][keys[j]])	
-	threshold=1
-	minthreshold=1		
-	if len(scorelist) >0:
-		x=np.array(scorelist)
-		minthreshold=round(float(np.min(x)),4)
-		threshold=round(float(np.median(x)),4)
-	return threshold,minthreshold
+def LoadEdges(simmatrix,simindices):
+	#the pairs of the indexed sequences with a score in the similarity matrix, as their indices with the scores
+	positions=np.full(len(simmatrix),-1,dtype=np.int64)
+	present=simindices>=0
+	positions[simindices[present]]=np.flatnonzero(present)
+	rows,cols,scores=simmatrix.Edges()
+	rows=positions[rows]
+	cols=positions[cols]
+	kept=(rows>=0) & (cols>=0)
+	return rows[kept],cols[kept],scores[kept]
 
-def ComputeVariations(variationfilename,classes,mincoverage,simmatrix):
-	#create json dict
-	variations={}
-	i=0
-	for taxonname in classes.keys():
-		threshold=0
-		minthreshold=0
-		sequences=classes[taxonname]
-		if len(sequences) >0:
-			if maxSeqNo==0 or (len(sequences) < maxSeqNo):
-				fastafilename=taxonname.replace(" ","_") + ".fasta"
-				SeqIO.write(sequences,fastafilename,"fasta")
-				threshold,minthreshold=ComputeVariation(fastafilename,mincoverage,simmatrix)
-				os.system("rm " + fastafilename)
-			else:
-				threshold,minthreshold=EvaluateVariation(taxonname,sequences,mincoverage)
-			currentvariation=[threshold,minthreshold,len(sequences)]
-			variations[taxonname]=currentvariation
-		i=i+1	
-	#write to file
-	with open(variationfilename,"w") as json_file:
-		if sys.version_info[0] >= 3:
-			json.dump(variations,json_file,indent=2)	
-		else:
-			json.dump(variations,json_file,encoding='latin1',indent=2)	
+def GetMedian(GetScore,pairnumber):
+	#the median of the scores given by their positions in increasing order
+	if pairnumber % 2==1:
+		median=GetScore(int(pairnumber/2))
+	else:
+		median=(GetScore(int(pairnumber/2)-1) + GetScore(int(pairnumber/2)))/2
+	return round(float(median),4)
+
+def ComputeCladeVariations(edges,labels,cladenumber):
+	#the median and minimum scores of the pairs of sequences within each clade, in one grouped reduction over the edges.
+	#labels are the clades of the sequences (-1 if none). The pairs without a score count as 0, and a clade without
+	#any pair gets 1 and 1.
+	rows,cols,scores=edges
+	cladelabels=labels[rows]
+	same=(cladelabels>=0) & (cladelabels==labels[cols])
+	cladelabels=cladelabels[same]
+	scores=scores[same]
+	order=np.lexsort((scores,cladelabels))
+	scores=scores[order].tolist()
+	sizes=np.bincount(labels[labels>=0],minlength=cladenumber).tolist()
+	scorenumbers=np.bincount(cladelabels,minlength=cladenumber).tolist()
+	variations=[]
+	start=0
+	for k in range(cladenumber):
+		pairnumber=int(sizes[k]*(sizes[k]-1)/2)
+		zeronumber=pairnumber - scorenumbers[k]
+		if pairnumber==0:
+			variations.append([1,1])
+			continue
+		#the scores of the clade in increasing order are zeronumber zeros followed by scores[start:start+scorenumbers[k]]
+		def GetScore(position):
+			if position < zeronumber:
+				return 0.0
+			return round(scores[start + position - zeronumber],4)
+		variations.append([GetMedian(GetScore,pairnumber),GetScore(0)])
+		start=start + scorenumbers[k]
 	return variations
 
-def EvaluateVariation(taxonname,sequences,mincoverage,simmatrix):
-	selectedindexes=random.sample(range(0, len(sequences)), k=maxSeqNo)
-	selectedsequences=[]
-	for index in selectedindexes:
-		selectedsequences.append(sequences[index])
-	fastafilename=taxonname.replace(" ","_") + ".fasta"
-	SeqIO.write(selectedsequences,fastafilename,"fasta")
-	threshold,minthreshold=ComputeVariation(fastafilename,mincoverage,simmatrix)
-	return threshold,minthreshold
-		
+def GetSketchedVariation(sketch,seqno):
+	#the median and minimum scores of the pairs of sequences of a clade from the sketch of its scores, the pairs without
+	#a score counting as 0. The minimum is exact.
+	pairnumber=int(seqno*(seqno-1)/2)
+	zeronumber=pairnumber - len(sketch)
+	def GetScore(position):
+		if position < zeronumber:
+			return 0.0
+		return round(sketch.GetScore(position - zeronumber),4)
+	minthreshold=0.0
+	if zeronumber==0:
+		minthreshold=round(sketch.minimum,4)
+	return [GetMedian(GetScore,pairnumber),minthreshold]
+
+def ComputeSketchedVariations(edges,rankclades):
+	#the variations of the sketched clades of the ranks, given from the lowest rank up as (labels,sketched,seqnos), in one
+	#pass over the edges. The score of an edge is fed to the sketch of the lowest clade with both of its sequences, and the
+	#sketch of a clade is merged into the clade of the next rank with all of its sequences. The edges of a clade without
+	#such a parent clade are fed again at the next rank.
+	rows,cols,scores=edges
+	#the parent clades of the clades, and the clades whose sketches are needed, from the highest rank down
+	parents=[None]*len(rankclades)
+	needed=[None]*len(rankclades)
+	for t in range(len(rankclades)-1,-1,-1):
+		labels,sketched,seqnos=rankclades[t]
+		needed[t]=sketched.copy()
+		if t==len(rankclades)-1:
+			continue
+		parentlabels=rankclades[t+1][0]
+		present=labels>=0
+		lowest=np.full(len(sketched),np.iinfo(np.int64).max,dtype=np.int64)
+		highest=np.full(len(sketched),-1,dtype=np.int64)
+		np.minimum.at(lowest,labels[present],parentlabels[present])
+		np.maximum.at(highest,labels[present],parentlabels[present])
+		parents[t]=np.where((lowest==highest) & (lowest>=0),highest,-1)
+		hasparent=parents[t]>=0
+		needed[t][hasparent]=needed[t][hasparent] | needed[t+1][parents[t][hasparent]]
+	rankvariations=[]
+	carried=np.zeros(len(rows),dtype=bool)
+	childsketches={}
+	for t in range(len(rankclades)):
+		labels,sketched,seqnos=rankclades[t]
+		edgelabels=labels[rows]
+		same=(edgelabels>=0) & (edgelabels==labels[cols])
+		same=same & needed[t][np.maximum(edgelabels,0)]
+		#the edges not yet in the sketches of the clades of the rank below, grouped by clade
+		fed=np.flatnonzero(same & ~carried)
+		fed=fed[np.argsort(edgelabels[fed],kind="stable")]
+		fedlabels=edgelabels[fed]
+		neededclades=np.flatnonzero(needed[t])
+		starts=np.searchsorted(fedlabels,neededclades,side="left").tolist()
+		ends=np.searchsorted(fedlabels,neededclades,side="right").tolist()
+		sketches={}
+		i=0
+		for k in neededclades.tolist():
+			#the sketches of the clades draw different random starts
+			sketch=QuantileSketch(sketchsize,seed=[t,k])
+			sketch.Update(scores[fed[starts[i]:ends[i]]])
+			sketches[k]=sketch
+			i=i+1
+		for k in childsketches.keys():
+			parent=int(parents[t-1][k])
+			if parent in sketches.keys():
+				sketches[parent].Merge(childsketches[k])
+		variations={}
+		for k in np.flatnonzero(sketched).tolist():
+			variations[k]=GetSketchedVariation(sketches[k],int(seqnos[k]))
+		rankvariations.append(variations)
+		if t < len(rankclades)-1:
+			carried=same & (parents[t][np.maximum(edgelabels,0)]>=0)
+		childsketches=sketches
+	return rankvariations
+
+def ComputeVariations(seqrecords,taxonomyindex,ranks,mincoverage,simmatrix):
+	#the variations of the clades of all the ranks, as {rank:{taxonname:[median,min,seqno]}}. The scores of a clade are
+	#taken from the similarity matrix if it has all the sequences of the clade, and else from one BLAST of the
+	#sequences of all such clades. The medians of the clades with more than maxSeqNo sequences in the similarity matrix
+	#are estimated with quantile sketches, and the other clades with more than maxSeqNo sequences are sampled.
+	simindices=np.full(len(taxonomyindex),-1,dtype=np.int64)
+	if simmatrix!=None:
+		simindices=simmatrix.GetIndices(taxonomyindex.seqids)
+	clades={}
+	uncovered=np.zeros(len(taxonomyindex),dtype=bool)
+	for rank in ranks:
+		codes,offsets,members=taxonomyindex.Clades(rank)
+		labels=np.full(len(taxonomyindex),-1,dtype=np.int64)
+		labels[members]=np.repeat(np.arange(len(codes),dtype=np.int64),np.diff(offsets))
+		seqnos=np.diff(offsets)
+		#the clades with sequences missing from the similarity matrix
+		notcovered=np.bincount(labels[(labels>=0) & (simindices<0)],minlength=len(codes)) > 0
+		sketched=np.zeros(len(codes),dtype=bool)
+		if maxSeqNo > 0:
+			sketched=(seqnos > maxSeqNo) & ~notcovered
+			#a random selection of maxSeqNo sequences of the other large clades
+			for k in np.flatnonzero((seqnos > maxSeqNo) & notcovered).tolist():
+				seqno=int(seqnos[k])
+				selected=np.zeros(seqno,dtype=bool)
+				selected[random.sample(range(0, seqno), k=maxSeqNo)]=True
+				labels[members[offsets[k]:offsets[k+1]][~selected]]=-1
+			notcovered=np.bincount(labels[(labels>=0) & (simindices<0)],minlength=len(codes)) > 0
+		uncovered[(labels>=0) & notcovered[np.maximum(labels,0)]]=True
+		clades[rank]=(codes,offsets,labels,notcovered,sketched)
+	blastmatrix=None
+	blastindices=np.full(len(taxonomyindex),-1,dtype=np.int64)
+	if uncovered.any():
+		records={}
+		for seqid in taxonomyindex.GetSeqIds(np.flatnonzero(uncovered)):
+			records[seqid]=seqrecords[seqid]
+		fastafilename=GetWorkingBase(prefix) + ".variation.fasta"
+		SeqIO.write(records.values(),fastafilename,"fasta")
+		blastmatrix=ComputeSim(fastafilename,records,mincoverage)
+		os.system("rm " + fastafilename)
+		#the variations of the clades without scores are not saved, as the variation files are reused in the next runs
+		if blastmatrix==None:
+			print("The variations are not computed as the sequences of the clades not in the similarity matrix cannot be compared. See " + GetWorkingBase((os.path.basename(args.input))) + ".predict.log.")
+			sys.exit(1)
+		blastindices=blastmatrix.GetIndices(taxonomyindex.seqids)
+	edges=None
+	if simmatrix!=None:
+		edges=LoadEdges(simmatrix,simindices)
+	blastedges=None
+	if blastmatrix!=None:
+		blastedges=LoadEdges(blastmatrix,blastindices)
+	#the sketched clades of all the ranks, from the lowest rank up
+	sketchedvariations={}
+	sketchedcladenumber=0
+	for rank in ranks:
+		sketchedcladenumber=sketchedcladenumber + int(clades[rank][4].sum())
+	if sketchedcladenumber > 0:
+		with profiling.Stage("sketching",clades=sketchedcladenumber):
+			levels=["species","genus","family","order","class","phylum","kingdom"]
+			sortedranks=[rank for rank in levels if rank in ranks] + [rank for rank in ranks if not (rank in levels)]
+			rankclades=[]
+			for rank in sortedranks:
+				codes,offsets,labels,notcovered,sketched=clades[rank]
+				rankclades.append((labels,sketched,np.diff(offsets)))
+			rankvariations=ComputeSketchedVariations(edges,rankclades)
+			i=0
+			for rank in sortedranks:
+				sketchedvariations[rank]=rankvariations[i]
+				i=i+1
+	allvariations={}
+	for rank in ranks:
+		codes,offsets,labels,notcovered,sketched=clades[rank]
+		cladevariations=[[1,1]]*len(codes)
+		for k in sketchedvariations.get(rank,{}).keys():
+			cladevariations[k]=sketchedvariations[rank][k]
+		for cladeedges,cladeflags in [[edges,~notcovered & ~sketched],[blastedges,notcovered]]:
+			if cladeedges==None or not cladeflags.any():
+				continue
+			cladelabels=np.where((labels>=0) & cladeflags[np.maximum(labels,0)],labels,-1)
+			computedvariations=ComputeCladeVariations(cladeedges,cladelabels,len(codes))
+			for k in np.flatnonzero(cladeflags).tolist():
+				cladevariations[k]=computedvariations[k]
+		variations={}
+		names=taxonomyindex.names[rank]
+		for k in range(len(codes)):
+			variations[names[codes[k]]]=cladevariations[k] + [int(offsets[k+1]-offsets[k])]
+		allvariations[rank]=variations
+	return allvariations
+
+def SaveVariation(variationfilename,variations):
+	with profiling.Stage("output writing"):
+		with open(variationfilename,"w") as json_file:
+			if sys.version_info[0] >= 3:
+				json.dump(variations,json_file,indent=2)	
+			else:
+				json.dump(variations,json_file,encoding='latin1',indent=2)	
+
 def IndexSequences(filename):
 	indexedfilename = GetBase(filename) + ".indexed.fasta"
 	fastafile = open(filename)
@@ -340,6 +468,8 @@ def SaveVariationInTabFormat(output,variation):
 	outputfile.close()
 	
 def Plot(datasetname,figoutput,variations,rank,displayed):
+	import matplotlib.pyplot as plt
+	plt.rc('font',size=6)
 	#sort variations based on median thresholds with decreasing order
 	sorted_variations = sorted(variations.items(), key=lambda x: x[1][0], reverse=True)
 	thresholds=[]
@@ -374,6 +504,8 @@ def Plot(datasetname,figoutput,variations,rank,displayed):
 			plt.show()
 
 def PlotAll(datasetname,figoutput,variationlist,labels):
+	import matplotlib.pyplot as plt
+	plt.rc('font',size=6)
 	data=[]
 	for variations in variationlist:
 		sorted_variations = sorted(variations.items(), key=lambda x: x[1][0], reverse=True)
@@ -409,6 +541,9 @@ def PlotAll(datasetname,figoutput,variationlist,labels):
 		plt.show()
 	
 def BoxPlot(datasetname,figoutput,variations,rank,displayed):
+	import matplotlib.pyplot as plt
+	plt.rc('font',size=6)
+	from matplotlib.patches import Polygon
 	#sort variations based on median thresholds with decreasing order
 	sorted_variations = sorted(variations.items(), key=lambda x: x[1][0], reverse=True)
 	thresholds=[]
@@ -483,6 +618,9 @@ def BoxPlot(datasetname,figoutput,variations,rank,displayed):
 			plt.show()
 		
 def BoxPlotAll(datasetname,figoutput,variationlist,labels):
+	import matplotlib.pyplot as plt
+	plt.rc('font',size=6)
+	from matplotlib.patches import Polygon
 	data=[]
 	labels2=[]
 	colors=[]
@@ -588,65 +726,78 @@ def GetPositionList(classificationfilename,ranklist):
 ##############################################################################
 # MAIN
 ##############################################################################
-path=sys.argv[0]
-path=path[:-(len(path)-path.rindex("/")-1)]
+def main(argv=None):
+	global prefix,label,jsonvariationfilename
+	ParseArguments(argv)
+	path=sys.argv[0]
+	path=path[:-(len(path)-path.rindex("/")-1)]
 
-if prefix=="":
-	prefix=GetBase(os.path.basename(referencename))
+	if prefix=="":
+		prefix=GetBase(os.path.basename(referencename))
 
-#load similarity matrix
-simmatrix={}	
-if os.path.exists(simfilename):
-	print("Loading similarity matrix " + simfilename)
-	simmatrix=LoadSim(simfilename)	
-#load reference seq records
-referencerecords =  SeqIO.to_dict(SeqIO.parse(referencename, "fasta"))
-variationlist=[]
-labels=[]
-i=0
-jsonvariationfilename=""
-figoutput=""
-ranklist=[]	
-if "," in args.classificationranks:
-	ranklist=args.classificationranks.split(",")
-elif args.classificationranks !="":
-	ranklist.append(args.classificationranks)
-for rank in ranklist:
-	rank=rank.lower()
-	jsonvariationfilename = GetWorkingBase(prefix) + "." + rank + ".variation"
-	figoutput=GetBase(jsonvariationfilename) + ".variation.png" 
-	#Load classes, classification:
-	classes={}
-	if classificationfilename !="":
-		seqidpos,positionlist,isError=GetPositionList(classificationfilename,ranklist)	
-		if isError==True :
-			sys.exit()
-		classificationposition=positionlist[i]
-		classes=LoadClassification(referencerecords,classificationfilename, classificationposition,seqidpos)
-	else:
-		classes=LoadClassificationFromDescription(referencerecords,rank)
-	variations={}
-	if not os.path.exists(jsonvariationfilename):
-		variations=ComputeVariations(jsonvariationfilename,classes,mincoverage,simmatrix)
-	else:
-		print("The variation file " + jsonvariationfilename + " exists. Please delete the file if you wish to recalculate the variation.")
-		with open(jsonvariationfilename) as variation_file:
-			variations = json.load(variation_file)
-		SaveVariationInTabFormat(jsonvariationfilename + ".txt",variations)
-		print("The variations are saved in the json file  " + jsonvariationfilename + " and tab file " + jsonvariationfilename + ".txt. The figure is saved in " + figoutput + "."  )
-	variationlist.append(variations)
-	labels.append(rank)	
-	i=i+1	
-if label=="":
-	label=prefix	
-if len(ranklist)>1:
-	jsonvariationfilename = GetWorkingBase(prefix) + ".variation"
-	figoutput=jsonvariationfilename + ".png" 
-if plottype=="plot":
-	PlotAll(label,figoutput,variationlist,labels)
-else:	
-	BoxPlotAll(label,figoutput,variationlist,labels)
-print("All variations and their figures are saved in file " + jsonvariationfilename + " and " + figoutput + ".")
+	#load similarity matrix
+	simmatrix=None
+	if os.path.exists(simfilename):
+		print("Loading similarity matrix " + simfilename)
+		simmatrix=LoadSim(simfilename)	
+	#load reference seq records
+	with profiling.Stage("fasta load") as stage:
+		referencerecords =  SeqIO.to_dict(SeqIO.parse(referencename, "fasta"))
+		stage.Count(sequences=len(referencerecords))
+	variationlist=[]
+	labels=[]
+	jsonvariationfilename=""
+	figoutput=""
+	ranklist=[]	
+	if "," in args.classificationranks:
+		ranklist=args.classificationranks.split(",")
+	elif args.classificationranks !="":
+		ranklist.append(args.classificationranks)
+	#Load the classification at all the ranks:
+	with profiling.Stage("classification load") as stage:
+		taxonomyindex=LoadTaxonomyIndex(referencerecords,ranklist)
+		for rank in ranklist:
+			stage.Count(clades=len(taxonomyindex.names[rank.lower()]))
+	#compute the variations of all the ranks without a variation file in one pass
+	newranks=[]
+	for rank in ranklist:
+		rank=rank.lower()
+		if not os.path.exists(GetWorkingBase(prefix) + "." + rank + ".variation"):
+			newranks.append(rank)
+	allvariations={}
+	if len(newranks) > 0:
+		with profiling.Stage("variation") as stage:
+			for rank in newranks:
+				stage.Count(clades=len(taxonomyindex.names[rank]))
+			allvariations=ComputeVariations(referencerecords,taxonomyindex,newranks,mincoverage,simmatrix)
+	for rank in ranklist:
+		rank=rank.lower()
+		jsonvariationfilename = GetWorkingBase(prefix) + "." + rank + ".variation"
+		figoutput=GetBase(jsonvariationfilename) + ".variation.png" 
+		variations={}
+		if rank in allvariations.keys():
+			variations=allvariations[rank]
+			SaveVariation(jsonvariationfilename,variations)
+		else:
+			print("The variation file " + jsonvariationfilename + " exists. Please delete the file if you wish to recalculate the variation.")
+			with open(jsonvariationfilename) as variation_file:
+				variations = json.load(variation_file)
+			SaveVariationInTabFormat(jsonvariationfilename + ".txt",variations)
+			print("The variations are saved in the json file  " + jsonvariationfilename + " and tab file " + jsonvariationfilename + ".txt. The figure is saved in " + figoutput + "."  )
+		variationlist.append(variations)
+		labels.append(rank)	
+	if label=="":
+		label=prefix	
+	if len(ranklist)>1:
+		jsonvariationfilename = GetWorkingBase(prefix) + ".variation"
+		figoutput=jsonvariationfilename + ".png" 
+	with profiling.Stage("plotting"):
+		if plottype=="plot":
+			PlotAll(label,figoutput,variationlist,labels)
+		else:	
+			BoxPlotAll(label,figoutput,variationlist,labels)
+	print("All variations and their figures are saved in file " + jsonvariationfilename + " and " + figoutput + ".")
 			
 
-
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# FILE: convertSim.py
+# CREATE DATE: 18 oct 2026
+import os
+import sys, argparse
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.simmatrix import LoadSim,SaveSim,SaveBinarySim,IsBinarySim
+
+parser=argparse.ArgumentParser(prog='convertSim.py',
+							   usage="%(prog)s [options] -i simfile -f format -o output",
+							   description='''Script that converts a similarity matrix file between the text format of "id id score" lines and the binary format that is memory-mapped when loaded.''',
+							   epilog="""Written by Duong Vu duong.t.vu@gmail.com""",
+   )
+
+parser.add_argument('-i','--input', required=True, help='the similarity matrix file, in the text or binary format.')
+parser.add_argument('-f','--format', default="binary", help='The format of the output: binary or text.')
+parser.add_argument('-st','--scoretype', default="float32", help='The type of the scores in the binary format: float32 or float16. float16 files are smaller but the scores are rounded to about 3 decimals.')
+parser.add_argument('-ms','--minsim', type=float, default=0, help='The minimum similarity score that will be saved for the output.')
+parser.add_argument('-o','--out',default="dnabarcoder", help='The output folder.')
+
+def ParseArguments(argv=None):
+	global args,simfilename,outputpath
+	args=parser.parse_args(argv)
+	simfilename=args.input
+	outputpath=args.out
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
+
+def GetWorkingBase(filename):
+	basename=os.path.basename(filename)
+	basename=basename[:-(len(basename)-basename.rindex("."))]
+	path=outputpath + "/" + basename
+	return path
+
+def main(argv=None):
+	ParseArguments(argv)
+	if args.format!="binary" and args.format!="text":
+		print("The format must be binary or text.")
+		sys.exit()
+	if args.scoretype!="float32" and args.scoretype!="float16":
+		print("The score type must be float32 or float16.")
+		sys.exit()
+	output=GetWorkingBase(simfilename) + "." + args.format + ".sim"
+	if IsBinarySim(simfilename):
+		print("Loading the binary similarity matrix " + simfilename + "..")
+	else:
+		print("Loading the similarity matrix " + simfilename + "..")
+	simmatrix=LoadSim(simfilename)
+	if args.format=="binary":
+		SaveBinarySim(simmatrix,output,args.minsim,args.scoretype)
+	else:
+		SaveSim(simmatrix,output,args.minsim)
+	print("The similarity file is saved in " + output + ".")
+
+if __name__ == "__main__":
+	main()
@@ -3,9 +3,11 @@
 # AUTHOR: Duong Vu
 # CREATE DATE: 07 June 2020
 
-#import sys
+import sys
 import os, argparse
 from Bio import SeqIO
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import profiling
 
 parser=argparse.ArgumentParser(prog='overview.py',  
 							   usage="%(prog)s [options] -i fastafile -c classificationfilename -out outputname",
@@ -19,13 +21,14 @@ parser.add_argument('-o','--out', default="dnabarcoder", help='The output folder
 parser.add_argument('-idcolumnname','--idcolumnname',default="ID", help='the column name of sequence id in the classification file.')
 parser.add_argument('-rank','--classificationranks', default="species,genus,family,order,class,phylum", help='the classification ranks to compute distribution, separated by ",".')
 
-args=parser.parse_args()
-fastafilename= args.input
-classificationfilename= args.classification
-outputpath=args.out
-
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)
+def ParseArguments(argv=None):
+	global args,fastafilename,classificationfilename,outputpath
+	args=parser.parse_args(argv)
+	fastafilename= args.input
+	classificationfilename= args.classification
+	outputpath=args.out
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
 
 def GetWorkingBase(filename):
 	basename=os.path.basename(filename)
@@ -183,65 +186,74 @@ def SaveOverview(rank,taxa,outputname):
 	outfile.close()
 
 ######MAIN################################################################
-ranklist=[]
-if "," in args.classificationranks:
-	ranklist=args.classificationranks.split(",")
-else:
-	ranklist=[args.classificationranks]	
+def main(argv=None):
+	ParseArguments(argv)
+	ranklist=[]
+	if "," in args.classificationranks:
+		ranklist=args.classificationranks.split(",")
+	else:
+		ranklist=[args.classificationranks]	
     
-outputfilename=""
-seqids=[]
-if fastafilename != "":
-	seqrecords = SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
-	seqids=seqrecords.keys()
-	outputfilename=GetWorkingBase(fastafilename) + ".overview"	
-else:
-	outputfilename=GetWorkingBase(classificationfilename) + ".overview"	
-classificationdict={}
-if classificationfilename!="":
-	classificationdict=LoadClassification(classificationfilename)	
-else:
-	classificationdict=LoadClassificationFromDescription(seqrecords)	
-outputfile=open(outputfilename,"w")
-count=0
-if len(seqids) >0 and fastafilename != "":
-	count=len(seqids)
-else:
-	seqids=list(classificationdict.keys())
-	count=len(list(classificationdict.keys()))
-outputfile.write("Number of sequences: " + str(count) + "\n")    
-outputfile.write("Taxonomic level\tNumber of taxa\tNumber of sequences\n")
-seqnumber,seqnumber,count,species=ReportAtLevel(seqids,-1,6,classificationdict)
-SaveOverview("sequence",species,outputfilename + ".species")
-print("The overview at the species level is saved in  file " + outputfilename + ".species")
-if "species" in ranklist:
-    speciesnumber,speciesseqnumber,count,genera=ReportAtLevel(seqids,6,5,classificationdict)
-    outputfile.write("Species" + "\t" + str(speciesnumber) + "\t" + str(speciesseqnumber) + "\n")
-    SaveOverview("species",genera,outputfilename + ".genus")
-    print("The overview at the genus level is saved in  file " + outputfilename + ".genus")
-if "genus" in ranklist:
-    genusnumber,genusseqnumber,count,families=ReportAtLevel(seqids,5,4,classificationdict)
-    outputfile.write("Genus" + "\t" + str(genusnumber) + "\t" + str(genusseqnumber) + "\n")
-    SaveOverview("genus",families,outputfilename + ".family")
-    print("The overview at the family level is saved in  file " + outputfilename + ".family")
-if "family" in ranklist:    
-    familynumber,familyseqnumber,count,orders=ReportAtLevel(seqids,4,3,classificationdict)
-    outputfile.write("Family" + "\t" + str(familynumber) + "\t" + str(familyseqnumber) + "\n")
-    print("The overview at the order level is saved in  file " + outputfilename + ".order")
-if "order" in ranklist:
-    ordernumber,orderseqnumber,count,classes=ReportAtLevel(seqids,3,2,classificationdict)
-    outputfile.write("Order" + "\t" + str(ordernumber) + "\t" + str(orderseqnumber) + "\n")
-    SaveOverview("family",orders,outputfilename + ".order")
-    print("The overview at the order level is saved in  file " + outputfilename + ".order")
-if "class" in ranklist:    
-    classnumber,classseqnumber,count,phyla=ReportAtLevel(seqids,2,1,classificationdict)
-    outputfile.write("Class" + "\t" + str(classnumber) + "\t" + str(classseqnumber) + "\n")
-    SaveOverview("order",classes,outputfilename + ".class")
-    print("The overview at the class level is saved in  file " + outputfilename + ".class")
-if "phylum" in ranklist:
-    phylumnumber,phylumseqnumber,count,kingdoms=ReportAtLevel(seqids,1,0,classificationdict)
-    outputfile.write("Phylum" + "\t" + str(phylumnumber) + "\t" + str(phylumseqnumber) + "\n")
-    SaveOverview("class",phyla,outputfilename + ".phylum")
-    print("The overview at the phylum level is saved in  file " + outputfilename + ".phylum")
-outputfile.close()
-print("The overview is saved in  file " + outputfilename + ".")
+	outputfilename=""
+	seqids=[]
+	if fastafilename != "":
+		with profiling.Stage("fasta load") as stage:
+			seqrecords = SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
+			stage.Count(sequences=len(seqrecords))
+		seqids=seqrecords.keys()
+		outputfilename=GetWorkingBase(fastafilename) + ".overview"	
+	else:
+		outputfilename=GetWorkingBase(classificationfilename) + ".overview"	
+	classificationdict={}
+	with profiling.Stage("classification load") as stage:
+		if classificationfilename!="":
+			classificationdict=LoadClassification(classificationfilename)	
+		else:
+			classificationdict=LoadClassificationFromDescription(seqrecords)	
+		stage.Count(sequences=len(classificationdict))
+	outputfile=open(outputfilename,"w")
+	count=0
+	if len(seqids) >0 and fastafilename != "":
+		count=len(seqids)
+	else:
+		seqids=list(classificationdict.keys())
+		count=len(list(classificationdict.keys()))
+	outputfile.write("Number of sequences: " + str(count) + "\n")    
+	outputfile.write("Taxonomic level\tNumber of taxa\tNumber of sequences\n")
+	seqnumber,seqnumber,count,species=ReportAtLevel(seqids,-1,6,classificationdict)
+	SaveOverview("sequence",species,outputfilename + ".species")
+	print("The overview at the species level is saved in  file " + outputfilename + ".species")
+	if "species" in ranklist:
+	    speciesnumber,speciesseqnumber,count,genera=ReportAtLevel(seqids,6,5,classificationdict)
+	    outputfile.write("Species" + "\t" + str(speciesnumber) + "\t" + str(speciesseqnumber) + "\n")
+	    SaveOverview("species",genera,outputfilename + ".genus")
+	    print("The overview at the genus level is saved in  file " + outputfilename + ".genus")
+	if "genus" in ranklist:
+	    genusnumber,genusseqnumber,count,families=ReportAtLevel(seqids,5,4,classificationdict)
+	    outputfile.write("Genus" + "\t" + str(genusnumber) + "\t" + str(genusseqnumber) + "\n")
+	    SaveOverview("genus",families,outputfilename + ".family")
+	    print("The overview at the family level is saved in  file " + outputfilename + ".family")
+	if "family" in ranklist:    
+	    familynumber,familyseqnumber,count,orders=ReportAtLevel(seqids,4,3,classificationdict)
+	    outputfile.write("Family" + "\t" + str(familynumber) + "\t" + str(familyseqnumber) + "\n")
+	    print("The overview at the order level is saved in  file " + outputfilename + ".order")
+	if "order" in ranklist:
+	    ordernumber,orderseqnumber,count,classes=ReportAtLevel(seqids,3,2,classificationdict)
+	    outputfile.write("Order" + "\t" + str(ordernumber) + "\t" + str(orderseqnumber) + "\n")
+	    SaveOverview("family",orders,outputfilename + ".order")
+	    print("The overview at the order level is saved in  file " + outputfilename + ".order")
+	if "class" in ranklist:    
+	    classnumber,classseqnumber,count,phyla=ReportAtLevel(seqids,2,1,classificationdict)
+	    outputfile.write("Class" + "\t" + str(classnumber) + "\t" + str(classseqnumber) + "\n")
+	    SaveOverview("order",classes,outputfilename + ".class")
+	    print("The overview at the class level is saved in  file " + outputfilename + ".class")
+	if "phylum" in ranklist:
+	    phylumnumber,phylumseqnumber,count,kingdoms=ReportAtLevel(seqids,1,0,classificationdict)
+	    outputfile.write("Phylum" + "\t" + str(phylumnumber) + "\t" + str(phylumseqnumber) + "\n")
+	    SaveOverview("class",phyla,outputfilename + ".phylum")
+	    print("The overview at the phylum level is saved in  file " + outputfilename + ".phylum")
+	outputfile.close()
+	print("The overview is saved in  file " + outputfilename + ".")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# FILE: clustering.py
+# CREATE DATE: 18 oct 2026
+#Benchmark of the connected components used for single-linkage clustering. The components are computed in a thread
+#with a small C stack. The chain graph has one component as deep as the number of sequences,
+#and its peak memory per sequence stays the same for all the numbers of sequences.
+import os
+import sys, argparse
+import threading
+import time
+import tracemalloc
+import json
+import numpy as np
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.clustering import ConnectedComponents
+
+parser=argparse.ArgumentParser(prog='clustering.py',
+							   usage="%(prog)s [options] -n sequencenumber",
+							   description='''Benchmark of the connected components of single-linkage clustering for a chain, a star and a random graph.''',
+							   epilog="""Written by Duong Vu duong.t.vu@gmail.com""",
+   )
+parser.add_argument('-n','--sequencenumber', type=int, default=100000, help='The number of sequences of the largest graph.')
+parser.add_argument('-degree','--degree', type=int, default=10, help='The average number of neighbors of a sequence in the random graph.')
+parser.add_argument('-stacksize','--stacksize', type=int, default=256, help='The C stack size in KB of the thread computing the components.')
+parser.add_argument('-o','--out', default="", help='The json file to save the results.')
+
+def GetEdges(graph,n,degree):
+	if graph=="chain":
+		rows=np.arange(n-1)
+		cols=rows+1
+	elif graph=="star":
+		cols=np.arange(1,n)
+		rows=np.zeros(n-1,dtype=np.int64)
+	else:
+		rng=np.random.default_rng(1)
+		rows=rng.integers(0,n,int(n*degree/2))
+		cols=rng.integers(0,n,int(n*degree/2))
+	return rows,cols
+
+def GetGraph(graph,n,degree):
+	rows,cols=GetEdges(graph,n,degree)
+	allrows=np.concatenate((rows,cols))
+	allcols=np.concatenate((cols,rows))
+	order=np.lexsort((allcols,allrows))
+	indptr=np.zeros(n+1,dtype=np.int64)
+	np.cumsum(np.bincount(allrows,minlength=n),out=indptr[1:])
+	return indptr.tolist(),allcols[order].tolist()
+
+def RunComponents(indptr,indices,result):
+	tracemalloc.start()
+	start=time.perf_counter()
+	components=ConnectedComponents(indptr,indices)
+	result['time']=round(time.perf_counter()-start,4)
+	result['peak memory']=tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	result['component number']=len(components)
+	result['largest component']=max(len(component) for component in components)
+
+def Benchmark(graph,n,degree,stacksize):
+	indptr,indices=GetGraph(graph,n,degree)
+	result={'graph':graph,'sequence number':n,'edge number':int(len(indices)/2)}
+	threading.stack_size(stacksize*1024)
+	thread=threading.Thread(target=RunComponents,args=(indptr,indices,result))
+	thread.start()
+	thread.join()
+	result['peak memory per sequence']=round(float(result['peak memory'])/n,2)
+	return result
+
+if __name__ == "__main__":
+	args=parser.parse_args()
+	results=[]
+	print("Graph\tSequences\tEdges\tComponents\tLargest\tTime(s)\tPeak memory(bytes)\tPer sequence")
+	for n in [int(args.sequencenumber/10),int(args.sequencenumber/2),args.sequencenumber]:
+		for graph in ["chain","star","random"]:
+			result=Benchmark(graph,n,args.degree,args.stacksize)
+			results.append(result)
+			print(graph + "\t" + str(n) + "\t" + str(result['edge number']) + "\t" + str(result['component number']) + "\t" + str(result['largest component']) + "\t" + str(result['time']) + "\t" + str(result['peak memory']) + "\t" + str(result['peak memory per sequence']))
+	if args.out!="":
+		with open(args.out,"w") as json_file:
+			json.dump(results,json_file,indent=2)
+		print("The results are saved in file " + args.out + ".")
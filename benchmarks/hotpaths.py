@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# FILE: hotpaths.py
+# CREATE DATE: 18 oct 2026
+#Benchmark of the hot paths of the prediction and the classification on synthetic datasets (see synthetic.py) of the
+#given numbers of sequences. Each function is timed, then run again with tracemalloc for its peak memory. The results
+#are saved in a json file, which can be compared to the results of an earlier version to find the regressions.
+import os
+import sys, argparse
+import gc
+import json
+import time
+import platform
+import threading
+import subprocess
+import tracemalloc
+import contextlib
+import numpy as np
+from Bio import SeqIO
+path=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,path)
+sys.path.insert(0,os.path.join(path,"prediction"))
+sys.path.insert(0,os.path.join(path,"classification"))
+sys.path.insert(0,os.path.join(path,"benchmarks"))
+from lib.simmatrix import LoadSim,SaveSim,SaveBinarySim,LoadSimFromBlastOutput
+import predict
+import classify
+import clustering
+from synthetic import GenerateDataset
+
+FUNCTIONS=["LoadSimFromBlastOutput","SaveSim","LoadSim","LoadNeighbors","Cluster","ComputeFmeasure","GenerateDatasets","Predict","LoadTaxonomy","LoadBlastOutput","Assign","ConnectedComponents"]
+
+parser=argparse.ArgumentParser(prog='hotpaths.py',
+							   usage="%(prog)s [options] -n sequencenumbers -o resultfile",
+							   description='''Benchmark of the hot paths of dnabarcoder on synthetic datasets: ''' + ", ".join(FUNCTIONS) + ".",
+							   epilog="""Written by Duong Vu duong.t.vu@gmail.com""",
+   )
+parser.add_argument('-n','--sequencenumbers', default="1000,10000", help='The numbers of sequences of the synthetic datasets, separated by commas, from 1000 to 1000000.')
+parser.add_argument('-f','--functions', default="", help='The functions to benchmark, separated by commas. By default all of them.')
+parser.add_argument('-hits','--hitnumber', type=int, default=20, help='The number of BLAST hits of a sequence in the synthetic datasets.')
+parser.add_argument('-t','--threshold', type=float, default=0.97, help='The similarity threshold of LoadNeighbors, Cluster and ComputeFmeasure.')
+parser.add_argument('-st','--startingthreshold', type=float, default=0.9, help='The starting threshold of Predict.')
+parser.add_argument('-et','--endthreshold', type=float, default=1, help='The end threshold of Predict.')
+parser.add_argument('-s','--step', type=float, default=0.001, help='The step of the thresholds of Predict.')
+parser.add_argument('-ml','--minalignmentlength', type=int, default=50, help='The minimum alignment length of the BLAST hits.')
+parser.add_argument('-memory','--memory', default="yes", help='Measure the peak memory of the functions if yes.')
+parser.add_argument('-work','--work', default="synthetic", help='The folder of the synthetic datasets, which are kept for the next runs.')
+parser.add_argument('-o','--out', default="", help='The json file to save the results.')
+parser.add_argument('-compare','--compare', default="", help='The json file of earlier results to compare with.')
+parser.add_argument('-tolerance','--tolerance', type=float, default=0.25, help='The relative increase of the time or the peak memory of a function reported as a regression.')
+
+def GetCommit():
+	try:
+		return subprocess.run(["git","rev-parse","HEAD"],cwd=path,capture_output=True,text=True).stdout.strip()
+	except OSError:
+		return ""
+
+def Measure(results,name,function,n,measurememory,variant=""):
+	#run the function, timed and then with tracemalloc, and give its value of the timed run.
+	#The function gives its value and the number of items it has processed.
+	gc.collect()
+	result={"function":name,"sequence number":n,"variant":variant}
+	with open(os.devnull,"w") as devnull, contextlib.redirect_stdout(devnull):
+		start=time.perf_counter()
+		cpustart=time.process_time()
+		value,items=function()
+		result["time"]=round(time.perf_counter()-start,4)
+		result["cpu time"]=round(time.process_time()-cpustart,4)
+		result["items"]=items
+		if measurememory:
+			gc.collect()
+			tracemalloc.start()
+			function()
+			result["peak memory"]=tracemalloc.get_traced_memory()[1]
+			tracemalloc.stop()
+	results.append(result)
+	print(name + "\t" + str(n) + "\t" + variant + "\t" + str(items) + "\t" + str(result["time"]) + "\t" + str(result["cpu time"]) + "\t" + str(result.get("peak memory","")))
+	return value
+
+def Run(results,name,function,n,functions,measurememory,variant=""):
+	#the value of the function, which is benchmarked if it is one of the functions
+	if name in functions:
+		return Measure(results,name,function,n,measurememory,variant)
+	with open(os.devnull,"w") as devnull, contextlib.redirect_stdout(devnull):
+		value,items=function()
+	return value
+
+def PrepareDataset(workpath,n,hitno):
+	#the synthetic dataset of n sequences, generated if it does not exist with the same parameters
+	prefix=workpath + "/synthetic." + str(n)
+	paramfilename=prefix + ".params.json"
+	params={"sequence number":n,"hit number":hitno}
+	if os.path.exists(paramfilename):
+		with open(paramfilename) as json_file:
+			existingparams=json.load(json_file)
+		if existingparams["parameters"]==params:
+			return existingparams["files"]
+	print("Generating the synthetic dataset of " + str(n) + " sequences..")
+	filenames=GenerateDataset(prefix,n,hitno=hitno)
+	with open(paramfilename,"w") as json_file:
+		json.dump({"parameters":params,"files":filenames},json_file,indent=2)
+	return filenames
+
+def CountItems(value):
+	return value,len(value)
+
+def Benchmark(results,workpath,n,functions,measurememory):
+	filenames=PrepareDataset(workpath,n,args.hitnumber)
+	prefix=workpath + "/synthetic." + str(n)
+	records=SeqIO.to_dict(SeqIO.parse(filenames["fasta"],"fasta"))
+	seqids=list(records.keys())
+	#the similarity matrix
+	simmatrix=Run(results,"LoadSimFromBlastOutput",lambda: CountItems(LoadSimFromBlastOutput(filenames["blast"],seqids,args.minalignmentlength)),n,functions,measurememory)
+	simfilenames={"text":prefix + ".text.sim","binary":prefix + ".binary.sim"}
+	Run(results,"SaveSim",lambda: (SaveSim(simmatrix,simfilenames["text"]),len(simmatrix.scores)),n,functions,measurememory,"text")
+	Run(results,"SaveSim",lambda: (SaveBinarySim(simmatrix,simfilenames["binary"]),len(simmatrix.scores)),n,functions,measurememory,"binary")
+	for simformat in ["text","binary"]:
+		if "LoadSim" in functions:
+			Measure(results,"LoadSim",lambda: (LoadSim(simfilenames[simformat]),len(simmatrix.scores)),n,measurememory,simformat)
+	#the prediction at the species level
+	predict.ParseArguments(["-i",filenames["fasta"],"-c",filenames["classification"],"-rank","species","-st",str(args.startingthreshold),"-et",str(args.endthreshold),"-s",str(args.step),"-ml",str(args.minalignmentlength),"-o",workpath])
+	predict.rank="species"
+	predict.seqrecords=records
+	allclassification=predict.LoadClassification(filenames["classification"],"species",["genus"])
+	predict.taxonomyindex=predict.LoadTaxonomyIndex("species",["genus"],allclassification)
+	predict.simindices=simmatrix.GetIndices(seqids)
+	codes,offsets,members=predict.LoadClasses(predict.taxonomyindex,"species",None)
+	submatrix=simmatrix.Slice(predict.simindices[members],predict.taxonomyindex.GetSeqIds(members))
+	neighbors=Run(results,"LoadNeighbors",lambda: (predict.LoadNeighbors(submatrix,args.threshold),len(submatrix)),n,functions,measurememory)
+	def Cluster():
+		clusterlabels,clusternumber=predict.Cluster(neighbors[0],neighbors[1])
+		return (clusterlabels,clusternumber),clusternumber
+	clusterlabels,clusternumber=Run(results,"Cluster",Cluster,n,functions,measurememory)
+	if "ComputeFmeasure" in functions:
+		Measure(results,"ComputeFmeasure",lambda: (predict.ComputeFmeasure(offsets,clusterlabels,clusternumber),clusternumber),n,measurememory)
+	if "GenerateDatasets" in functions:
+		#the dataset generation includes the indexing of the classification
+		for variant,higherranks in [["local",["genus"]],["global",[]]]:
+			Measure(results,"GenerateDatasets",lambda: CountItems(predict.GenerateDatasets(predict.LoadTaxonomyIndex("species",higherranks,allclassification),"species",higherranks,"",0)),n,measurememory,variant)
+	if "Predict" in functions:
+		def Predict():
+			thresholds,fmeasures,optthreshold,bestFmeasure,isError=predict.Predict("All",{},members,offsets,simmatrix)
+			return optthreshold,len(thresholds)
+		Measure(results,"Predict",Predict,n,measurememory)
+	#the classification of the queries
+	classify.ParseArguments(["-i",filenames["queryblast"],"-c",filenames["classification"],"-cutoffs",filenames["cutoffs"],"-ml",str(args.minalignmentlength),"-o",workpath])
+	refclassificationdict,taxonomy=Run(results,"LoadTaxonomy",lambda: (classify.LoadTaxonomy(),len(seqids)),n,functions,measurememory)
+	def LoadBlastOutput():
+		bestmatchchunks=list(classify.LoadBlastOutput(filenames["queryblast"],args.minalignmentlength,classify.args.chunksize))
+		return bestmatchchunks,sum([len(bestmatchdict) for bestmatchdict in bestmatchchunks])
+	bestmatchchunks=Run(results,"LoadBlastOutput",LoadBlastOutput,n,functions,measurememory)
+	if "Assign" in functions:
+		def Assign():
+			count,unclassifiedseqids=classify.Assign(refclassificationdict,taxonomy,bestmatchchunks,prefix + ".classified",prefix + ".classification.report")
+			return count,sum([len(bestmatchdict) for bestmatchdict in bestmatchchunks])
+		Measure(results,"Assign",Assign,n,measurememory)
+	if "ConnectedComponents" in functions:
+		#the benchmark of clustering.py on graphs of n sequences
+		for graph in ["chain","random"]:
+			result=clustering.Benchmark(graph,n,10,256)
+			threading.stack_size(0)
+			results.append({"function":"ConnectedComponents","sequence number":n,"variant":graph,"time":result["time"],"items":result["edge number"],"peak memory":result["peak memory"]})
+			print("ConnectedComponents\t" + str(n) + "\t" + graph + "\t" + str(result["edge number"]) + "\t" + str(result["time"]) + "\t\t" + str(result["peak memory"]))
+
+def GetKey(result):
+	return (result["function"],result["sequence number"],result.get("variant",""))
+
+def Compare(results,earlierresults,tolerance):
+	#the results whose time or peak memory has increased by more than the tolerance
+	earlier={}
+	for result in earlierresults:
+		earlier[GetKey(result)]=result
+	regressions=[]
+	for result in results:
+		key=GetKey(result)
+		if not (key in earlier.keys()):
+			continue
+		for measure,minimum in [["time",0.01],["peak memory",1 << 20]]:
+			if not (measure in result.keys() and measure in earlier[key].keys()):
+				continue
+			old=earlier[key][measure]
+			new=result[measure]
+			if new > old*(1+tolerance) and new-old > minimum:
+				regressions.append(result["function"] + "\t" + str(result["sequence number"]) + "\t" + key[2] + "\t" + measure + "\t" + str(old) + "\t" + str(new) + "\t" + str(round(float(new)/max(old,1e-9),2)))
+	return regressions
+
+if __name__ == "__main__":
+	args=parser.parse_args()
+	functions=FUNCTIONS
+	if args.functions!="":
+		functions=args.functions.split(",")
+	if not os.path.exists(args.work):
+		os.makedirs(args.work)
+	report={"date":time.strftime("%Y-%m-%d %H:%M:%S"),"commit":GetCommit(),"python":platform.python_version(),"numpy":np.__version__,"machine":platform.machine(),"cpu number":os.cpu_count(),"options":vars(args),"results":[]}
+	print("Function\tSequences\tVariant\tItems\tTime(s)\tCPU time(s)\tPeak memory(bytes)")
+	for n in [int(number) for number in args.sequencenumbers.split(",")]:
+		Benchmark(report["results"],args.work,n,functions,args.memory=="yes")
+	if args.out!="":
+		with open(args.out,"w") as json_file:
+			json.dump(report,json_file,indent=2)
+		print("The results are saved in file " + args.out + ".")
+	if args.compare!="":
+		with open(args.compare) as json_file:
+			earlierreport=json.load(json_file)
+		regressions=Compare(report["results"],earlierreport["results"],args.tolerance)
+		if len(regressions) > 0:
+			print("The regressions compared to " + args.compare + " (" + earlierreport.get("commit","") + "):")
+			print("Function\tSequences\tVariant\tMeasure\tEarlier\tNow\tRatio")
+			for regression in regressions:
+				print(regression)
+			sys.exit(1)
+		print("No regressions compared to " + args.compare + ".")
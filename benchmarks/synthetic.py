@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# FILE: synthetic.py
+# CREATE DATE: 18 oct 2026
+#Generator of synthetic barcode datasets for the benchmarks: a taxonomy from kingdom to species, the sequences of the
+#species and their classification, a set of query sequences, and fake BLAST outputs in outfmt 6 of the sequences against
+#themselves and of the queries against the sequences, so that no BLAST is needed.
+#The taxa of each rank are numbered so that the sequences of a taxon are contiguous. The sequence of a taxon is
+#mutated from the sequence of its parent taxon, and the identity of a BLAST hit is drawn from the range of the lowest
+#rank shared by the two sequences.
+import os
+import sys, argparse
+import json
+import time
+import numpy as np
+
+RANKS=["kingdom","phylum","class","order","family","genus","species"]
+PREFIXES=["K","P","C","O","F","G","S"]
+#the mean number of taxa of a rank in a taxon of the rank above, from phylum to species
+BRANCHING=[3,3,4,4,4,4]
+SEQSPERSPECIES=5
+#the mutation rates of the sequence of a taxon from its parent taxon, from phylum to species, and of the sequences of a species
+MUTATIONRATES=[0.12,0.08,0.06,0.05,0.04,0.025]
+SEQMUTATIONRATE=0.005
+#the identities of two sequences whose lowest shared rank is the rank, from kingdom to species
+IDENTITIES=[[70,75],[75,78],[78,82],[82,87],[87,92],[92,97],[97,100]]
+#the probabilities that a BLAST hit of a sequence is in its taxon of the rank but not of the rank below
+HITLEVELS=[0.02,0.03,0.05,0.1,0.15,0.25,0.4]
+BASES=np.frombuffer(b"ACGT",dtype=np.uint8)
+
+parser=argparse.ArgumentParser(prog='synthetic.py',
+							   usage="%(prog)s [options] -n sequencenumber -o prefix",
+							   description='''Generator of a synthetic barcode dataset: the fasta file, the classification, the queries, the fake BLAST outputs and the cut-offs.''',
+							   epilog="""Written by Duong Vu duong.t.vu@gmail.com""",
+   )
+parser.add_argument('-n','--sequencenumber', type=int, default=1000, help='The number of sequences.')
+parser.add_argument('-q','--querynumber', type=int, default=0, help='The number of query sequences. By default it is a tenth of the sequences.')
+parser.add_argument('-hits','--hitnumber', type=int, default=20, help='The number of BLAST hits of a sequence.')
+parser.add_argument('-l','--length', type=int, default=300, help='The length of the sequences.')
+parser.add_argument('-seed','--seed', type=int, default=1, help='The seed of the random numbers.')
+parser.add_argument('-o','--out', default="synthetic", help='The prefix of the output files.')
+
+def GenerateTaxonomy(n,rng):
+	#the taxon of each sequence at each rank, and the first sequence of each taxon at each rank
+	speciesno=max(1,int(n/SEQSPERSPECIES))
+	weights=rng.lognormal(0,1,speciesno)
+	counts=1 + rng.multinomial(n-speciesno,weights/weights.sum())
+	taxa=[None]*len(RANKS)
+	taxa[-1]=np.repeat(np.arange(speciesno),counts)
+	childno=speciesno
+	parents=[None]*len(RANKS)
+	for level in range(len(RANKS)-2,-1,-1):
+		taxonno=max(1,int(round(childno/BRANCHING[level])))
+		if level==0:
+			taxonno=max(1,min(taxonno,2))
+		cuts=np.sort(rng.choice(np.arange(1,max(2,childno)),min(taxonno-1,childno-1),replace=False))
+		parents[level+1]=np.searchsorted(cuts,np.arange(childno),side='right')
+		taxa[level]=parents[level+1][taxa[level+1]]
+		childno=len(cuts) + 1
+	starts=[]
+	for level in range(len(RANKS)):
+		starts.append(np.searchsorted(taxa[level],np.arange(int(taxa[level][-1])+2)))
+	return taxa,parents,starts
+
+def GetTaxonNames(taxa,i):
+	names=[]
+	for level in range(len(RANKS)):
+		names.append(PREFIXES[level] + str(int(taxa[level][i])))
+	#the species names are binomials
+	names[-1]="G" + str(int(taxa[-2][i])) + " s" + str(int(taxa[-1][i]))
+	return names
+
+def Mutate(sequences,rate,rng):
+	mutations=rng.random(sequences.shape) < rate
+	return np.where(mutations,rng.integers(0,4,sequences.shape,dtype=np.uint8),sequences)
+
+def GenerateTaxonSequences(parents,length,rng):
+	#the sequence of each taxon at each rank, as base indices
+	sequences=[rng.integers(0,4,(int(parents[1].max())+1 if len(parents) > 1 else 1,length),dtype=np.uint8)]
+	for level in range(1,len(RANKS)):
+		sequences.append(Mutate(sequences[level-1][parents[level]],MUTATIONRATES[level-1],rng))
+	return sequences
+
+def SaveSequences(fastafilename,seqids,species,speciessequences,lengths,rng,chunksize=100000):
+	with open(fastafilename,"w") as fastafile:
+		for start in range(0,len(seqids),chunksize):
+			end=min(start + chunksize,len(seqids))
+			sequences=BASES[Mutate(speciessequences[species[start:end]],SEQMUTATIONRATE,rng)]
+			lines=[]
+			for i in range(start,end):
+				lines.append(">" + seqids[i] + "\n" + sequences[i-start][:lengths[i]].tobytes().decode() + "\n")
+			fastafile.write("".join(lines))
+
+def SaveClassification(classificationfilename,seqids,taxa):
+	with open(classificationfilename,"w") as classificationfile:
+		classificationfile.write("ID\t" + "\t".join(RANKS) + "\n")
+		lines=[]
+		for i in range(len(seqids)):
+			lines.append(seqids[i] + "\t" + "\t".join(GetTaxonNames(taxa,i)) + "\n")
+			if len(lines)==100000:
+				classificationfile.write("".join(lines))
+				lines=[]
+		classificationfile.write("".join(lines))
+
+def GenerateHits(querytaxa,taxa,starts,hitno,rng,selfhits):
+	#the hits of the queries, given by their taxa, to the sequences as (queries,refs,identities), sorted by query
+	#and identity. The hits of a query are drawn from its taxa at the ranks given by HITLEVELS.
+	queryno=len(querytaxa[-1])
+	queries=np.repeat(np.arange(queryno),hitno)
+	levels=rng.choice(len(RANKS),len(queries),p=HITLEVELS)
+	refs=np.zeros(len(queries),dtype=np.int64)
+	for level in range(len(RANKS)):
+		selected=levels==level
+		taxonids=querytaxa[level][queries[selected]]
+		first=starts[level][taxonids]
+		size=starts[level][taxonids+1] - first
+		refs[selected]=first + (rng.random(int(selected.sum()))*size).astype(np.int64)
+	if selfhits:
+		#every sequence is its own best hit
+		queries=np.concatenate((np.arange(queryno),queries))
+		refs=np.concatenate((np.arange(queryno),refs))
+	#the lowest rank shared by the query and the reference
+	shared=np.zeros(len(queries),dtype=np.int64)
+	for level in range(len(RANKS)):
+		shared[querytaxa[level][queries]==taxa[level][refs]]=level
+	ranges=np.array(IDENTITIES,dtype=np.float64)[shared]
+	identities=np.round(ranges[:,0] + rng.random(len(queries))*(ranges[:,1]-ranges[:,0]),3)
+	if selfhits:
+		identities[:queryno]=100
+	order=np.lexsort((-identities,queries))
+	return queries[order],refs[order],identities[order]
+
+def SaveBlastOutput(blastfilename,queryids,seqids,queries,refs,identities,querylengths,lengths,rng,chunksize=1000000):
+	coverages=np.minimum(querylengths[queries],lengths[refs])
+	coverages=coverages - (rng.random(len(queries))*coverages*0.1).astype(np.int64)
+	coverages[identities==100]=np.minimum(querylengths[queries],lengths[refs])[identities==100]
+	mismatches=np.round(coverages*(100-identities)/100).astype(np.int64)
+	bitscores=np.round(coverages*identities/100*1.8).astype(np.int64)
+	with open(blastfilename,"w") as blastfile:
+		for start in range(0,len(queries),chunksize):
+			end=min(start + chunksize,len(queries))
+			lines=[]
+			for q,r,identity,coverage,mismatch,bitscore in zip(queries[start:end].tolist(),refs[start:end].tolist(),identities[start:end].tolist(),coverages[start:end].tolist(),mismatches[start:end].tolist(),bitscores[start:end].tolist()):
+				lines.append(queryids[q] + "\t" + seqids[r] + "\t" + "%.3f" % identity + "\t" + str(coverage) + "\t" + str(mismatch) + "\t0\t1\t" + str(coverage) + "\t1\t" + str(coverage) + "\t1e-50\t" + str(bitscore) + "\n")
+			blastfile.write("".join(lines))
+
+def GenerateCutoffs(taxa,starts,rng):
+	#the cut-offs of the ranks from phylum to species for all the sequences and for the taxa of the rank above
+	cutoffs={}
+	for level in range(len(RANKS)-1,0,-1):
+		rank=RANKS[level]
+		low,high=IDENTITIES[level]
+		datasets={}
+		datasets["All"]={"cut-off":round(low/100,4),"confidence":0.8,"sequence number":len(taxa[level]),"group number":int(taxa[level][-1])+1}
+		highertaxonno=len(starts[level-1])-1
+		highercutoffs=np.round((low + rng.random(highertaxonno)*(high-low))/100,4)
+		confidences=np.round(0.5 + rng.random(highertaxonno)*0.5,4)
+		seqnos=np.diff(starts[level-1])
+		firsttaxa=taxa[level][starts[level-1][:-1]]
+		lasttaxa=taxa[level][starts[level-1][1:]-1]
+		for i in range(highertaxonno):
+			name=PREFIXES[level-1] + str(i)
+			datasets[name]={"cut-off":float(highercutoffs[i]),"confidence":float(confidences[i]),"sequence number":int(seqnos[i]),"group number":int(lasttaxa[i]-firsttaxa[i])+1}
+		cutoffs[rank]=datasets
+	return cutoffs
+
+def GenerateDataset(prefix,n,queryno=0,hitno=20,length=300,seed=1):
+	#save prefix.fasta, prefix.classification, prefix.blast, prefix.queries.fasta, prefix.queries.blast and prefix.cutoffs.json,
+	#and give their file names
+	rng=np.random.default_rng(seed)
+	if queryno<=0:
+		queryno=max(1,int(n/10))
+	taxa,parents,starts=GenerateTaxonomy(n,rng)
+	sequences=GenerateTaxonSequences(parents,length,rng)
+	seqids=["S" + str(i) for i in range(n)]
+	lengths=length - (rng.random(n)*length*0.1).astype(np.int64)
+	#the queries are sequences of the species of random sequences
+	queryseqs=np.sort(rng.integers(0,n,queryno))
+	querytaxa=[taxa[level][queryseqs] for level in range(len(RANKS))]
+	queryids=["Q" + str(i) for i in range(queryno)]
+	querylengths=lengths[queryseqs]
+	filenames={"fasta":prefix + ".fasta","classification":prefix + ".classification","blast":prefix + ".blast","queries":prefix + ".queries.fasta","queryblast":prefix + ".queries.blast","cutoffs":prefix + ".cutoffs.json"}
+	SaveSequences(filenames["fasta"],seqids,taxa[-1],sequences[-1],lengths,rng)
+	SaveClassification(filenames["classification"],seqids,taxa)
+	SaveSequences(filenames["queries"],queryids,querytaxa[-1],sequences[-1],querylengths,rng)
+	queries,refs,identities=GenerateHits(taxa,taxa,starts,hitno-1,rng,True)
+	SaveBlastOutput(filenames["blast"],seqids,seqids,queries,refs,identities,lengths,lengths,rng)
+	queries,refs,identities=GenerateHits(querytaxa,taxa,starts,hitno,rng,False)
+	SaveBlastOutput(filenames["queryblast"],queryids,seqids,queries,refs,identities,querylengths,lengths,rng)
+	with open(filenames["cutoffs"],"w") as json_file:
+		json.dump(GenerateCutoffs(taxa,starts,rng),json_file,indent=2)
+	return filenames
+
+if __name__ == "__main__":
+	args=parser.parse_args()
+	start=time.perf_counter()
+	filenames=GenerateDataset(args.out,args.sequencenumber,args.querynumber,args.hitnumber,args.length,args.seed)
+	print("The synthetic dataset of " + str(args.sequencenumber) + " sequences is generated in " + str(round(time.perf_counter()-start,2)) + " s.")
+	for name in filenames.keys():
+		print(name + ": " + filenames[name])
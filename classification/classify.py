@@ -16,6 +16,10 @@ import os, argparse
 import json
 from Bio import SeqIO
 import multiprocessing
+import numpy as np
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.blast import ReadBlastBlocks
+from lib import profiling
 parser=argparse.ArgumentParser(prog='classify.py',  
 							   usage="%(prog)s [options] -i bestmatch/classified file -r referencefastafilename -c classificationfile -ml minalignment -cutoffs cutoffsfile -o output",
 							   description='''Script that assigns the classified sequences of the prediction file to their BLAST best match based on the given cutoffs.''',
@@ -39,25 +43,25 @@ parser.add_argument('-ml','--minalignmentlength', type=int, default=400, help='M
 parser.add_argument('-saveclassifiedonly','--saveclassifiedonly',default=False, help='The option to save all (False) or only classified sequences (True) in the classification output.')
 parser.add_argument('-idcolumnname','--idcolumnname',default="ID", help='the column name of sequence id in the classification file.')
 parser.add_argument('-display','--display',default="", help='If display=="yes" then the krona html is displayed.')
+parser.add_argument('-chunksize','--chunksize', type=int, default=100000, help='The number of sequences read, assigned and saved at a time. The hits of a sequence in the BLAST output are expected to be together, as BLAST gives them.')
 
-args=parser.parse_args()
-predictionfilename=args.input
-globalcutoff=args.globalcutoff
-globalconfidence=args.globalconfidence
-cutoffsfilename=args.cutoffs
-classificationfilename=args.classification
-classificationrank=args.classificationrank
-fastafilename= args.fasta
-referencefastafilename= args.reference
-mincoverage = args.minalignmentlength
-prefix=args.prefix
-outputpath=args.out
-
-
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)
-
-
+def ParseArguments(argv=None):
+	#the arguments are parsed when classify.py is run, or by the scripts using its functions
+	global args,predictionfilename,globalcutoff,globalconfidence,cutoffsfilename,classificationfilename,classificationrank,fastafilename,referencefastafilename,mincoverage,prefix,outputpath
+	args=parser.parse_args(argv)
+	predictionfilename=args.input
+	globalcutoff=args.globalcutoff
+	globalconfidence=args.globalconfidence
+	cutoffsfilename=args.cutoffs
+	classificationfilename=args.classification
+	classificationrank=args.classificationrank
+	fastafilename= args.fasta
+	referencefastafilename= args.reference
+	mincoverage = args.minalignmentlength
+	prefix=args.prefix
+	outputpath=args.out
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
 
 nproc=multiprocessing.cpu_count()
 
@@ -455,74 +459,83 @@ def GetCutoffs(classification,taxonomy):
 		taxacutoffs["kingdom"]=[0,0,False]		
 	return taxacutoffs,kingdom,phylum,bioclass,order,family,genus,species
 
-def GetAssignment(refid,classificationdict,bestscore,taxonomy,classificationrank):
-	localcutoff=taxonomy["unidentified"]["cut-off"]
-	confidence=taxonomy["unidentified"]["confidence"]
-	rank=classificationrank
-	taxonname=""
-	level=-1
-	classification=""
-	try:		
+#the ranks in the order in which the best match is tried to be assigned
+ASSIGNMENTRANKS=["species","genus","family","order","class","phylum","kingdom"]
+
+def CompileCutoffs(refid,classificationdict,taxonomy,cutofftable):
+	#Resolve the taxa of the reference sequence and their cut-offs once for all the sequences matching it, from species
+	#to kingdom: the taxon names, cut-offs, confidences, whether each taxon can be assigned, and the classification.
+	#None if the reference sequence has no classification.
+	if refid in cutofftable:
+		return cutofftable[refid]
+	row=None
+	if refid in classificationdict.keys():
 		refclassification=classificationdict[refid]['classification']
 		taxacutoffs,kingdom,phylum,bioclass,order,family,genus,species=GetCutoffs(refclassification,taxonomy)
-		if bestscore >=taxacutoffs["species"][0] and taxacutoffs["species"][2]==True and species!="unidentified" and (classificationrank=="species" or classificationrank== ""):
-			rank="species"
-			localcutoff=taxacutoffs["species"][0]
-			confidence=taxacutoffs["species"][1]
-			taxonname=species		
-			level=6
-		elif bestscore >=taxacutoffs["genus"][0] and taxacutoffs["genus"][2]==True and genus!="unidentified" and (classificationrank=="genus" or classificationrank== ""):
-			rank="genus"
-			localcutoff=taxacutoffs["genus"][0]
-			confidence=taxacutoffs["genus"][1]
-			taxonname=genus
-			level=5
-		elif bestscore >=taxacutoffs["family"][0] and taxacutoffs["family"][2]==True and family!="unidentified" and (classificationrank=="family" or classificationrank== ""):
-			rank="family"
-			localcutoff=taxacutoffs["family"][0]
-			confidence=taxacutoffs["family"][1]
-			taxonname=family	
-			level=4
-		elif bestscore >=taxacutoffs["order"][0] and taxacutoffs["order"][2]==True and order!="unidentified" and (classificationrank=="order" or classificationrank== ""):
-			rank="order"
-			localcutoff=taxacutoffs["order"][0]
-			confidence=taxacutoffs["order"][1]
-			taxonname=order
-			level=3
-		elif bestscore >=taxacutoffs["class"][0] and taxacutoffs["class"][2]==True and bioclass!="unidentified" and (classificationrank=="class" or classificationrank== ""):
-			rank="class"
-			localcutoff=taxacutoffs["class"][0]
-			confidence=taxacutoffs["class"][1]
-			taxonname=bioclass
-			level=2
-		elif bestscore >=taxacutoffs["phylum"][0] and taxacutoffs["phylum"][2]==True and phylum!="unidentified" and (classificationrank=="phylum" or classificationrank== ""):
-			rank="phylum"
-			localcutoff=taxacutoffs["phylum"][0]
-			confidence=taxacutoffs["phylum"][1]
-			taxonname=phylum
-			level=1
-		elif bestscore >=taxacutoffs["kingdom"][0] and taxacutoffs["kingdom"][2]==True and kingdom!="unidentified" and (classificationrank=="kingdom" or classificationrank== ""):
-			rank="kingdom"
-			localcutoff=taxacutoffs["kingdom"][0]
-			confidence=taxacutoffs["kingdom"][1]
-			taxonname=kingdom
-			level=0	
+		taxonnames=[species,genus,family,order,bioclass,phylum,kingdom]
+		cutoffs=[]
+		confidences=[]
+		assignable=[]
+		for k in range(len(ASSIGNMENTRANKS)):
+			cutoff,confidence,isComputed=taxacutoffs[ASSIGNMENTRANKS[k]]
+			cutoffs.append(cutoff)
+			confidences.append(confidence)
+			assignable.append(isComputed==True and taxonnames[k]!="unidentified" and (classificationrank==ASSIGNMENTRANKS[k] or classificationrank==""))
+		#the classifications at the assigned levels are added when needed
+		row=(taxonnames,cutoffs,confidences,assignable,refclassification,{})
+	cutofftable[refid]=row
+	return row
+
+def GetAssignments(refids,bestscores,classificationdict,taxonomy,cutofftable):
+	#The assignments of the sequences to the taxa of their best matches: the lowest rank at which the best score
+	#reaches the cut-off, compared for all the sequences at once.
+	#the cut-offs of each reference sequence are compiled once, the sequences are given the row of their best match
+	refindex={}
+	rows=[]
+	rowindices=[]
+	for refid in refids:
+		i=refindex.get(refid,-1)
+		if i==-1:
+			i=len(rows)
+			refindex[refid]=i
+			rows.append(CompileCutoffs(refid,classificationdict,taxonomy,cutofftable))
+		rowindices.append(i)
+	nocutoffs=[0]*len(ASSIGNMENTRANKS)
+	noassignable=[False]*len(ASSIGNMENTRANKS)
+	cutoffs=np.array([row[1] if row!=None else nocutoffs for row in rows],dtype=np.float64).reshape(len(rows),len(ASSIGNMENTRANKS))
+	assignable=np.array([row[3] if row!=None else noassignable for row in rows],dtype=bool).reshape(len(rows),len(ASSIGNMENTRANKS))
+	rowindices=np.array(rowindices,dtype=np.int64)
+	scores=np.array(bestscores,dtype=np.float64).reshape(len(rowindices),1)
+	matched=assignable[rowindices] & (scores >= cutoffs[rowindices])
+	assignedranks=np.where(matched.any(axis=1),matched.argmax(axis=1),-1).tolist()
+	assignments=[]
+	for i,k in zip(rowindices.tolist(),assignedranks):
+		row=rows[i]
+		if row==None:
+			assignments.append((GetRankClassification(-1,""),"",classificationrank,-1,taxonomy["unidentified"]["cut-off"],taxonomy["unidentified"]["confidence"]))
+			continue
+		taxonnames,cutoffs,confidences,assignable,refclassification,classifications=row
+		if k >=0:
+			rank=ASSIGNMENTRANKS[k]
+			assignment=(taxonnames[k],rank,cutoffs[k],confidences[k])
+		else:
+			rank=classificationrank
+			assignment=("",rank,taxonomy["unidentified"]["cut-off"],taxonomy["unidentified"]["confidence"])
 		level=GetLevel(rank)
-		classification=GetRankClassification(level,refclassification)
-	except KeyError:
-		classification=GetRankClassification(-1,classification)
-	return classification,taxonname,rank,level,localcutoff,confidence
+		if not level in classifications.keys():
+			classifications[level]=GetRankClassification(level,refclassification)
+		taxonname,rank,localcutoff,confidence=assignment
+		assignments.append((classifications[level],taxonname,rank,level,localcutoff,confidence))
+	return assignments
 
-def Assign(refclassificationdict,taxonomy,bestmatchdict,outputname,classificationreportfilename):
-	#classificationlevel=GetLevel(classificationrank)
-	output=open(outputname,"w")
-	classificationreportfile=open(classificationreportfilename,"w")
-	output.write("ID\tGiven label\tPrediction\tFull classification\tRank\tCut-off\tConfidence\tReferenceID\tBLAST score\tBLAST sim\tBLAST coverage\n")
-	classificationreportfile.write("ID\tReferenceID\tkingdom\tphylum\tclass\torder\tfamily\tgenus\tspecies\trank\tscore\tcutoff\tconfidence\n")
-	given_labels=[]
-	assigned_labels=[]
+def AssignChunk(refclassificationdict,taxonomy,bestmatchdict,output,classificationreportfile,cutofftable):
+	#assign the sequences of a chunk and save them to the output files
 	unclassifiedseqids=[]
 	count=0
+	#assign the sequences having a best match
+	matchedseqids=[seqid for seqid in bestmatchdict.keys() if bestmatchdict[seqid]["refid"]!=""]
+	assignments=GetAssignments([bestmatchdict[seqid]["refid"] for seqid in matchedseqids],[bestmatchdict[seqid]["score"] for seqid in matchedseqids],refclassificationdict,taxonomy,cutofftable)
+	assignmentdict=dict(zip(matchedseqids,assignments))
 	for seqid in bestmatchdict.keys():
 		rank=""
 		level=-1
@@ -544,7 +557,7 @@ def Assign(refclassificationdict,taxonomy,bestmatchdict,outputname,classificatio
 		confidence=-1
 		cutoff=-1
 		if refid!="":
-			classification,predictedname,rank,level,cutoff,confidence=GetAssignment(refid,refclassificationdict,bestscore,taxonomy,classificationrank)		
+			classification,predictedname,rank,level,cutoff,confidence=assignmentdict[seqid]
 		cutoff_str=str(cutoff)	
 		if cutoff==-1:
 			cutoff_str="N/A"	
@@ -564,8 +577,6 @@ def Assign(refclassificationdict,taxonomy,bestmatchdict,outputname,classificatio
 		if giventaxonname!="" and giventaxonname!="unidentified":	
 			giventaxonname=giventaxonname.replace("_"," ")
 			predictedname=predictedname.replace("_"," ")
-			given_labels.append(giventaxonname)
-			assigned_labels.append(predictedname)	
 		if predictedname!="" and predictedname!="unidentified":
 			count=count+1
 		else:
@@ -582,11 +593,29 @@ def Assign(refclassificationdict,taxonomy,bestmatchdict,outputname,classificatio
 			if predictedname!="" and predictedname!="unidentified":
 				output.write(seqid + "\t" + giventaxonname + "\t"  + predictedname + "\t"+ classification + "\t" + rank + "\t" + cutoff_str + "\t" + confidence_str + "\t" + refid + "\t" + str(bestscore) + "\t" + str(sim) + "\t" + str(coverage) + "\n")			
 				classificationreportfile.write(seqid + "\t" + refid + "\t" + cleanclassification.replace(";","\t") + "\t" + rank + "\t" + str(bestscore) + "\t" + cutoff_str + "\t" + confidence_str + "\n")
+	return count,unclassifiedseqids
+
+def Assign(refclassificationdict,taxonomy,bestmatchchunks,outputname,classificationreportfilename):
+	#Assign the sequences chunk by chunk, so that only the best matches of a chunk are kept in memory.
+	#The ids of the unclassified sequences are returned to save their sequences.
+	output=open(outputname,"w")
+	classificationreportfile=open(classificationreportfilename,"w")
+	output.write("ID\tGiven label\tPrediction\tFull classification\tRank\tCut-off\tConfidence\tReferenceID\tBLAST score\tBLAST sim\tBLAST coverage\n")
+	classificationreportfile.write("ID\tReferenceID\tkingdom\tphylum\tclass\torder\tfamily\tgenus\tspecies\trank\tscore\tcutoff\tconfidence\n")
+	unclassifiedseqids=[]
+	count=0
+	#the cut-offs of the references are compiled once for all the chunks
+	cutofftable={}
+	for bestmatchdict in bestmatchchunks:
+		chunkcount,chunkunclassifiedseqids=AssignChunk(refclassificationdict,taxonomy,bestmatchdict,output,classificationreportfile,cutofftable)
+		count=count + chunkcount
+		unclassifiedseqids.extend(chunkunclassifiedseqids)
 	output.close()
 	classificationreportfile.close()
-	return count,given_labels,assigned_labels,unclassifiedseqids
+	return count,unclassifiedseqids
 	
-def LoadPrediction(predictionfilename,mincoverage,idcolumnname):
+def LoadPrediction(predictionfilename,mincoverage,idcolumnname,chunksize):
+	#give the best matches of the prediction file in dicts of chunksize sequences
 	bestmatchdict={}
 	p_id=-1
 	p_l=-1
@@ -627,6 +656,9 @@ def LoadPrediction(predictionfilename,mincoverage,idcolumnname):
 			seqid=texts[p_id]
 		if seqid=="":
 			continue
+		if len(bestmatchdict) >= chunksize and not (seqid in bestmatchdict.keys()):
+			yield bestmatchdict
+			bestmatchdict={}
 		label=""
 		if p_l >=0 and p_l < len(texts):
 			label=texts[p_l]
@@ -664,40 +696,97 @@ def LoadPrediction(predictionfilename,mincoverage,idcolumnname):
 		bestmatchdict[seqid]["score"]=score
 		bestmatchdict[seqid]["sim"]=sim
 		bestmatchdict[seqid]["alignmentlength"]=alignmentlength
-	return bestmatchdict
+	predictionfile.close()
+	if len(bestmatchdict) > 0:
+		yield bestmatchdict
 
-def LoadBlastOutput(blastoutput,mincoverage):
+def GetBestMatchDict(seqids,bestrefids,bestscores,bestsims,bestcoverages):
 	bestmatchdict={}
-	#read blast output
-	blastoutputfile = open(blastoutput)
-	refid = ""
-	score=0
-	seqid=""
-	for line in blastoutputfile:
-		words = line.split("\t")
-		seqid=words[0]
-		pos1 = int(words[6])
-		pos2 = int(words[7])
-		iden = float(words[2]) 
-		sim=float(iden)/100
-		coverage=abs(pos2-pos1)
-		refid=words[1]
-		score=sim
-		if coverage < mincoverage:
-			score=float(score * coverage)/mincoverage
-		if not (seqid in bestmatchdict.keys()):
-			bestmatchdict.setdefault(seqid,{})
+	for seqid,refid,score,sim,coverage in zip(seqids,bestrefids,bestscores.tolist(),bestsims.tolist(),bestcoverages.tolist()):
+		bestmatchdict.setdefault(seqid,{})
+		if refid==None:
+			#no hit with a positive score or coverage
 			bestmatchdict[seqid]["refid"]=""
 			bestmatchdict[seqid]["score"]=0
 			bestmatchdict[seqid]["sim"]=0
 			bestmatchdict[seqid]["alignmentlength"]=0
-		#if (score > bestmatchdict[seqid]["score"]):
-		if (score > bestmatchdict[seqid]["score"]) or (score == bestmatchdict[seqid]["score"] and coverage > bestmatchdict[seqid]["alignmentlength"]):
+		else:
 			bestmatchdict[seqid]["refid"]=refid
 			bestmatchdict[seqid]["score"]=score
 			bestmatchdict[seqid]["sim"]=sim
 			bestmatchdict[seqid]["alignmentlength"]=coverage
 	return bestmatchdict
+
+def LoadBlastOutput(blastoutput,mincoverage,chunksize):
+	#Give the best matches of the BLAST output in dicts of chunksize sequences. A chunk is ended between the hits
+	#of two sequences, so the hits of a sequence are expected to be together.
+	#The output is read in blocks of lines parsed into columns. The best hit of a sequence is the first of its hits
+	#with the highest score and then the longest alignment, found for all the sequences of a block at once.
+	chunksize=max(1,chunksize)
+	seqindex={}
+	bestrefids=[]
+	bestscores=np.zeros(0,dtype=np.float64)
+	bestsims=np.zeros(0,dtype=np.float64)
+	bestcoverages=np.zeros(0,dtype=np.int64)
+	for block in ReadBlastBlocks(blastoutput):
+		sims=block.identities/100
+		coverages=np.abs(block.ends-block.starts)
+		scores=sims.copy()
+		short=coverages < mincoverage
+		scores[short]=(sims[short] * coverages[short])/mincoverage
+		runends=np.append(block.runstarts[1:],len(block))
+		run=0
+		while run < len(block.queryids):
+			runcodes=np.array([seqindex.setdefault(seqid,len(seqindex)) for seqid in block.queryids[run:]],dtype=np.int64)
+			lastrun=len(block.queryids)
+			if len(seqindex) > chunksize:
+				#the chunk is ended before the sequence after chunksize sequences
+				lastrun=run + int(np.argmax(runcodes >= chunksize))
+				runcodes=runcodes[:lastrun-run]
+			if lastrun > run:
+				#the first of the best hits of each sequence, compared to its best hit in the previous blocks
+				start=int(block.runstarts[run])
+				end=int(runends[lastrun-1])
+				runoffsets=block.runstarts[run:lastrun] - start
+				runlengths=runends[run:lastrun] - block.runstarts[run:lastrun]
+				blockscores=scores[start:end]
+				blockcoverages=coverages[start:end]
+				#the first hit with the highest score and then the longest alignment of each run of hits
+				ismax=blockscores==np.repeat(np.maximum.reduceat(blockscores,runoffsets),runlengths)
+				maxcoverages=np.maximum.reduceat(np.where(ismax,blockcoverages,-1),runoffsets)
+				isbest=ismax & (blockcoverages==np.repeat(maxcoverages,runlengths))
+				runhits=np.minimum.reduceat(np.where(isbest,np.arange(end-start),end-start),runoffsets)
+				#the runs of the same sequence, when its hits are not together, are compared in their order
+				order=np.lexsort((-blockcoverages[runhits],-blockscores[runhits],runcodes))
+				sortedcodes=runcodes[order]
+				isfirst=np.ones(len(order),dtype=bool)
+				isfirst[1:]=sortedcodes[1:]!=sortedcodes[:-1]
+				hits=runhits[order[isfirst]]
+				hitcodes=runcodes[order[isfirst]]
+				newseqno=int(hitcodes.max()) + 1 - len(bestrefids)
+				if newseqno > 0:
+					bestrefids.extend([None]*newseqno)
+					bestscores=np.concatenate((bestscores,np.zeros(newseqno,dtype=np.float64)))
+					bestsims=np.concatenate((bestsims,np.zeros(newseqno,dtype=np.float64)))
+					bestcoverages=np.concatenate((bestcoverages,np.zeros(newseqno,dtype=np.int64)))
+				isbetter=(blockscores[hits] > bestscores[hitcodes]) | ((blockscores[hits]==bestscores[hitcodes]) & (blockcoverages[hits] > bestcoverages[hitcodes]))
+				hits=hits[isbetter]
+				hitcodes=hitcodes[isbetter]
+				bestscores[hitcodes]=blockscores[hits]
+				bestsims[hitcodes]=sims[start:end][hits]
+				bestcoverages[hitcodes]=blockcoverages[hits]
+				for code,i in zip(hitcodes.tolist(),(hits + start).tolist()):
+					bestrefids[code]=block.RefId(i)
+			if lastrun < len(block.queryids):
+				yield GetBestMatchDict(list(seqindex.keys())[:chunksize],bestrefids,bestscores,bestsims,bestcoverages)
+				seqindex={}
+				bestrefids=[]
+				bestscores=np.zeros(0,dtype=np.float64)
+				bestsims=np.zeros(0,dtype=np.float64)
+				bestcoverages=np.zeros(0,dtype=np.int64)
+			run=lastrun
+	if len(seqindex) > 0:
+		yield GetBestMatchDict(list(seqindex.keys()),bestrefids,bestscores,bestsims,bestcoverages)
 	
 def GetClassificationpos(pred_labels,classificationfilename):
 	classificationpos=0
@@ -779,66 +868,80 @@ def KronaPieCharts(classification,kronareport,kronahtml):
 	if args.display=="yes":
 		os.system("firefox " + kronahtml) 
 	
-if __name__ == "__main__":
-	if prefix=="" or prefix==None:
-		prefix=GetBase(predictionfilename)
-		if "/" in prefix:
-			prefix=prefix[prefix.rindex("/")+1:]	
-		if globalcutoff >0 and cutoffsfilename=="":
-			prefix =prefix + "." + str(globalcutoff)
-	outputname=GetWorkingBase(prefix) + ".classified"
-	if classificationrank!="":
-		outputname=GetWorkingBase(prefix) + "." + classificationrank + ".classified"
-	if outputname==predictionfilename:
-		outputname=outputname+".classified"
-	classificationreportfilename=GetBase(outputname) + ".classification"
-	unclassifiedfastafilename=GetBase(outputname)  + ".unclassified.fasta"	
-	#load prediction
-	bestmatchdict={}
-	if args.inputformat=="blast":
-		bestmatchdict=LoadBlastOutput(predictionfilename,mincoverage)	
-	else:
-		bestmatchdict=LoadPrediction(predictionfilename,mincoverage,args.idcolumnname)	
+def LoadTaxonomy():
+	#the classification of the references and the taxa with their cut-offs, None if the classification file is not valid
 	refclassificationdict={}
 	#load classification for the sequences
 	if classificationfilename!="":
 		refclassificationdict,taxonomy,isError = LoadClassification(classificationfilename,args.idcolumnname)
 		if isError==True:
-			sys.exit()
+			return None,None
 	else:
 		#load reference sequences, in case the classification of the sequences is given in sequence headers
 		refseqrecords={}
 		if os.path.exists(referencefastafilename):
 			refseqrecords=SeqIO.to_dict(SeqIO.parse(referencefastafilename, "fasta"))
 		refclassificationdict,taxonomy = LoadClassificationFromDescription(refseqrecords)
-	predictedclassificationdict={}
 	cutoffs={}
 	if cutoffsfilename!="" and cutoffsfilename!=None:
 		with open(cutoffsfilename) as cutoffsfile:
 			cutoffs = json.load(cutoffsfile)	
 	#add cutoffs to taxa for sequence identification		
 	AddCutoffsToTaxonomy(taxonomy,globalcutoff,globalconfidence,cutoffs)
-	count,given_labels,assigned_labels,unclassifiedseqids=Assign(refclassificationdict,taxonomy,bestmatchdict,outputname,classificationreportfilename)
+	return refclassificationdict,taxonomy
+
+def main(argv=None):
+	global prefix
+	ParseArguments(argv)
+	if prefix=="" or prefix==None:
+		prefix=GetBase(predictionfilename)
+		if "/" in prefix:
+			prefix=prefix[prefix.rindex("/")+1:]	
+		if globalcutoff >0 and cutoffsfilename=="":
+			prefix =prefix + "." + str(globalcutoff)
+	outputname=GetWorkingBase(prefix) + ".classified"
+	if classificationrank!="":
+		outputname=GetWorkingBase(prefix) + "." + classificationrank + ".classified"
+	if outputname==predictionfilename:
+		outputname=outputname+".classified"
+	classificationreportfilename=GetBase(outputname) + ".classification"
+	unclassifiedfastafilename=GetBase(outputname)  + ".unclassified.fasta"	
+	with profiling.Stage("classification load") as stage:
+		refclassificationdict,taxonomy=LoadTaxonomy()
+		if taxonomy==None:
+			sys.exit()
+		stage.Count(sequences=len(refclassificationdict),clades=len(taxonomy))
+	#the prediction is read and assigned in chunks
+	if args.inputformat=="blast":
+		bestmatchchunks=LoadBlastOutput(predictionfilename,mincoverage,args.chunksize)
+	else:
+		bestmatchchunks=LoadPrediction(predictionfilename,mincoverage,args.idcolumnname,args.chunksize)
+	#the assignment includes reading the prediction and writing the classified sequences
+	with profiling.Stage("assignment") as stage:
+		count,unclassifiedseqids=Assign(refclassificationdict,taxonomy,bestmatchchunks,outputname,classificationreportfilename)
+		stage.Count(sequences=count + len(unclassifiedseqids))
 	print("Number of classified sequences: " + str(count))
 	#print("The results are saved in file  " + outputname)
 	print("The results are saved in file  " + outputname + " and " + classificationreportfilename + ".")
-	unclassifiedseqrecords=[]
 	if len(unclassifiedseqids) > 0:
-		#load sequences if the fasta file of the sequences is given, to save unidentified sequences
+		#index the sequences if the fasta file of the sequences is given, to save unidentified sequences
 		seqrecords={}
 		if os.path.exists(fastafilename):
-			seqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))	
-		for seqid in unclassifiedseqids:
-			if seqid in seqrecords.keys():
-				unclassifiedseqrecords.append(seqrecords[seqid])
-		#write to fasta file	
-		if len(unclassifiedseqrecords)>0:
-			SeqIO.write(unclassifiedseqrecords, unclassifiedfastafilename, "fasta")	
+			seqrecords=SeqIO.index(fastafilename, "fasta")
+		unclassifiedseqids=[seqid for seqid in unclassifiedseqids if seqid in seqrecords]
+		#write to fasta file, the sequences are read one by one from the indexed file
+		if len(unclassifiedseqids)>0:
+			with profiling.Stage("output writing",sequences=len(unclassifiedseqids)):
+				SeqIO.write((seqrecords[seqid] for seqid in unclassifiedseqids), unclassifiedfastafilename, "fasta")	
 			print("The unclassified sequences are saved in the file " +   unclassifiedfastafilename + ".")
 	#making krona report
 	if count > 0:
 		kronareport = GetBase(outputname) + ".krona.report"
 		kronahtml=GetBase(kronareport) + ".html"
-		classificationdict= LoadClassificationForKronaReport(outputname)
-		KronaPieCharts(classificationdict,kronareport,kronahtml)
-		print("The krona report and html are saved in files " + kronareport + " and " + kronahtml + ".") 
+		with profiling.Stage("plotting"):
+			classificationdict= LoadClassificationForKronaReport(outputname)
+			KronaPieCharts(classificationdict,kronareport,kronahtml)
+		print("The krona report and html are saved in files " + kronareport + " and " + kronahtml + ".")
+
+if __name__ == "__main__":
+	main()
@@ -8,10 +8,6 @@ import sys
 if sys.version_info[0] >= 3:
 	unicode = str
 import os, argparse
-from sklearn.metrics import precision_recall_fscore_support
-from sklearn.metrics import matthews_corrcoef
-from sklearn.metrics import confusion_matrix
-from sklearn.metrics import accuracy_score
 from Bio import SeqIO
 
 parser=argparse.ArgumentParser(prog='evaluate.py',  
@@ -35,14 +31,15 @@ parser.add_argument('-predictedlabelcolumnname','--predictedlabelcolumnname',def
 parser.add_argument('-fullclassificationcolumnname','--fullclassificationcolumnname',default="full classification", help='the column name of the predicted full classifications in the classification file.')
 parser.add_argument('-rank','--rankcolumnname',default="rank", help='the column name of the ranks in the classification file.')
 
-args=parser.parse_args()
-predictionfilename=args.input
-queryclassificationfilename=args.queryclassification
-refclassificationfilename=args.refclassification
-outputpath=args.out
-
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)
+def ParseArguments(argv=None):
+	global args,predictionfilename,queryclassificationfilename,refclassificationfilename,outputpath
+	args=parser.parse_args(argv)
+	predictionfilename=args.input
+	queryclassificationfilename=args.queryclassification
+	refclassificationfilename=args.refclassification
+	outputpath=args.out
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
 
 def GetBase(filename):
 	return filename[:-(len(filename)-filename.rindex("."))]
@@ -325,6 +322,10 @@ def LoadPrediction(predictionfilename,queryclassificationdict,outputname,reftaxa
 	return given_labels,pred_labels
 
 def CalculateMetrics(test_labels,pred_labels,labels): 
+	from sklearn.metrics import precision_recall_fscore_support
+	from sklearn.metrics import matthews_corrcoef
+	from sklearn.metrics import confusion_matrix
+	from sklearn.metrics import accuracy_score
 	if len(test_labels)==0:
 		return 0,0,0,0,[],[],[],0,[]
 	accuracy=accuracy_score(test_labels,pred_labels)
@@ -406,7 +407,9 @@ def CalculateClassificationMetrics(givenlabels,predlabels,reftaxa,reportname):
 	report.close()
 	print("Accuracy, precision, and fscore of the taxa are given in file " + reportname +  ".")
 
-if __name__ == "__main__":
+def main(argv=None):
+	global given_labels,pred_labels
+	ParseArguments(argv)
 	queryclassificationdict={}
 	if is_fasta(queryclassificationfilename):
 		queryclassificationdict=LoadClassificationFromDescription(queryclassificationfilename)
@@ -427,4 +430,7 @@ if __name__ == "__main__":
 		print("The assigned sequences with given labels are saved in file " + outputname + ".") 
 		reportname=GetBase(outputname) + ".report"
 		CalculateClassificationMetrics(given_labels,pred_labels,reftaxa,reportname)
-	
\ No newline at end of file
+	
+
+if __name__ == "__main__":
+	main()
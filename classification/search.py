@@ -14,6 +14,11 @@ import os, argparse
 from Bio import SeqIO
 #import json
 import multiprocessing
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.blast import ReadBlastLines,RunBlastn,BlastError
+from lib.blastcache import BlastCache
+from lib.refindex import ReferenceIndex
+from lib import profiling
 
 nproc=multiprocessing.cpu_count()
 #from keras.utils import np_utils
@@ -29,16 +34,26 @@ parser.add_argument('-r','--reference', required=True, help='the reference fasta
 parser.add_argument('-ml','--minalignmentlength', type=int, default=400, help='Minimum sequence alignment length required for BLAST. For short barcode sequences like ITS2 (ITS1) sequences, minalignmentlength should be set to smaller, 50 for instance.')
 parser.add_argument('-o','--out', default="dnabarcoder", help='The output folder.')
 parser.add_argument('-prefix','--prefix', help='the prefix of output filenames')
-
-args=parser.parse_args()
-testdataset= args.input
-traindataset = args.reference
-mincoverage = args.minalignmentlength
-
-prefix=args.prefix
-outputpath=args.out
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)
+parser.add_argument('-blastcache','--blastcache', default="", help='The folder to cache the BLAST results for the next runs. If blastcache=="", the BLAST results are not cached.')
+parser.add_argument('-blastcachesize','--blastcachesize', type=int, default=10000, help='The maximum size in MB of the BLAST cache. The least recently used results are removed first.')
+parser.add_argument('-refindex','--refindex', default="", help='The folder of the BLAST databases of the references, which are rebuilt only when the references change. By default it is the folder refindex in the output folder.')
+
+def ParseArguments(argv=None):
+	global args,testdataset,traindataset,mincoverage,prefix,outputpath,blastcache,refindexpath
+	args=parser.parse_args(argv)
+	testdataset= args.input
+	traindataset = args.reference
+	mincoverage = args.minalignmentlength
+	prefix=args.prefix
+	outputpath=args.out
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
+	blastcache=None
+	if args.blastcache!="":
+		blastcache=BlastCache(args.blastcache,args.blastcachesize*1024*1024)
+	refindexpath=args.refindex
+	if refindexpath=="":
+		refindexpath=outputpath + "/refindex"
 
 def GetBase(filename):
 	return filename[:-(len(filename)-filename.rindex("."))]
@@ -85,53 +100,36 @@ def ComputeBestBLASTscore(query,reference,mincoverage):
 	bestcoveragelist =[0] * len(queryrecords)
 	bestrefidlist = [""] * len(queryrecords)
 
-	#blast
-	#dbfilename="db.nsq"
-	db= reference[:-(len(reference)-reference.rindex("."))]  + ".blastdb"
-	#print(db)
-	#blastoutput="out.txt"
-	blastoutput=query[:-(len(query)-query.rindex("."))] + "." + os.path.basename(reference)[:-(len(os.path.basename(reference))-os.path.basename(reference).rindex("."))] + ".blastoutput"
-	#print(blastoutput)
-	if not os.path.exists(db + ".nsq"):
-		makedbcommand = "makeblastdb -in " + reference + " -dbtype \'nucl\' " +  " -out " + db
-		print(makedbcommand)
-		os.system(makedbcommand)
-	else:
-		print("The existing BLAST db " + db + " is used. If you wish to remake it, please delete the files " + db + ".*." )
-	#for short read
-	blastcommand = "blastn -query " + indexed_query + " -db  " + db + " -task blastn-short -outfmt 6 -out " + blastoutput + " -num_threads " + str(nproc)
-	#for long read
+	task="blastn-short"
 	if mincoverage >=400:
-		blastcommand = "blastn -query " + indexed_query + " -db  " + db + " -outfmt 6 -out " + blastoutput + " -num_threads " + str(nproc)
-	print(blastcommand)	
-	os.system(blastcommand)
-	
-	#read blast output
-	blastoutputfile = open(blastoutput)
-	refid = ""
-	score=0
-	queryid=""
-	for line in blastoutputfile:
-		words = line.split("\t")
-		queryid=words[0]
-		pos1 = int(words[6])
-		pos2 = int(words[7])
-		iden = float(words[2]) 
-		sim=float(iden)/100
-		coverage=abs(pos2-pos1)
-		refid=words[1]
-		score=sim
-		if coverage < mincoverage:
-				score=float(score * coverage)/mincoverage
-		i = int(queryid.split("|")[0])		
-		#if score > bestscorelist[i]:
-		if score > bestscorelist[i] or (score == bestscorelist[i] and coverage > bestcoveragelist[i]):	
-			bestscorelist[i]= score
-			bestrefidlist[i]=refid
-			bestsimlist[i]=sim
-			bestcoveragelist[i]=coverage
+		task="megablast"
+	hits=None
+	if blastcache!=None:
+		#the hits are cached under the indexed ids i|id, so that the queries with the same id are kept apart
+		hits=blastcache.Load(queryrecords,SeqIO.parse(reference, "fasta"),task)
+		if hits!=None:
+			print("The BLAST results of " + query + " against " + reference + " are loaded from the cache " + args.blastcache + ".")
+	if hits==None:
+		#blast, the query ids are indexed as i|id. The output of a failed run is incomplete, so it is neither used nor cached
+		try:
+			db=ReferenceIndex(refindexpath).GetDb(reference)
+			hits=ReadBlastLines(RunBlastn(indexed_query,db,task,nproc))
+		except BlastError as e:
+			os.system("rm " + indexed_query)
+			print("Cannot compare " + query + " with " + reference + ". " + str(e))
+			sys.exit(1)
+		if blastcache!=None:
+			blastcache.Save(queryrecords,SeqIO.parse(reference, "fasta"),task,hits)
+	with profiling.Stage("assignment",sequences=len(queryrecords),hits=len(hits)):
+		for queryid,refid,score,sim,coverage in hits.Hits(mincoverage):
+			i = int(queryid.split("|")[0])
+			#if score > bestscorelist[i]:
+			if score > bestscorelist[i] or (score == bestscorelist[i] and coverage > bestcoveragelist[i]):	
+				bestscorelist[i]= score
+				bestrefidlist[i]=refid
+				bestsimlist[i]=sim
+				bestcoveragelist[i]=coverage
 	os.system("rm " + indexed_query)		
-	os.system("rm " + blastoutput)
 	return bestrefidlist,bestscorelist,bestsimlist,bestcoveragelist
 
 def SavePrediction(testseqIDs,bestscorelist,bestsimlist,bestcoveragelist,bestrefidlist,outputname):
@@ -146,27 +144,35 @@ def SavePrediction(testseqIDs,bestscorelist,bestsimlist,bestcoveragelist,bestref
 ##############################################################################
 # MAIN
 ##############################################################################
-path=sys.argv[0]
-path=path[:-(len(path)-path.rindex("/")-1)]
-
-#load ref seq records
-refseqrecords = SeqIO.to_dict(SeqIO.parse(traindataset, "fasta"))
-
-#load test seq records
-testseqrecords = SeqIO.to_dict(SeqIO.parse(testdataset, "fasta"))
-
-#search for a best match of a test sequence in a train dataset
-bestmatchlist,bestscorelist,bestsimlist,bestcoveragelist=ComputeBestBLASTscore(testdataset,traindataset,mincoverage)
-
-#Save prediction by searching 
-if prefix=="" or prefix==None:
-	prefix=GetBase(testdataset)
-	if "/" in prefix:
-		prefix=prefix[prefix.rindex("/")+1:]	
-basename=GetBase(traindataset)
-if "/" in basename:
-	basename=basename[basename.rindex("/")+1:]		
-reportfilename=GetWorkingBase(prefix) + "." + basename + "_BLAST.bestmatch"
-SavePrediction(testseqrecords.keys(),bestscorelist,bestsimlist,bestcoveragelist,bestmatchlist,reportfilename)
-print("The results are saved in file  " + reportfilename)
-
+def main(argv=None):
+	global prefix
+	ParseArguments(argv)
+	path=sys.argv[0]
+	path=path[:-(len(path)-path.rindex("/")-1)]
+
+	with profiling.Stage("fasta load") as stage:
+		#load ref seq records
+		refseqrecords = SeqIO.to_dict(SeqIO.parse(traindataset, "fasta"))
+
+		#load test seq records
+		testseqrecords = SeqIO.to_dict(SeqIO.parse(testdataset, "fasta"))
+		stage.Count(sequences=len(refseqrecords) + len(testseqrecords))
+
+	#search for a best match of a test sequence in a train dataset
+	bestmatchlist,bestscorelist,bestsimlist,bestcoveragelist=ComputeBestBLASTscore(testdataset,traindataset,mincoverage)
+
+	#Save prediction by searching 
+	if prefix=="" or prefix==None:
+		prefix=GetBase(testdataset)
+		if "/" in prefix:
+			prefix=prefix[prefix.rindex("/")+1:]	
+	basename=GetBase(traindataset)
+	if "/" in basename:
+		basename=basename[basename.rindex("/")+1:]		
+	reportfilename=GetWorkingBase(prefix) + "." + basename + "_BLAST.bestmatch"
+	with profiling.Stage("output writing"):
+		SavePrediction(testseqrecords.keys(),bestscorelist,bestsimlist,bestcoveragelist,bestmatchlist,reportfilename)
+	print("The results are saved in file  " + reportfilename)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# FILE: serve.py
+# CREATE DATE: 18 oct 2026
+import sys
+import os, argparse
+import json
+import time
+import queue
+import threading
+import tempfile
+from io import StringIO
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+from Bio import SeqIO
+import multiprocessing
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.blast import RunBlastn,ReadBlastLines
+from lib.refindex import ReferenceIndex
+import classify
+
+nproc=multiprocessing.cpu_count()
+
+parser=argparse.ArgumentParser(prog='serve.py',
+							   usage="%(prog)s [options] -r referencefastafile -c classificationfile -cutoffs cutoffsfile",
+							   description='''Script that keeps the reference sequences, their classification, the cut-offs and the BLAST database loaded, and searches and classifies the sequences sent to it over HTTP. The sequences of the requests arriving together are compared to the references in one BLAST run.''',
+							   epilog="""Written by Duong Vu duong.t.vu@gmail.com""",
+   )
+
+parser.add_argument('-r','--reference', required=True, help='the reference fasta file.')
+parser.add_argument('-c','--classification', default="", help='the classification file of the references in tab. format. If it is not given, the classification is taken from the sequence headers of the references.')
+parser.add_argument('-cutoffs','--cutoffs', default="", help='The json file containing the local cutoffs to assign the sequences to the predicted taxa.')
+parser.add_argument('-cutoff','--globalcutoff', type=float, default=-1,help='The global cutoff to assign the sequences to predicted taxa. If the cutoffs file is not given, this value will be taken for sequence assignment.')
+parser.add_argument('-confidence','--globalconfidence', type=float,default=-1,help='The global confidence to assign the sequences to predicted taxa')
+parser.add_argument('-rank','--classificationrank', default="", help='the classification rank')
+parser.add_argument('-minseqno','--minseqno', type=int, default=0, help='the minimum number of sequences for using the predicted cut-offs to assign sequences. Only needed when the cutoffs file is given.')
+parser.add_argument('-mingroupno','--mingroupno', type=int, default=0, help='the minimum number of groups for using the predicted cut-offs to assign sequences. Only needed when the cutoffs file is given.')
+parser.add_argument('-ml','--minalignmentlength', type=int, default=400, help='Minimum sequence alignment length required for BLAST. For short barcode sequences like ITS2 (ITS1) sequences, minalignmentlength should be set to smaller, 50 for instance.')
+parser.add_argument('-saveclassifiedonly','--saveclassifiedonly',default=False, help='The option to return all (False) or only classified sequences (True) in the classification.')
+parser.add_argument('-idcolumnname','--idcolumnname',default="ID", help='the column name of sequence id in the classification file.')
+parser.add_argument('-o','--out', default="dnabarcoder", help='The output folder.')
+parser.add_argument('-refindex','--refindex', default="", help='The folder of the BLAST databases of the references, which are rebuilt only when the references change. By default it is the folder refindex in the output folder.')
+parser.add_argument('-host','--host', default="127.0.0.1", help='The address the service listens to. By default only local requests are accepted.')
+parser.add_argument('-port','--port', type=int, default=8642, help='The port the service listens to.')
+parser.add_argument('-batchwindow','--batchwindow', type=float, default=0.5, help='The time in seconds to wait for more requests after a request arrives, so that their sequences are compared to the references in one BLAST run.')
+parser.add_argument('-batchsize','--batchsize', type=int, default=10000, help='The maximum number of sequences compared to the references in one BLAST run, unless a single request has more.')
+
+def ParseArguments(argv=None):
+	global args,referencefastafilename,mincoverage,outputpath,refindexpath
+	args=parser.parse_args(argv)
+	referencefastafilename=args.reference
+	mincoverage=args.minalignmentlength
+	outputpath=args.out
+	refindexpath=args.refindex
+	if refindexpath=="":
+		refindexpath=outputpath + "/refindex"
+	#the options of the classification are given to classify, the sequences to classify are given by the requests
+	classifyarguments=["-i","-","-r",referencefastafilename,"-c",args.classification,"-cutoffs",args.cutoffs,"-cutoff",str(args.globalcutoff),"-confidence",str(args.globalconfidence),"-rank",args.classificationrank,"-minseqno",str(args.minseqno),"-mingroupno",str(args.mingroupno),"-ml",str(mincoverage),"-idcolumnname",args.idcolumnname,"-o",outputpath]
+	if args.saveclassifiedonly!=False:
+		classifyarguments=classifyarguments + ["-saveclassifiedonly",args.saveclassifiedonly]
+	classify.ParseArguments(classifyarguments)
+
+requestqueue=queue.Queue()
+assignlock=threading.Lock()
+refclassificationdict={}
+taxonomy={}
+cutofftable={}
+db=""
+task=""
+
+def SearchRequests(requests):
+	#compare the sequences of the requests to the references in one BLAST run, the sequences are named k|i for the
+	#sequence i of the request k so that the same names in different requests are kept apart
+	queryfile,queryfilename=tempfile.mkstemp(prefix="serve.",suffix=".fasta",dir=outputpath)
+	try:
+		with os.fdopen(queryfile,"w") as fastafile:
+			k=0
+			for request in requests:
+				i=0
+				for seqrecord in request["seqrecords"]:
+					fastafile.write(">" + str(k) + "|" + str(i) + "\n" + str(seqrecord.seq) + "\n")
+					i=i+1
+				k=k+1
+		hits=ReadBlastLines(RunBlastn(queryfilename,db,task,nproc))
+	finally:
+		os.remove(queryfilename)
+	for request in requests:
+		request["bestmatches"]=[["",0,0,0] for seqrecord in request["seqrecords"]]
+	for queryid,refid,score,sim,coverage in hits.Hits(mincoverage):
+		k,i=queryid.split("|")
+		bestmatch=requests[int(k)]["bestmatches"][int(i)]
+		if score > bestmatch[1] or (score == bestmatch[1] and coverage > bestmatch[3]):
+			bestmatch[0]=refid
+			bestmatch[1]=score
+			bestmatch[2]=sim
+			bestmatch[3]=coverage
+
+def SearchBatches():
+	#Take the waiting requests, up to batchsize sequences or those arriving within batchwindow seconds after the
+	#first of them, and search for the best matches of their sequences together.
+	while True:
+		requests=[requestqueue.get()]
+		seqno=len(requests[0]["seqrecords"])
+		endtime=time.time() + args.batchwindow
+		while seqno < args.batchsize:
+			timeout=endtime - time.time()
+			if timeout <= 0:
+				break
+			try:
+				request=requestqueue.get(timeout=timeout)
+			except queue.Empty:
+				break
+			requests.append(request)
+			seqno=seqno + len(request["seqrecords"])
+		print("Searching for the best matches of " + str(seqno) + " sequences of " + str(len(requests)) + " requests..")
+		try:
+			SearchRequests(requests)
+		except Exception as e:
+			for request in requests:
+				request["error"]=str(e)
+		for request in requests:
+			request["done"].set()
+
+def Search(seqrecords):
+	#the best matches of the sequences as [refid,score,sim,coverage], when the batch of the request is searched
+	request={"seqrecords":seqrecords,"bestmatches":None,"error":"","done":threading.Event()}
+	requestqueue.put(request)
+	request["done"].wait()
+	if request["error"]!="":
+		raise RuntimeError(request["error"])
+	return request["bestmatches"]
+
+def FormatBestMatches(seqrecords,bestmatches):
+	#as the output of search
+	output=StringIO()
+	output.write("ID\tReferenceID\tBLAST score\tBLAST sim\tBLAST coverage\n")
+	for seqrecord,bestmatch in zip(seqrecords,bestmatches):
+		refid,score,sim,coverage=bestmatch
+		output.write(seqrecord.id + "\t"  + refid + "\t" +  str(score) + "\t" + str(sim) + "\t" + str(coverage) +"\n")
+	return output.getvalue()
+
+def FormatClassification(seqrecords,bestmatches):
+	#as the output of classify for the best matches given by search
+	bestmatchdict={}
+	for seqrecord,bestmatch in zip(seqrecords,bestmatches):
+		refid,score,sim,coverage=bestmatch
+		bestmatchdict.setdefault(seqrecord.id,{})
+		bestmatchdict[seqrecord.id]["refid"]=refid
+		bestmatchdict[seqrecord.id]["score"]=float(score)
+		bestmatchdict[seqrecord.id]["sim"]=float(sim)
+		bestmatchdict[seqrecord.id]["alignmentlength"]=float(coverage)
+	output=StringIO()
+	output.write("ID\tGiven label\tPrediction\tFull classification\tRank\tCut-off\tConfidence\tReferenceID\tBLAST score\tBLAST sim\tBLAST coverage\n")
+	with assignlock:
+		classify.AssignChunk(refclassificationdict,taxonomy,bestmatchdict,output,StringIO(),cutofftable)
+	return output.getvalue()
+
+class RequestHandler(BaseHTTPRequestHandler):
+	#POST /search or /classify with the sequences in fasta format, GET /status
+	def SendText(self,code,text,contenttype="text/plain"):
+		data=text.encode()
+		self.send_response(code)
+		self.send_header("Content-Type",contenttype + "; charset=utf-8")
+		self.send_header("Content-Length",str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def do_GET(self):
+		if self.path.split("?")[0]!="/status":
+			self.SendText(404,"Unknown path " + self.path + ".\n")
+			return
+		status={"reference":referencefastafilename,"db":db,"classified reference sequences":len(refclassificationdict),"taxa":len(taxonomy),"waiting requests":requestqueue.qsize()}
+		self.SendText(200,json.dumps(status,indent=2) + "\n","application/json")
+
+	def do_POST(self):
+		path=self.path.split("?")[0]
+		if path!="/search" and path!="/classify":
+			self.SendText(404,"Unknown path " + self.path + ".\n")
+			return
+		length=int(self.headers.get("Content-Length",0))
+		try:
+			seqrecords=list(SeqIO.parse(StringIO(self.rfile.read(length).decode()),"fasta"))
+		except ValueError:
+			seqrecords=[]
+		if len(seqrecords)==0:
+			self.SendText(400,"No sequences in fasta format are given.\n")
+			return
+		try:
+			bestmatches=Search(seqrecords)
+		except RuntimeError as e:
+			self.SendText(500,"The sequences could not be searched: " + str(e) + "\n")
+			return
+		if path=="/search":
+			self.SendText(200,FormatBestMatches(seqrecords,bestmatches),"text/tab-separated-values")
+		else:
+			self.SendText(200,FormatClassification(seqrecords,bestmatches),"text/tab-separated-values")
+
+def main(argv=None):
+	global refclassificationdict,taxonomy,db,task
+	ParseArguments(argv)
+	print("Loading the classification of the references..")
+	refclassificationdict,taxonomy=classify.LoadTaxonomy()
+	if taxonomy==None:
+		sys.exit()
+	db=ReferenceIndex(refindexpath).GetDb(referencefastafilename)
+	task="blastn-short"
+	if mincoverage >=400:
+		task="megablast"
+	threading.Thread(target=SearchBatches,daemon=True).start()
+	server=ThreadingHTTPServer((args.host,args.port),RequestHandler)
+	print("The service is running at http://" + args.host + ":" + str(args.port) + ". The sequences in fasta format are searched by POST /search and classified by POST /classify.")
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
+
+if __name__ == "__main__":
+	main()
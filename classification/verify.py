@@ -16,12 +16,16 @@ import json
 #from sklearn.metrics import accuracy_score
 #import json
 from Bio import SeqIO
-from Bio import Phylo
 #import pylab
-import matplotlib.pyplot as plt
-plt.rc('font',size=4)
 import random
 import multiprocessing
+import tempfile
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.blast import ReadBlastLines,RunBlastn
+from lib.blastcache import BlastCache,GetSeqDigests,GetKey
+from lib import profiling
+from lib.refindex import ReferenceIndex
+from lib.jobs import JobScheduler
 nproc=multiprocessing.cpu_count()
 
 parser=argparse.ArgumentParser(prog='verify.py',  
@@ -52,31 +56,48 @@ parser.add_argument('-minseqno','--minseqno', type=int, default=0, help='the min
 parser.add_argument('-mingroupno','--mingroupno', type=int, default=0, help='the minimum number of groups for using the predicted cut-offs to assign sequences. Only needed when the cutoffs file is given.')
 parser.add_argument('-minproba','--minproba', type=float, default=0, help='The minimum probability for verifying the classification results.')
 parser.add_argument('-ml','--minalignmentlength', type=int, default=400, help='Minimum sequence alignment length required for BLAST. For short barcode sequences like ITS2 (ITS1) sequences, minalignmentlength should probably be set to smaller, 50 for instance.')
+parser.add_argument('-blastcache','--blastcache', default="", help='The folder to cache the BLAST results for the next runs. If blastcache=="", the BLAST results are not cached.')
+parser.add_argument('-blastcachesize','--blastcachesize', type=int, default=10000, help='The maximum size in MB of the BLAST cache. The least recently used results are removed first.')
+parser.add_argument('-refindex','--refindex', default="", help='The folder of the BLAST databases of the reference sequences of the taxa, which are reused between the sequences and the runs. By default it is the folder refindex in the output folder.')
+parser.add_argument('-ncpus','--ncpus', type=int, default=1, help='The number of processes to compare the sequences to the reference sequences of their predicted taxa in parallel, and the maximum number of threads used by the alignments and trees running at the same time.')
+parser.add_argument('-treemode','--treemode', default="sequence", help='The trees made for the verification based on trees: sequence for one tree of each sequence with the reference sequences of its predicted taxon, or taxon for one tree of each predicted taxon, made by adding all the sequences predicted to the taxon to the alignment of its reference sequences.')
+parser.add_argument('-alignmentthreads','--alignmentthreads', type=int, default=1, help='The number of threads of each alignment made by mafft or clustalo.')
+parser.add_argument('-treethreads','--treethreads', type=int, default=1, help='The number of threads of each tree made by iqtree.')
 parser.add_argument('-alignmentmethod','--alignmentmethod',default="mafft", help='the alignment method: mafft or clustalo.')
 parser.add_argument('-saveverifiedonly','--saveverifiedonly',default="yes", help='The option to save only verified sequences (yes) or all (no) in the classification output.')
 parser.add_argument('-method','--method', default="cutoff", help='The methods (cutoff,tree) based on the similarity cutoffs or phylogenic trees for the verification of classification.')
 parser.add_argument('-seqid','--sequenceid', default="", help='If the sequence id is given, then only classification of this sequence is verified. Otherwise all classifications are verified.')
 
 
-args=parser.parse_args()
-predictionfilename=args.input
-fastafilename= args.fasta
-referencefastafilename= args.reference
-classificationfilename=args.classification
-maxseqno=args.maxseqno
-mincoverage = args.minalignmentlength
-prefix=args.prefix
-verifyingrank=args.classificationrank
-minproba=args.minproba
-method=args.method
-globalcutoff=args.globalcutoff
-globalconfidence=args.globalconfidence
-cutoffsfilename=args.cutoffs
-outputpath=args.out
-
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)
-nproc=multiprocessing.cpu_count()
+def ParseArguments(argv=None):
+	global args,predictionfilename,fastafilename,referencefastafilename,classificationfilename,maxseqno,mincoverage,prefix,verifyingrank,minproba,method,globalcutoff,globalconfidence,cutoffsfilename,outputpath,nproc,blastcache,refindexpath,refindex,selectedsequences
+	args=parser.parse_args(argv)
+	predictionfilename=args.input
+	fastafilename= args.fasta
+	referencefastafilename= args.reference
+	classificationfilename=args.classification
+	maxseqno=args.maxseqno
+	mincoverage = args.minalignmentlength
+	prefix=args.prefix
+	verifyingrank=args.classificationrank
+	minproba=args.minproba
+	method=args.method
+	globalcutoff=args.globalcutoff
+	globalconfidence=args.globalconfidence
+	cutoffsfilename=args.cutoffs
+	outputpath=args.out
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
+	nproc=multiprocessing.cpu_count()
+	blastcache=None
+	if args.blastcache!="":
+		blastcache=BlastCache(args.blastcache,args.blastcachesize*1024*1024)
+	refindexpath=args.refindex
+	if refindexpath=="":
+		refindexpath=outputpath + "/refindex"
+	refindex=ReferenceIndex(refindexpath)
+	#the reference sequences selected for each taxon
+	selectedsequences={}
 
 def GetBase(filename):
 	return filename[:-(len(filename)-filename.rindex("."))]
@@ -473,22 +494,31 @@ def lookup_by_names(tree):
 	return names
 
 def verifyBasedOnBranchLengths(seqid,treefilename):
+	from Bio import Phylo
 	tree = Phylo.read(treefilename, "newick")
 	names = lookup_by_names(tree)
+	return VerifyBasedOnBranchLengthsOfNames(seqid,names,[])
+
+def VerifyBasedOnBranchLengthsOfNames(seqid,names,excludedids):
+	#the branch length of seqid is compared to those of the other sequences of the tree except the excluded ones
 	max_length=0
 	length=0
 	average=0
 	n=0
+	m=0
 	for name in names:
 		clade=names[name]
 		if name==seqid:
 			length=clade.branch_length
+		elif name in excludedids:
+			continue
 		else:
 			average=average + clade.branch_length
 			n=n+1
 			if clade.branch_length > max_length:
 				max_length=clade.branch_length
-	verified=(length<=max_length) and (len(names) >=3)
+		m=m+1
+	verified=(length<=max_length) and (m >=3)
 	if n>0:
 		average=round(average/n,2)
 	return verified,length,max_length,average
@@ -496,6 +526,9 @@ def verifyBasedOnBranchLengths(seqid,treefilename):
 def PrintTree(treefilename,redo):
 	figfilename=treefilename + ".png"
 	if (not os.path.exists(figfilename)) or redo!="":
+		from Bio import Phylo
+		import matplotlib.pyplot as plt
+		plt.rc('font',size=4)
 		tree = Phylo.read(treefilename, "newick")
 		Phylo.draw(tree,do_show=False)	
 		#Phylo.draw_ascii(tree,do_show=False)	
@@ -504,34 +537,52 @@ def PrintTree(treefilename,redo):
 		plt.savefig(figfilename,dpi=500,bbox_inches='tight')
 		print("A figure of the tree in png format is saved in  file " + figfilename + ".")	
 
-def CreateAlignment(fastafilename,alignmentmethod):
-	alignmentfilename=GetBase(fastafilename) +"." + alignmentmethod + ".aligned.fas"
-	#make the alignment
-	command=""
-	if not os.path.exists(alignmentfilename):
-		if alignmentmethod.lower()=="clustalo":
-			command="clustalo -i " + fastafilename + " -o " + alignmentfilename
-		else:
-			command="mafft " + fastafilename + " > " + alignmentfilename
-		print(command)
-		os.system(command)
-	return alignmentfilename
+def GetAlignmentCommand(fastafilename,alignmentfilename,alignmentmethod):
+	if alignmentmethod.lower()=="clustalo":
+		command="clustalo -i " + fastafilename + " -o " + alignmentfilename
+		if args.alignmentthreads > 1:
+			command=command + " --threads=" + str(args.alignmentthreads)
+	else:
+		command="mafft " + fastafilename + " > " + alignmentfilename
+		if args.alignmentthreads > 1:
+			command="mafft --thread " + str(args.alignmentthreads) + " " + fastafilename + " > " + alignmentfilename
+	return command
 
-def CreateTree(fastafilename,alignmentmethod,redo):
-	alignmentfilename = CreateAlignment(fastafilename,alignmentmethod)
+def GetTreeStep(alignmentfilename,redo):
+	#the command making the tree of the alignment and the tree file name. The tree is remade if redo!=""
 	treefilename= alignmentfilename + ".treefile"
-	if (not os.path.exists(treefilename)) or redo!="":
-		#make tree
-		command="iqtree -pers 0.2 -n 500 -s " + alignmentfilename
-		if redo !="":
-			command = "iqtree -pers 0.2 -n 500 -s " + alignmentfilename + " -redo"
-		#command="iqtree -s " + alignmentfilename
-		os.system(command)
-		print("A iq-tree in newick format is saved in file " + treefilename + ".")	
-	#print tree
-	if args.savefig=="yes":
-		PrintTree(treefilename,redo)
-	return treefilename	
+	command="iqtree -pers 0.2 -n 500 -s " + alignmentfilename
+	if redo !="":
+		command = "iqtree -pers 0.2 -n 500 -s " + alignmentfilename + " -redo"
+	if args.treethreads > 1:
+		command=command + " -nt " + str(args.treethreads)
+	return (command,args.treethreads,treefilename),treefilename
+
+def GetTreeSteps(fastafilename,alignmentmethod,redo):
+	#the commands making the alignment and the tree of the fasta file, and the tree file name.
+	#The alignment is not remade if it exists, unless redo!="" as the fasta file is then made again
+	alignmentfilename=GetBase(fastafilename) +"." + alignmentmethod + ".aligned.fas"
+	treestep,treefilename=GetTreeStep(alignmentfilename,redo)
+	steps=[(GetAlignmentCommand(fastafilename,alignmentfilename,alignmentmethod),args.alignmentthreads,alignmentfilename),treestep]
+	return steps,treefilename
+
+def GetTaxonTreeSteps(reffastafilename,queryfastafilename,alignmentmethod,redo):
+	#the commands aligning the reference sequences of a taxon, adding the sequences predicted to the taxon
+	#to the alignment and making the tree, and the tree file name. The alignments are remade if redo!="", as the fasta
+	#file of the reference sequences may then have been sampled again
+	refalignmentfilename=GetBase(reffastafilename) +"." + alignmentmethod + ".aligned.fas"
+	alignmentfilename=GetBase(queryfastafilename) +"." + alignmentmethod + ".aligned.fas"
+	if alignmentmethod.lower()=="clustalo":
+		command="clustalo -i " + queryfastafilename + " --profile1 " + refalignmentfilename + " -o " + alignmentfilename
+		if args.alignmentthreads > 1:
+			command=command + " --threads=" + str(args.alignmentthreads)
+	else:
+		command="mafft --add " + queryfastafilename + " " + refalignmentfilename + " > " + alignmentfilename
+		if args.alignmentthreads > 1:
+			command="mafft --thread " + str(args.alignmentthreads) + " --add " + queryfastafilename + " " + refalignmentfilename + " > " + alignmentfilename
+	treestep,treefilename=GetTreeStep(alignmentfilename,redo)
+	steps=[(GetAlignmentCommand(reffastafilename,refalignmentfilename,alignmentmethod),args.alignmentthreads,refalignmentfilename),(command,args.alignmentthreads,alignmentfilename),treestep]
+	return steps,treefilename
 
 def CreateFastaFileForTrees(seqrecord,taxonname,sequences,maxseqno,redo):
 	if not os.path.exists(outputpath + "/verification"):
@@ -564,32 +615,54 @@ def CreateFastaFileForTrees(seqrecord,taxonname,sequences,maxseqno,redo):
 			newfastafilename=""
 	return newfastafilename,numberofrefsequences
 
-def CreateFastaFileForBLAST(seqrecord,taxonname,sequences,maxseqno):
+def CreateFastaFilesForTaxonTree(testrecords,taxonname,sequences,maxseqno,redo):
+	#The fasta file of the reference sequences of the taxon, which is kept for the next runs unless redo!="",
+	#and the fasta file of the sequences predicted to the taxon, named by their content.
 	if not os.path.exists(outputpath + "/verification"):
 		os.system("mkdir " + outputpath + "/verification")
 	if sys.version_info[0] < 3:
 		taxonname=unicode(taxonname,errors='ignore')
-	newfastafilename=""
-	numberofrefsequences=0
-	newfastafilename=outputpath + "/verification/" + taxonname.replace("|","_").replace(" ","_") + ".fasta"
-	if not os.path.exists(newfastafilename):
+	base=outputpath + "/verification/" + taxonname.replace("|","_").replace(" ","_")
+	reffastafilename=base + ".fasta"
+	if os.path.exists(reffastafilename) and redo=="":
+		seqrecords=list(SeqIO.parse(reffastafilename,"fasta"))
+	else:
 		seqrecords=[]
-		numberofrefsequences=len(sequences.keys())
 		if (maxseqno >0) and (len(sequences) > maxseqno):
-				#select randomly 100 sequences to compare
+			#select randomly maxseqno sequences to compare
 			selectedlist=random.sample(range(0, len(sequences)), k=maxseqno)
 			seqids=list(sequences.keys())
 			for i in selectedlist:
-				sequenceid=seqids[i]
-				seqrecords.append(sequences[sequenceid])
+				seqrecords.append(sequences[seqids[i]])
 		else:	
 			for sequenceid in sequences.keys():
 				seqrecords.append(sequences[sequenceid])
-	if len(seqrecords) >=1:			
-		SeqIO.write(seqrecords,newfastafilename,"fasta")
-	else:
-		newfastafilename=""			
-	return newfastafilename,numberofrefsequences
+		if len(seqrecords) >=2:#only make tree of more than 3 sequences
+			SeqIO.write(seqrecords,reffastafilename,"fasta")
+	if len(seqrecords) < 2:
+		return "","",len(seqrecords)
+	queryfastafilename=base + ".queries." + GetKey(GetSeqDigests(testrecords))[:10] + ".fasta"
+	if not os.path.exists(queryfastafilename) or redo!="":
+		SeqIO.write(testrecords,queryfastafilename,"fasta")
+	return reffastafilename,queryfastafilename,len(seqrecords)
+
+def SelectSequencesForBLAST(taxonname,sequences,maxseqno):
+	#the reference sequences of the taxon to be compared, selected once so that the BLAST database of the taxon is reused
+	if taxonname in selectedsequences.keys():
+		return selectedsequences[taxonname]
+	seqrecords=[]
+	if (maxseqno >0) and (len(sequences) > maxseqno):
+		#select randomly maxseqno sequences to compare
+		selectedlist=random.sample(range(0, len(sequences)), k=maxseqno)
+		seqids=list(sequences.keys())
+		for i in selectedlist:
+			sequenceid=seqids[i]
+			seqrecords.append(sequences[sequenceid])
+	else:	
+		for sequenceid in sequences.keys():
+			seqrecords.append(sequences[sequenceid])
+	selectedsequences[taxonname]=seqrecords
+	return seqrecords
 
 # def GetLevel(rank):
 # 	level=-1
@@ -766,62 +839,90 @@ def AddCutoffsToTaxonomy(taxonomy,cutoff,confidence,cutoffs):
 			taxonomy[taxonname]["cut-off"]=cutoff
 			taxonomy[taxonname]["confidence"]=confidence
 
-def ComputeBestLocalBLASTScore(testrecord,reffilename,mincoverage):
-	#Create fasta file of the test record 
-	queryname=testrecord.id + "." + "fasta"
-	if "|" in testrecord.id:
-		queryname=testrecord.id.split("|")[0] + "." + "fasta"
-	SeqIO.write(testrecord, queryname , "fasta")
-	#Create fasta file of predictedname
-	if reffilename=="":
-		return "",0,0,0
-	#Blast the test record to fastafilename:
-	#makedbcommand = "makeblastdb -in " + refname + " -dbtype \'nucl\' " +  " -out db"
-	#os.system(makedbcommand)
-	blastoutput = testrecord.id 
-	if "|" in testrecord.id:
-		blastoutput=blastoutput.split("|")[0]
-	#blast
-	makedbcommand = "makeblastdb -in " + reffilename + " -dbtype \'nucl\' " +  " -out db"
-	os.system(makedbcommand)
-	
-	blastoutput= blastoutput + ".blast.out"
-	#blastcommand = "blastn -query " + queryname + " -db  db -outfmt 6 -out " + blastoutput
-	blastcommand = "blastn -query " + queryname + " -db  db -task blastn-short -outfmt 6 -out " + blastoutput + " -num_threads " + str(nproc)
-	#for long read
+def ComputeBestLocalBLASTScores(testrecords,refrecords,mincoverage,cleanup=True):
+	#compare all the test records predicted to a taxon to the reference sequences of the taxon in one BLAST run,
+	#and return the best match of each test record as (refid,score,sim,coverage)
+	if len(refrecords)==0:
+		return {}
+	task="blastn-short"
 	if mincoverage >=300:
-		blastcommand = "blastn -query " + queryname + " -db  db -outfmt 6 -out " + blastoutput + " -num_threads " + str(nproc)
-	os.system(blastcommand)
-	#read output of Blast
-	blastoutputfile = open(blastoutput)
-	bestlocalscore=0
-	bestlocalsim=0
-	bestlocalcoverage=0
-	bestrefid=""
-	for line in blastoutputfile:
-		words = line.split("\t")
-		pos1 = int(words[6])
-		pos2 = int(words[7])
-		iden = float(words[2]) 
-		sim=float(iden)/100
-		coverage=abs(pos2-pos1)
-		refid=words[1]
-		score=sim
-		if coverage < mincoverage:
-				score=float(score * coverage)/mincoverage
+		task="megablast"
+	hits=None
+	if blastcache!=None:
+		hits=blastcache.Load(testrecords,refrecords,task)
+	if hits==None:
+		#Create fasta file of the test records
+		queryfile,queryname=tempfile.mkstemp(prefix="verify.",suffix=".fasta",dir=outputpath)
+		os.close(queryfile)
+		SeqIO.write(testrecords,queryname,"fasta")
+		#Blast the test records to the database of the reference sequences
+		db=refindex.AcquireSubDb(refrecords)
+		try:
+			hits=ReadBlastLines(RunBlastn(queryname,db,task,nproc))
+		finally:
+			refindex.ReleaseSubDb(db,cleanup)
+			os.remove(queryname)
+		if blastcache!=None:
+			blastcache.Save(testrecords,refrecords,task,hits)
+	bestmatches={}
+	for queryid,refid,score,sim,coverage in hits.Hits(mincoverage):
+		bestrefid,bestlocalscore,bestlocalsim,bestlocalcoverage=bestmatches.get(queryid,("",0,0,0))
 		if score > bestlocalscore:
-			bestrefid=refid
-			bestlocalscore=score
-			bestlocalsim=sim
-			bestlocalcoverage=coverage
-	os.system("rm " + blastoutput)
-	os.system("rm " + queryname)
-	return bestrefid,bestlocalscore,bestlocalsim,bestlocalcoverage
+			bestmatches[queryid]=(refid,score,sim,coverage)
+	return bestmatches
+
+def InitWorker(ncpus):
+	#share the cpus for BLAST between the workers
+	global nproc
+	nproc=max(1,int(nproc/ncpus))
+
+def ComputeBestLocalBLASTScoresInWorker(group):
+	testrecords,refrecords=group
+	#the databases are cleaned up when all the workers are done
+	return ComputeBestLocalBLASTScores(testrecords,refrecords,mincoverage,False)
+
+def ComputeBestLocalBLASTScoresOfTaxa(groups,ncpus):
+	#groups: the test records and the reference records of each predicted taxon
+	bestmatches={}
+	if ncpus <= 1 or len(groups) < 2:
+		for testrecords,refrecords in groups:
+			bestmatches.update(ComputeBestLocalBLASTScores(testrecords,refrecords,mincoverage))
+		return bestmatches
+	#the taxa with the most test records are compared first
+	groups=sorted(groups,key=lambda group: len(group[0]),reverse=True)
+	ncpus=min(ncpus,len(groups))
+	pool=multiprocessing.get_context("fork").Pool(ncpus,initializer=InitWorker,initargs=(ncpus,))
+	for result in pool.imap_unordered(ComputeBestLocalBLASTScoresInWorker,groups):
+		bestmatches.update(result)
+	pool.close()
+	pool.join()
+	refindex.Cleanup()
+	return bestmatches
 
 def VerifyBasedOnCutoffs(seqrecords,predictiondict,refclasses,maxseqno,verifyingrank,taxonomy,redo):
 	count=0
 	total=0
-	#create Fasta files
+	#group the sequences to be compared by their predicted taxa
+	testseqids={}
+	for seqid in predictiondict.keys():
+		predictedname=predictiondict[seqid]["predlabel"]
+		rank=predictiondict[seqid]["rank"]
+		sim=predictiondict[seqid]["sim"]
+		score=predictiondict[seqid]["score"]
+		proba=predictiondict[seqid]["proba"]
+		if score==0:
+			score=sim
+		if (verifyingrank=="" or (verifyingrank!="" and rank==verifyingrank)) and (proba >=minproba):
+			if predictedname in refclasses.keys() and seqid in seqrecords.keys():
+				if score==0 or (redo !=""):
+					testseqids.setdefault(predictedname,[])
+					testseqids[predictedname].append(seqid)
+	groups=[]
+	for predictedname in testseqids.keys():
+		refrecords=SelectSequencesForBLAST(predictedname,refclasses[predictedname],maxseqno)
+		if len(refrecords) > 0:
+			groups.append(([seqrecords[seqid] for seqid in testseqids[predictedname]],refrecords))
+	bestmatches=ComputeBestLocalBLASTScoresOfTaxa(groups,args.ncpus)
 	for seqid in predictiondict.keys():
 		predictedname=predictiondict[seqid]["predlabel"]
 		rank=predictiondict[seqid]["rank"]
@@ -838,14 +939,10 @@ def VerifyBasedOnCutoffs(seqrecords,predictiondict,refclasses,maxseqno,verifying
 			#only predict when the tree file name does not exist
 			if predictedname in refclasses.keys() and seqid in seqrecords.keys():
 				total=total+1
-				seqrecord=seqrecords[seqid]
 				if score==0 or (redo !=""):
-					sequences=refclasses[predictedname]
-					reffilename,numberofrefsequences=CreateFastaFileForBLAST(seqrecord,predictedname,sequences,maxseqno)
-					if os.path.exists(reffilename):
-						#compute BLAST score
-						newrefid,newbestscore,newsim,newcoverage=ComputeBestLocalBLASTScore(seqrecord,reffilename,mincoverage)
-						os.system("rm " + reffilename)	
+					numberofrefsequences=len(refclasses[predictedname])
+					if seqid in bestmatches.keys():
+						newrefid,newbestscore,newsim,newcoverage=bestmatches[seqid]
 						if newbestscore > score:
 							refid=newrefid
 							score=newbestscore
@@ -869,10 +966,63 @@ def VerifyBasedOnCutoffs(seqrecords,predictiondict,refclasses,maxseqno,verifying
 	return count,total
 	
 def VerifyBasedOnTrees(seqrecords,predictiondict,refclasses,maxseqno,verifyingrank,alignmentmethod,redo):
+	from Bio import Phylo
 	count=0
 	notree_count=0
 	total=0
-	#create Fasta files
+	#create Fasta files and schedule the alignments and trees
+	scheduler=JobScheduler(args.ncpus)
+	treefilenames={}
+	numbers={}
+	inreference={}
+	#the sequences of each tree
+	treeseqids={}
+	taxonseqids={}
+	for seqid in predictiondict.keys():
+		predictedname=predictiondict[seqid]["predlabel"]
+		rank=predictiondict[seqid]["rank"]
+		proba=predictiondict[seqid]["proba"]
+		if (verifyingrank=="" or (verifyingrank!="" and rank==verifyingrank)) and (proba >=minproba):
+			if (predictedname in refclasses.keys()) and (seqid in seqrecords.keys()):
+				if predictiondict[seqid]["treefilename"]=="" or (redo !=""):
+					sequences=refclasses[predictedname]
+					if seqid in sequences.keys():
+						inreference[seqid]=True
+						print("The sequence " + seqid + " is in the reference file. No verification needed.")
+					elif args.treemode=="taxon":
+						taxonseqids.setdefault(predictedname,[])
+						taxonseqids[predictedname].append(seqid)
+					else:
+						treefastafilename,numbers[seqid]=CreateFastaFileForTrees(seqrecords[seqid],predictedname,sequences,maxseqno,redo)
+						if os.path.exists(treefastafilename):
+							steps,treefilenames[seqid]=GetTreeSteps(treefastafilename,alignmentmethod,redo)
+							scheduler.AddChain(treefilenames[seqid],steps,redo!="")
+							treeseqids[treefilenames[seqid]]=[seqid]
+	for predictedname in taxonseqids.keys():
+		seqids=taxonseqids[predictedname]
+		reffastafilename,queryfastafilename,numberofrefsequences=CreateFastaFilesForTaxonTree([seqrecords[seqid] for seqid in seqids],predictedname,refclasses[predictedname],maxseqno,redo)
+		for seqid in seqids:
+			#counted with the sequence itself, as in the tree of a single sequence
+			numbers[seqid]=numberofrefsequences + 1
+		if os.path.exists(queryfastafilename):
+			steps,treefilename=GetTaxonTreeSteps(reffastafilename,queryfastafilename,alignmentmethod,redo)
+			scheduler.AddChain(treefilename,steps,redo!="")
+			treeseqids[treefilename]=seqids
+			for seqid in seqids:
+				treefilenames[seqid]=treefilename
+	#the branch lengths are read as the trees are finished
+	results={}
+	def ReadTree(treefilename):
+		if not os.path.exists(treefilename):
+			return
+		print("A iq-tree in newick format is saved in file " + treefilename + ".")	
+		if args.savefig=="yes":
+			PrintTree(treefilename,redo)
+		names=lookup_by_names(Phylo.read(treefilename, "newick"))
+		#the other sequences added to the tree of a taxon are not compared
+		for seqid in treeseqids[treefilename]:
+			results[seqid]=VerifyBasedOnBranchLengthsOfNames(seqid,names,treeseqids[treefilename])
+	scheduler.Run(ReadTree)
 	for seqid in predictiondict.keys():
 		predictedname=predictiondict[seqid]["predlabel"]
 		rank=predictiondict[seqid]["rank"]
@@ -889,20 +1039,17 @@ def VerifyBasedOnTrees(seqrecords,predictiondict,refclasses,maxseqno,verifyingra
 			#only predict when the tree file name does not exist
 			if (predictedname in refclasses.keys()) and (seqid in seqrecords.keys()):
 				total=total+1
-				seqrecord=seqrecords[seqid]
 				verified = False
-				if treefilename=="" or (redo !=""):
-					sequences=refclasses[predictedname]
-					if not (seqid in sequences.keys()):
-						treefastafilename,numberofrefsequences=CreateFastaFileForTrees(seqrecord,predictedname,sequences,maxseqno,redo)
-						if os.path.exists(treefastafilename):
-							treefilename= CreateTree(treefastafilename,alignmentmethod,redo)
-					else:
-						verified=True
-						print("The sequence " + seqid + " is in the reference file. No verification needed.")
-				if verified==False:
-					if 	os.path.exists(treefilename):
-						verified,branchlength,maxbranchlength,averagebranchlength=verifyBasedOnBranchLengths(seqid,treefilename)
+				if seqid in numbers.keys():
+					numberofrefsequences=numbers[seqid]
+				if seqid in treefilenames.keys():
+					treefilename=treefilenames[seqid]
+				if seqid in inreference.keys():
+					verified=True
+				elif seqid in results.keys():
+					verified,branchlength,maxbranchlength,averagebranchlength=results[seqid]
+				elif os.path.exists(treefilename):
+					verified,branchlength,maxbranchlength,averagebranchlength=verifyBasedOnBranchLengths(seqid,treefilename)
 				if verified==True:
 					verifiedlabel=predictedname
 					count=count+1
@@ -992,7 +1139,9 @@ def KronaPieCharts(classification,kronareport,kronahtml):
 	os.system(command)
 	if args.display=="yes":
 		os.system("firefox " + kronahtml) 
-if __name__ == "__main__":
+def main(argv=None):
+	global prefix,classificationreportfilename
+	ParseArguments(argv)
 	if prefix=="" or prefix==None:
 		prefix=GetBase(predictionfilename)
 		if "/" in prefix:
@@ -1012,21 +1161,27 @@ if __name__ == "__main__":
 	predictiondict,isError=LoadPrediction(predictionfilename,args.idcolumnname,args.sequenceid)	
 	if isError==True:
 		sys.exit()
-	#load sequences
-	seqrecords={}
-	if os.path.exists(fastafilename):
-		seqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
-	#load reference sequences:	
-	refseqrecords={}
-	if os.path.exists(referencefastafilename):
-		refseqrecords=SeqIO.to_dict(SeqIO.parse(referencefastafilename, "fasta"))
-	refclassificationdict,refclasses,taxonomy,isError= LoadClassification(refseqrecords,classificationfilename,args.idcolumnname)
-	if isError==True or refclasses=={} or refclassificationdict=={}:
-		print("Please check the classification of reference sequences.")
-		sys.exit()
+	with profiling.Stage("fasta load") as stage:
+		#load sequences
+		seqrecords={}
+		if os.path.exists(fastafilename):
+			seqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
+		#load reference sequences:	
+		refseqrecords={}
+		if os.path.exists(referencefastafilename):
+			refseqrecords=SeqIO.to_dict(SeqIO.parse(referencefastafilename, "fasta"))
+		stage.Count(sequences=len(seqrecords) + len(refseqrecords))
+	with profiling.Stage("classification load") as stage:
+		refclassificationdict,refclasses,taxonomy,isError= LoadClassification(refseqrecords,classificationfilename,args.idcolumnname)
+		if isError==True or refclasses=={} or refclassificationdict=={}:
+			print("Please check the classification of reference sequences.")
+			sys.exit()
+		stage.Count(sequences=len(refclassificationdict),clades=len(refclasses))
 	#verifying...	
 	if args.method=="tree":
-		count,notree_count,total=VerifyBasedOnTrees(seqrecords,predictiondict,refclasses,maxseqno,verifyingrank,args.alignmentmethod,args.redo)
+		with profiling.Stage("verification") as stage:
+			count,notree_count,total=VerifyBasedOnTrees(seqrecords,predictiondict,refclasses,maxseqno,verifyingrank,args.alignmentmethod,args.redo)
+			stage.Count(sequences=total)
 		if total >0:
 			print("Number of classified sequences: " + str(total))
 			print("Number of verified sequences: " + str(count) + "(" + str(round(count*100/total,2)) + " %).")
@@ -1041,16 +1196,23 @@ if __name__ == "__main__":
 				cutoffs = json.load(cutoffsfile)
 		#add cutoffs to taxa for sequence identification		
 		AddCutoffsToTaxonomy(taxonomy,globalcutoff,globalconfidence,cutoffs)		
-		count,total=VerifyBasedOnCutoffs(seqrecords,predictiondict,refclasses,maxseqno,verifyingrank,taxonomy,args.redo)
+		with profiling.Stage("verification") as stage:
+			count,total=VerifyBasedOnCutoffs(seqrecords,predictiondict,refclasses,maxseqno,verifyingrank,taxonomy,args.redo)
+			stage.Count(sequences=total)
 		if total >0:
 			print("Number of classified sequences: " + str(total))
 			print("Number of verified sequences: " + str(count) + "(" + str(round(count*100/total,2)) + " %).")
 	#print("The results are saved in file  " + outputname)
-	SaveVerification(predictiondict,outputname,notverifiedoutputname,classificationfilename)
+	with profiling.Stage("output writing"):
+		SaveVerification(predictiondict,outputname,notverifiedoutputname,classificationfilename)
 	print("The results are saved in file  " + outputname + ", " + notverifiedoutputname + " and " + classificationreportfilename + ".")
 	#making krona report
 	kronareport = GetBase(outputname) + ".krona.report"
 	kronahtml=GetBase(kronareport) + ".html"
-	classificationdict= LoadClassificationForKronaReport(outputname)
-	KronaPieCharts(classificationdict,kronareport,kronahtml)
+	with profiling.Stage("plotting"):
+		classificationdict= LoadClassificationForKronaReport(outputname)
+		KronaPieCharts(classificationdict,kronareport,kronahtml)
 	print("The krona report and html are saved in files " + kronareport + " and " + kronahtml + ".") 
+
+if __name__ == "__main__":
+	main()
@@ -26,11 +26,13 @@ parser=argparse.ArgumentParser(prog='visualizeClassification.py',
 parser.add_argument('-i','--input', required=True, help='the assignment/classification file')
 parser.add_argument('-o','--out', default="dnabarcoder", help='The output folder.')
 
-args=parser.parse_args()
-predictionfilename=args.input
-outputpath=args.out
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)
+def ParseArguments(argv=None):
+	global args,predictionfilename,outputpath
+	args=parser.parse_args(argv)
+	predictionfilename=args.input
+	outputpath=args.out
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
 
 def GetBase(filename):
 	return filename[:-(len(filename)-filename.rindex("."))]
@@ -192,10 +194,14 @@ def KronaPieCharts(classification,kronareport,kronahtml):
 	os.system(command)
 	os.system("firefox " + kronahtml) 
 	
-if __name__ == "__main__":
+def main(argv=None):
+	ParseArguments(argv)
 	classificationdict = LoadPrediction(predictionfilename)
 	#making krona report
 	kronareport = GetBase(predictionfilename) + ".krona.report"
 	kronahtml=GetBase(kronareport) + ".html"
 	KronaPieCharts(classificationdict,kronareport,kronahtml)
 	print("The krona report and html are saved in files " + kronareport + " and " + kronahtml + ".") 
+
+if __name__ == "__main__":
+	main()
@@ -5,8 +5,44 @@ Created on Thu Jul  1 15:13:18 2021
 
 @author: duong vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 """
-import sys, os, subprocess, inspect
-path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+import sys, os, importlib
+path = os.path.dirname(os.path.abspath(__file__))
+from lib import profiling
+
+def GetProfileArgument(command, arguments):
+	#remove -profile/--profile and its optional report file name from the arguments
+	profilefilename = ""
+	newarguments = []
+	i = 0
+	while i < len(arguments):
+		if arguments[i] in ["-profile", "--profile"]:
+			profilefilename = command + ".profile.json"
+			if i + 1 < len(arguments) and not arguments[i + 1].startswith("-"):
+				profilefilename = arguments[i + 1]
+				i = i + 1
+		else:
+			newarguments.append(arguments[i])
+		i = i + 1
+	return newarguments, profilefilename
+
+def RunCommand(folder, scriptname, arguments):
+	#the script of the command is imported and its main function is run in this process with the arguments
+	command = sys.argv[1]
+	arguments, profilefilename = GetProfileArgument(command, arguments)
+	scriptpath = os.path.join(path, folder)
+	if not (scriptpath in sys.path):
+		sys.path.insert(0, scriptpath)
+	sys.argv = [os.path.join(scriptpath, scriptname + '.py')] + arguments
+	script = importlib.import_module(scriptname)
+	if profilefilename == "":
+		script.main(arguments)
+		return
+	#the stages of the command are profiled
+	profiling.Enable(command, arguments)
+	try:
+		script.main(arguments)
+	finally:
+		profiling.SaveReport(profilefilename)
 #import lib.library as lib
 
 #git_version = lib.git_version()
@@ -28,6 +64,7 @@ Command:     overview     	             Get an overview of the dataset
              distribute                      Compute sequence distribution
              variation                       Compute sequence variation
              sim                             Compute similarity matrix	                          
+             convert                         Convert a similarity matrix file between the text and binary formats
              visualize                       Visualize the sequences
              tree                            Create a phylogenetic tree of the sequences			 
              cluster                         Cluster the sequences
@@ -37,9 +74,14 @@ Command:     overview     	             Get an overview of the dataset
              remove                          Remove similar sequences of the same complexes based on a give threshold
              search                          Search for best matches of the sequences against a file of reference sequences
              classify                        Classify the sequences to the group of their best match if the score is greater than the given cutoff
+             serve                           Keep the references and cut-offs loaded to search and classify the sequences sent over HTTP
              verify                          Verify the assigned sequences based on the phylogenetic tree branch lengths			 
              krona                           Visualize classification results using Krona
              evaluate                        Compute accuracy for classification results
+             pipeline                        Run the commands of a workflow given in a config file, skipping those whose inputs have not changed
+
+Options:     -profile, --profile [file]      Save the wall time, CPU time, peak memory and numbers of items of the stages of the command
+                                             in a json file, default=<command>.profile.json
 			       
 Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
         """ #% version
@@ -59,11 +101,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'analysis', 'overview.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('analysis', 'overview', arguments)
 		else:
 			print(help)
 			sys.exit(1)	
@@ -81,11 +119,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'analysis', 'computeLengthDistribution.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('analysis', 'computeLengthDistribution', arguments)
 		else:
 			print(help)
 			sys.exit(1)	
@@ -106,11 +140,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'analysis', 'computeDistribution.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('analysis', 'computeDistribution', arguments)
 		else:
 			print(help)
 			sys.exit(1)		
@@ -132,11 +162,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'analysis', 'computeVariation.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('analysis', 'computeVariation', arguments)
 		else:
 			print(help)
 			sys.exit(1)
@@ -151,15 +177,36 @@ Arguments:   -i, --input             	   Fasta file of Dna sequences, required
              -ml, --minalignmentlength      Minimum sequence alignment length required for BLAST, default=400. For short barcode sequences like ITS2 (ITS1) sequences, ml should be set to smaller, 50 for instance.	
              -ms, --minsim                 The minimum similarity that will be saved.
              -o, --out                     The output folder, default= "dnabarcoder"			 
+             -f, --format                  The format of the similarity file: text or binary, default=text. The binary format is loaded faster.
+             -shards, --shards             The number of chunks of the sequences computed separately and merged at the end, default=1. An interrupted computation is resumed from the computed chunks.
+             -shard, --shard               If given, only the chunk with this index (from 0) is computed.
+             -ncpus, --ncpus               The number of chunks computed in parallel, default=1.
+             -jobs, --jobs                 The file to save the commands computing the chunks for a scheduler, instead of running them.
 Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'analysis', 'computeSim.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('analysis', 'computeSim', arguments)
+		else:
+			print(help)
+			sys.exit(1)	
+	elif sys.argv[1] == 'convert':
+		help = """
+Usage:       dnabarcoder %s <arguments>
+version:     %s
+
+Description: The script converts a similarity matrix file between the text and binary formats. The binary format is memory-mapped when loaded by the other commands.
+    
+Arguments:   -i, --input                   The similarity matrix file, required
+             -f, --format                  The format of the output: binary or text, default=binary
+             -st, --scoretype              The type of the scores in the binary format: float32 or float16, default=float32
+             -ms, --minsim                 The minimum similarity that will be saved.
+             -o, --out                     The output folder, default= "dnabarcoder"			 
+Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
+		""" # % (sys.argv[1], version)
+		arguments = sys.argv[2:]
+		if len(arguments) > 1:
+			RunCommand('analysis', 'convertSim', arguments)
 		else:
 			print(help)
 			sys.exit(1)	
@@ -186,11 +233,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'visualization', 'visualize.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('visualization', 'visualize', arguments)
 		else:
 			print(help)
 			sys.exit(1)	
@@ -209,11 +252,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'visualization', 'maketree.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('visualization', 'maketree', arguments)
 		else:
 			print(help)
 			sys.exit(1)				
@@ -235,11 +274,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'prediction', 'cluster.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('prediction', 'cluster', arguments)
 		else:
 			print(help)
 			sys.exit(1)		
@@ -261,11 +296,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'prediction', 'removeComplexes.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('prediction', 'removeComplexes', arguments)
 		else:
 			print(help)
 			sys.exit(1)	
@@ -295,11 +326,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'prediction', 'predict.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('prediction', 'predict', arguments)
 		else:
 			print(help)
 			sys.exit(1)		
@@ -319,11 +346,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'prediction', 'computeBestCutoffs.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('prediction', 'computeBestCutoffs', arguments)
 		else:
 			print(help)
 			sys.exit(1)	
@@ -341,11 +364,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'prediction', 'mergeCutoffs.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('prediction', 'mergeCutoffs', arguments)
 		else:
 			print(help)
 			sys.exit(1)				
@@ -365,11 +384,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'classification', 'search.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('classification', 'search', arguments)
 		else:
 			print(help)
 			sys.exit(1)				
@@ -394,20 +409,45 @@ Arguments:   -i, --input             	        The file of classified sequences,
              -prefix,--prefix                   Prefix of all output files, default as the base of the input file				  
              -minGroupNo,--minimumgroupnumber   The minimum number of groups for prediction, default=5
              -minSeqNo,--minimumsequencenumber  The minimum number of sequences for prediction, default=50	
+             -chunksize,--chunksize             The number of sequences read, assigned and saved at a time, default=100000
              -o, --out                          The output folder, default= "dnabarcoder"			 
 Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 	
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'classification', 'classify.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('classification', 'classify', arguments)
 		else:
 			print(help)
 			sys.exit(1)		
+	elif sys.argv[1] == 'serve':
+		help = """
+Usage:       dnabarcoder %s <arguments>
+version:     %s
+
+Description: The script keeps the reference sequences, their classification, the cut-offs and the BLAST database loaded, and searches and classifies the sequences in fasta format sent by POST to /search and /classify. The sequences of the requests arriving together are compared to the references in one BLAST run.
+    
+Arguments:   -r, --reference                    The fasta file of reference sequences, required    			 
+             -c, --classification    	        The taxonomic classification file in tab delimited format 			 
+             -cutoffs, --cutoffs                The similarity cutoffs file predicted by dnabarcoder predict if exists
+             -cutoff, --cutoff                  The similarity cutoff, default=0, only used if the similarity cutoffs file is not given
+             -confidence, --confidence          The confidence of the similarity cutoff if exists
+             -rank, --rank                      The rank to classify the sequences, default=""
+             -ml, --minalignmentlength          Minimum sequence alignment length required for BLAST, default=400
+             -host, --host                      The address of the service, default=127.0.0.1
+             -port, --port                      The port of the service, default=8642
+             -batchwindow, --batchwindow        The time in seconds to wait for more requests to search together, default=0.5
+             -batchsize, --batchsize            The maximum number of sequences searched together, default=10000
+             -o, --out                          The output folder, default= "dnabarcoder"			 
+Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
+		""" # % (sys.argv[1], version)
+	
+		arguments = sys.argv[2:]
+		if len(arguments) > 1:
+			RunCommand('classification', 'serve', arguments)
+		else:
+			print(help)
+			sys.exit(1)				
 	elif sys.argv[1] == 'verify':
 		help = """
 Usage:       dnabarcoder %s <arguments>
@@ -428,11 +468,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 	
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'classification', 'verify.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('classification', 'verify', arguments)
 		else:
 			print(help)
 			sys.exit(1)				
@@ -450,11 +486,7 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'classification', 'visualizeClassification.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('classification', 'visualizeClassification', arguments)
 		else:
 			print(help)
 			sys.exit(1)	
@@ -473,11 +505,25 @@ Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
 		""" # % (sys.argv[1], version)		
 		arguments = sys.argv[2:]
 		if len(arguments) > 1:
-			cmd = os.path.join(path, 'classification', 'evaluate.py')
-			arguments.insert(0, cmd)
-			exe = sys.executable
-			arguments.insert(0, exe)
-			subprocess.call(arguments)
+			RunCommand('classification', 'evaluate', arguments)
+		else:
+			print(help)
+			sys.exit(1)				
+	elif sys.argv[1] == 'pipeline':
+		help = """
+Usage:       dnabarcoder %s <arguments>
+version:     %s
+
+Description: The script runs the commands select, sim, variation, remove, predict, best, merge, search and classify of a workflow given in a json config file as the stages of a pipeline in one process. The stages not depending on each other are run in parallel, a similarity matrix is loaded once for all the stages, and the stages whose input files and options have not changed since the last run are skipped.
+    
+Arguments:   -i, --input             	        The json config file of the workflow, required. See data/CBSITS2.pipeline.json for an example.
+             -ncpus, --ncpus                    The number of stages run in parallel, default as given by the config file or 1
+             -redo, --redo                      Run all the stages again if yes, default=""
+Written by Duong Vu duong.t.vu@gmail.com/d.vu@wi.knaw.nl
+		""" # % (sys.argv[1], version)		
+		arguments = sys.argv[2:]
+		if len(arguments) > 1:
+			RunCommand('workflow', 'pipeline', arguments)
 		else:
 			print(help)
 			sys.exit(1)				
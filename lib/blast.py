@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# FILE: blast.py
+# CREATE DATE: 18 oct 2026
+#The hits of a BLAST comparison in outfmt 6, kept in arrays: the query and reference indices of the hits,
+#the identity in thousandths of a percent (BLAST gives 3 decimals) and the alignment length on the query.
+import os
+import subprocess
+import tempfile
+import shutil
+import numpy as np
+from array import array
+from lib import profiling
+
+class BlastHits:
+	def __init__(self,queryids,refids,queries,refs,identities,coverages):
+		self.queryids=list(queryids)
+		self.refids=list(refids)
+		self.queries=queries
+		self.refs=refs
+		self.identities=identities
+		self.coverages=coverages
+
+	def __len__(self):
+		return len(self.queries)
+
+	def Sims(self):
+		return (self.identities.astype(np.float64)/1000)/100
+
+	def Scores(self,mincoverage):
+		#the identity, reduced for the alignments shorter than mincoverage
+		sims=self.Sims()
+		coverages=self.coverages.astype(np.float64)
+		return np.where(self.coverages < mincoverage,(sims*coverages)/mincoverage,sims)
+
+	def Hits(self,mincoverage):
+		#the hits in the order of the BLAST output as (queryid,refid,score,sim,coverage)
+		queryids=self.queryids
+		refids=self.refids
+		return zip([queryids[i] for i in self.queries.tolist()],[refids[j] for j in self.refs.tolist()],self.Scores(mincoverage).tolist(),self.Sims().tolist(),self.coverages.tolist())
+
+	def SubHits(self,queryids,refids):
+		#the hits between the given queries and references
+		queryids=list(queryids)
+		refids=list(refids)
+		newqueries=GetIndexMap(self.queryids,queryids)
+		newrefs=GetIndexMap(self.refids,refids)
+		queries=newqueries[self.queries]
+		refs=newrefs[self.refs]
+		kept=(queries>=0) & (refs>=0)
+		return BlastHits(queryids,refids,queries[kept].astype(np.int32),refs[kept].astype(np.int32),self.identities[kept],self.coverages[kept])
+
+def GetIndexMap(oldids,newids):
+	#the new index of each old id, -1 if absent
+	newindex={}
+	i=0
+	for seqid in newids:
+		newindex.setdefault(seqid,i)
+		i=i+1
+	indexmap=[]
+	for seqid in oldids:
+		indexmap.append(newindex.get(seqid,-1))
+	return np.array(indexmap,dtype=np.int64)
+
+def GetIdIndex(seqid,seqids,seqindex):
+	i=seqindex.get(seqid,-1)
+	if i==-1:
+		i=len(seqids)
+		seqindex[seqid]=i
+		seqids.append(seqid)
+	return i
+
+def ReadBlastOutput(blastoutput,queryids=[],refids=[]):
+	#read a BLAST output in outfmt 6. The ids not given are added in the order of their first hit.
+	blastoutputfile=open(blastoutput)
+	hits=ReadBlastLines(blastoutputfile,queryids,refids)
+	blastoutputfile.close()
+	return hits
+
+def ReadBlastLines(lines,queryids=[],refids=[]):
+	queryids=list(queryids)
+	refids=list(refids)
+	queryindex={}
+	i=0
+	for seqid in queryids:
+		queryindex.setdefault(seqid,i)
+		i=i+1
+	refindex={}
+	i=0
+	for seqid in refids:
+		refindex.setdefault(seqid,i)
+		i=i+1
+	queries=array('i')
+	refs=array('i')
+	identities=array('i')
+	coverages=array('i')
+	with profiling.Stage("blast parsing") as stage:
+		for line in lines:
+			if line.rstrip()=="":
+				continue
+			words=line.split("\t")
+			queries.append(GetIdIndex(words[0].rstrip(),queryids,queryindex))
+			refs.append(GetIdIndex(words[1].rstrip(),refids,refindex))
+			identities.append(int(round(float(words[2])*1000)))
+			coverages.append(abs(int(words[7])-int(words[6])))
+		stage.Count(hits=len(queries))
+	return BlastHits(queryids,refids,np.frombuffer(queries,dtype=np.int32),np.frombuffer(refs,dtype=np.int32),np.frombuffer(identities,dtype=np.int32),np.frombuffer(coverages,dtype=np.int32))
+
+class BlastBlock:
+	#A block of lines of a BLAST output in outfmt 6 in columns: the identities, and the start and end positions of the
+	#alignments on the queries. The query ids are given once for each run of consecutive lines of the same query,
+	#starting at the lines of runstarts. The reference ids are only read when asked for.
+	def __init__(self,queryids,runstarts,identities,starts,ends,refids=None,data=None,refstarts=None,refends=None):
+		self.queryids=queryids
+		self.runstarts=runstarts
+		self.identities=identities
+		self.starts=starts
+		self.ends=ends
+		self.refids=refids
+		self.data=data
+		self.refstarts=refstarts
+		self.refends=refends
+
+	def __len__(self):
+		return len(self.identities)
+
+	def RefId(self,i):
+		if self.refids!=None:
+			return self.refids[i]
+		return self.data[self.refstarts[i]:self.refends[i]].decode()
+
+def GetFields(buffer,starts,ends):
+	#the fields buffer[starts:ends] in a matrix of bytes, one column per field, padded with zeros
+	widths=ends-starts
+	width=max(1,int(widths.max()))
+	if int(starts.max()) + width > len(buffer):
+		buffer=np.concatenate((buffer,np.zeros(width,dtype=np.uint8)))
+	fields=np.lib.stride_tricks.sliding_window_view(buffer,width)[starts].T.copy()
+	fields*=np.arange(width)[:,None] < widths
+	return fields
+
+def ParseNumbers(fields):
+	#The numbers with at most one decimal point of the fields, None if a field is not such a number of at most 15 digits.
+	#The digits of a number and the number of its decimals are given.
+	digits=fields - np.uint8(48)
+	isdigit=digits < 10
+	ispoint=fields==46
+	if fields.shape[1]==0 or np.any(~isdigit & ~ispoint & (fields!=0)) or ispoint.sum(axis=0).max() > 1:
+		return None
+	ndigits=isdigit.sum(axis=0)
+	if ndigits.min() < 1 or ndigits.max() > 15:
+		return None
+	values=np.zeros(fields.shape[1],dtype=np.int64)
+	decimals=np.zeros(fields.shape[1],dtype=np.int64)
+	afterpoint=np.zeros(fields.shape[1],dtype=bool)
+	for j in range(len(fields)):
+		values=np.where(isdigit[j],values*10 + digits[j],values)
+		afterpoint|=ispoint[j]
+		decimals+=isdigit[j] & afterpoint
+	return values,decimals
+
+def ParseIntegers(fields):
+	numbers=ParseNumbers(fields)
+	if numbers==None or numbers[1].max() > 0 or np.any(fields==46):
+		return None
+	return numbers[0]
+
+def ParseDecimals(fields):
+	numbers=ParseNumbers(fields)
+	if numbers==None:
+		return None
+	values,decimals=numbers
+	return values.astype(np.float64)/(10**decimals).astype(np.float64)
+
+def GetRunStarts(fields):
+	#the first field of each run of consecutive equal fields
+	issame=np.zeros(fields.shape[1],dtype=bool)
+	issame[1:]=np.all(fields[:,1:]==fields[:,:-1],axis=0)
+	return np.flatnonzero(~issame)
+
+def SplitBlastBlock(data):
+	#the columns of a block of lines of a BLAST output in bytes, ending with a new line.
+	#All the lines are read at once when they have the same number of columns and the numbers are plain.
+	buffer=np.frombuffer(data,dtype=np.uint8)
+	#the tabs and new lines
+	separators=np.flatnonzero(buffer - np.uint8(9) < 2)
+	isnewline=buffer[separators]==10
+	lineno=int(isnewline.sum())
+	block=None
+	if lineno > 0 and len(separators) % lineno==0:
+		n=len(separators)//lineno
+		if n >=8 and np.all(isnewline[n-1::n]):
+			lineends=separators[n-1::n]
+			#the start and end of the field k of the lines are separators[k-1::n] + 1 and separators[k::n]
+			linestarts=np.concatenate(([0],lineends[:-1] + 1))
+			identities=ParseDecimals(GetFields(buffer,separators[1::n] + 1,np.ascontiguousarray(separators[2::n])))
+			starts=ParseIntegers(GetFields(buffer,separators[5::n] + 1,np.ascontiguousarray(separators[6::n])))
+			ends=ParseIntegers(GetFields(buffer,separators[6::n] + 1,np.ascontiguousarray(separators[7::n])))
+			if identities is not None and starts is not None and ends is not None:
+				queryends=np.ascontiguousarray(separators[0::n])
+				runstarts=GetRunStarts(GetFields(buffer,linestarts,queryends))
+				queryids=[data[linestarts[i]:queryends[i]].decode() for i in runstarts.tolist()]
+				block=BlastBlock(queryids,runstarts,identities,starts,ends,None,data,queryends + 1,np.ascontiguousarray(separators[1::n]))
+	if block==None:
+		#the lines are split one by one
+		queryids=[]
+		runstarts=[]
+		refids=[]
+		identities=[]
+		starts=[]
+		ends=[]
+		i=0
+		for line in data.decode().replace("\r\n","\n").split("\n")[:-1]:
+			words=line.split("\t")
+			if len(queryids)==0 or words[0]!=queryids[-1]:
+				queryids.append(words[0])
+				runstarts.append(i)
+			refids.append(words[1])
+			identities.append(float(words[2]))
+			starts.append(int(words[6]))
+			ends.append(int(words[7]))
+			i=i+1
+		block=BlastBlock(queryids,np.array(runstarts,dtype=np.int64),np.array(identities,dtype=np.float64),np.array(starts,dtype=np.int64),np.array(ends,dtype=np.int64),refids)
+	return block
+
+def ReadBlastBlocks(blastoutput,blocksize=1<<24):
+	#read a BLAST output in outfmt 6 in blocks of about blocksize bytes of whole lines
+	blastoutputfile=open(blastoutput,"rb")
+	data=blastoutputfile.read(blocksize)
+	while len(data) > 0:
+		if not data.endswith(b"\n"):
+			data=data + blastoutputfile.readline()
+			if not data.endswith(b"\n"):
+				data=data + b"\n"
+		with profiling.Stage("blast parsing") as stage:
+			block=SplitBlastBlock(data)
+			stage.Count(hits=len(block))
+		yield block
+		data=blastoutputfile.read(blocksize)
+	blastoutputfile.close()
+
+class BlastError(Exception):
+	pass
+
+def MakeBlastDb(reffilename,db):
+	makedbcommand = "makeblastdb -in " + reffilename + " -dbtype \'nucl\' " +  " -out " + db
+	with profiling.Stage("makeblastdb"):
+		status=os.system(makedbcommand)
+	if status!=0:
+		raise BlastError("Cannot make the BLAST database " + db + ": " + makedbcommand)
+
+def RunBlastn(queryfilename,db,task,nproc):
+	#compare the queries to the BLAST database and give the lines of the output in outfmt 6 as they arrive
+	blastcommand=["blastn","-query",queryfilename,"-db",db,"-outfmt","6","-num_threads",str(nproc)]
+	if task=="blastn-short":
+		blastcommand=blastcommand + ["-task","blastn-short"]
+	#the time of the stage includes the time the lines are read by the caller
+	with profiling.Stage("blastn"):
+		try:
+			process=subprocess.Popen(blastcommand,stdout=subprocess.PIPE,universal_newlines=True)
+		except OSError as e:
+			raise BlastError("Cannot run blastn: " + str(e))
+		for line in process.stdout:
+			yield line
+		process.stdout.close()
+		process.wait()
+	#the output of a failed run is incomplete, so it is not used
+	if process.returncode!=0:
+		raise BlastError("blastn exited with status " + str(process.returncode) + ": " + " ".join(blastcommand))
+
+def RunBlast(queryfilename,reffilename,task,nproc):
+	#Compare the queries to the references with blastn and give the lines of its output in outfmt 6 as they arrive,
+	#without writing them to a file. The BLAST database is made in a temporary folder.
+	tmppath=tempfile.mkdtemp(prefix="dnabarcoder.")
+	try:
+		db=tmppath + "/db"
+		MakeBlastDb(reffilename,db)
+		for line in RunBlastn(queryfilename,db,task,nproc):
+			yield line
+	finally:
+		shutil.rmtree(tmppath,ignore_errors=True)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# FILE: blastcache.py
+# CREATE DATE: 18 oct 2026
+#A folder of BLAST hits addressed by the content of the compared sequences and the BLAST task.
+#The hits of the comparison of the sequences against themselves are saved in self.<task>.<key>.npz,
+#and the hits of queries against references in pair.<task>.<referencekey>.<querykey>.npz.
+#The hits of some queries against references can be taken from a cached comparison of more queries against the same
+#references, as the queries are compared independently. A comparison of sequences against themselves is only taken
+#from the cache for exactly the same sequences: in a comparison of more sequences the database is bigger, which changes
+#the e-values, and the hits kept for each query (max_target_seqs) can leave out pairs of the subset.
+#The least recently used files are removed when the folder is larger than the maximum size.
+import os
+import glob
+import hashlib
+import numpy as np
+from lib.blast import BlastHits
+
+def GetSeqDigests(seqrecords):
+	digests=[]
+	for seqrecord in seqrecords:
+		digests.append(hashlib.sha1((seqrecord.id + "\n" + str(seqrecord.seq)).encode()).digest())
+	return digests
+
+def GetKey(digests):
+	#the key of a set of sequences does not depend on their order
+	key=hashlib.sha1()
+	for digest in sorted(digests):
+		key.update(digest)
+	return key.hexdigest()
+
+class BlastCache:
+	def __init__(self,cachepath,maxsize):
+		self.cachepath=cachepath
+		self.maxsize=maxsize
+		if not os.path.exists(cachepath):
+			os.makedirs(cachepath,exist_ok=True)
+
+	def GetFilename(self,queryrecords,refrecords,task):
+		querydigests=GetSeqDigests(queryrecords)
+		if refrecords==None:
+			return self.cachepath + "/self." + task + "." + GetKey(querydigests) + ".npz",querydigests
+		return self.cachepath + "/pair." + task + "." + GetKey(GetSeqDigests(refrecords)) + "." + GetKey(querydigests) + ".npz",querydigests
+
+	def Load(self,queryrecords,refrecords,task):
+		#the hits of the queries against the references, or against themselves if refrecords==None. None if not cached.
+		#The hits against references can also be taken from a cached comparison of more queries.
+		queryrecords=list(queryrecords)
+		queryids=[seqrecord.id for seqrecord in queryrecords]
+		refids=queryids
+		if refrecords!=None:
+			refrecords=list(refrecords)
+			refids=[seqrecord.id for seqrecord in refrecords]
+		filename,querydigests=self.GetFilename(queryrecords,refrecords,task)
+		if os.path.exists(filename):
+			hits=self.LoadFile(filename)
+			if hits!=None:
+				return hits.SubHits(queryids,refids)
+		if refrecords==None:
+			return None
+		#a comparison of more queries against the same references
+		pattern=filename[:filename.rindex(".",0,len(filename)-4)] + ".*.npz"
+		querydigests=np.array(querydigests,dtype="S20")
+		for cachedfilename in glob.glob(pattern):
+			try:
+				with np.load(cachedfilename) as data:
+					if not np.isin(querydigests,data['querydigests']).all():
+						continue
+			except (OSError,ValueError,KeyError):
+				continue
+			hits=self.LoadFile(cachedfilename)
+			if hits!=None:
+				return hits.SubHits(queryids,refids)
+		return None
+
+	def LoadFile(self,filename):
+		try:
+			with np.load(filename) as data:
+				hits=BlastHits(data['queryids'].tolist(),data['refids'].tolist(),data['queries'],data['refs'],data['identities'],data['coverages'])
+			os.utime(filename)
+		except (OSError,ValueError,KeyError):
+			return None
+		return hits
+
+	def Save(self,queryrecords,refrecords,task,hits):
+		filename,querydigests=self.GetFilename(list(queryrecords),refrecords,task)
+		tmpfilename=self.cachepath + "/tmp." + str(os.getpid()) + "." + os.path.basename(filename)
+		np.savez(tmpfilename,queryids=np.array(hits.queryids,dtype=str),refids=np.array(hits.refids,dtype=str),queries=hits.queries,refs=hits.refs,identities=hits.identities,coverages=hits.coverages,querydigests=np.array(querydigests,dtype="S20"))
+		os.replace(tmpfilename,filename)
+		self.Evict(filename)
+
+	def Evict(self,keptfilename=""):
+		#remove the least recently used files until the cache is not larger than maxsize
+		files=[]
+		size=0
+		for filename in glob.glob(self.cachepath + "/*.npz"):
+			if os.path.basename(filename).startswith("tmp."):
+				continue
+			try:
+				stat=os.stat(filename)
+			except OSError:
+				continue
+			files.append((stat.st_mtime,stat.st_size,filename))
+			size=size + stat.st_size
+		files.sort()
+		for mtime,filesize,filename in files:
+			if size <= self.maxsize:
+				break
+			if filename==keptfilename:
+				continue
+			try:
+				os.remove(filename)
+			except OSError:
+				continue
+			size=size - filesize
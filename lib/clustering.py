@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# FILE: clustering.py
+# CREATE DATE: 18 oct 2026
+#Single-linkage clustering of the sequences over integer indices.
+import numpy as np
+
+class UnionFind:
+	def __init__(self,n):
+		self.parent=list(range(n))
+		self.size=[1]*n
+
+	def Find(self,i):
+		parent=self.parent
+		while parent[i]!=i:
+			parent[i]=parent[parent[i]]
+			i=parent[i]
+		return i
+
+	def Union(self,i,j):
+		#return the root of the merged component and the root that has been merged into it, or -1,-1
+		i=self.Find(i)
+		j=self.Find(j)
+		if i==j:
+			return -1,-1
+		if self.size[i] < self.size[j]:
+			i,j=j,i
+		self.parent[j]=i
+		self.size[i]=self.size[i] + self.size[j]
+		return i,j
+
+def SweepFmeasures(groups,n,rows,cols,scores,thresholds):
+	#Compute the F-measures of the clusterings of n points at all the given thresholds in one pass.
+	#The edges (rows,cols,scores) are added in decreasing order of the scores while the thresholds are lowered,
+	#and the class/cluster contingency counts are updated at every merge. groups are the point indices of the classes.
+	classof=[-1]*n
+	groupsizes=[]
+	c=0
+	for group in groups:
+		for i in group:
+			classof[i]=c
+		groupsizes.append(len(group))
+		c=c+1
+	#counts[r]: the number of points of each class in the cluster of the root r
+	counts=[None]*n
+	#classroots[c]: the number of points of the class c in each cluster containing it
+	classroots=[{} for group in groups]
+	for i in range(n):
+		if classof[i] >=0:
+			counts[i]={classof[i]:1}
+			classroots[classof[i]][i]=1
+		else:
+			counts[i]={}
+	best=[]
+	for groupsize in groupsizes:
+		best.append(float(2)/float(groupsize + 1))
+	uf=UnionFind(n)
+	order=np.argsort(-np.asarray(scores),kind="stable")
+	rows=np.asarray(rows)[order].tolist()
+	cols=np.asarray(cols)[order].tolist()
+	scores=np.asarray(scores)[order]
+	k=0
+	fmeasures={}
+	for t in sorted(set(thresholds),reverse=True):
+		end=int(np.searchsorted(-scores,-np.float32(t),side="right"))
+		mergedroots=set()
+		while k < end:
+			root,merged=uf.Union(rows[k],cols[k])
+			k=k+1
+			if root==-1:
+				continue
+			mergedroots.discard(merged)
+			mergedroots.add(root)
+			rootcounts=counts[root]
+			for c,m in counts[merged].items():
+				m=rootcounts.get(c,0) + m
+				rootcounts[c]=m
+				del classroots[c][merged]
+				classroots[c][root]=m
+			counts[merged]=None
+		#only the classes in the merged clusters have changed
+		changedclasses=set()
+		for root in mergedroots:
+			changedclasses.update(counts[root].keys())
+		for c in changedclasses:
+			groupsize=groupsizes[c]
+			m=0
+			for root,i in classroots[c].items():
+				v=float(2*i)/float(groupsize + uf.size[root])
+				if m < v:
+					m=v
+			best[c]=m
+		f=0
+		total=0
+		for c in range(len(groupsizes)):
+			total=total + groupsizes[c]
+			f=f + (groupsizes[c]*best[c])
+		fmeasures[t]=float(f)/float(total)
+	result=[]
+	for t in thresholds:
+		result.append(fmeasures[t])
+	return result
+
+def ConnectedComponents(indptr,indices):
+	#the connected components of the graph given in a CSR layout, as lists of point indices in depth-first order.
+	#An explicit stack is used instead of recursion so that the depth of a component does not matter.
+	n=len(indptr)-1
+	flags=bytearray(n)
+	components=[]
+	for root in range(n):
+		if flags[root]:
+			continue
+		flags[root]=1
+		component=[root]
+		#the stack holds the points being expanded and the position of their next neighbor
+		stackpoints=[root]
+		stackpositions=[indptr[root]]
+		while len(stackpoints) > 0:
+			i=stackpoints[-1]
+			k=stackpositions[-1]
+			if k==indptr[i+1]:
+				stackpoints.pop()
+				stackpositions.pop()
+				continue
+			stackpositions[-1]=k+1
+			j=indices[k]
+			if not flags[j]:
+				flags[j]=1
+				component.append(j)
+				stackpoints.append(j)
+				stackpositions.append(indptr[j])
+		components.append(component)
+	return components
+
+def MergeComplexes(complexes,classsizes):
+	#The classes to be removed from the complexes, given as lists of the class indices found in the same clusters.
+	#The classes linked through the complexes are merged into the largest of them, or into the last of the largest in the
+	#depth-first order of the classes, which are in the order of their first complex. A class found alone is kept.
+	seen=bytearray(len(classsizes))
+	complexnames=[]
+	for comp in complexes:
+		for c in comp:
+			if not seen[c]:
+				seen[c]=1
+				complexnames.append(c)
+	#only the classes found with other classes are linked
+	positions=[-1]*len(classsizes)
+	names=[]
+	for comp in complexes:
+		if len(comp) > 1:
+			for c in comp:
+				positions[c]=0
+	for c in complexnames:
+		if positions[c]==0:
+			positions[c]=len(names)
+			names.append(c)
+	neighbordicts=[{} for c in names]
+	for comp in complexes:
+		if len(comp) > 1:
+			comppositions=[positions[c] for c in comp]
+			for i in comppositions:
+				neighbors=neighbordicts[i]
+				for j in comppositions:
+					neighbors[j]=True
+	indptr=[0]
+	indices=[]
+	for neighbors in neighbordicts:
+		indices.extend(neighbors.keys())
+		indptr.append(len(indices))
+	removed=[]
+	for component in ConnectedComponents(indptr,indices):
+		maxseqnumber=0
+		ref=-1
+		for i in component:
+			if classsizes[names[i]]>=maxseqnumber:
+				maxseqnumber=classsizes[names[i]]
+				ref=names[i]
+		for i in component:
+			if names[i]!=ref:
+				removed.append(names[i])
+	return removed
+
+def ClusterNeighbors(neighbordict):
+	#the connected components of the points given with their neighbors, as lists of point ids
+	pointids=list(neighbordict.keys())
+	pointindex={}
+	i=0
+	for pointid in pointids:
+		pointindex[pointid]=i
+		i=i+1
+	indptr=[0]
+	indices=[]
+	for pointid in pointids:
+		for neighbor in neighbordict[pointid]:
+			j=pointindex.get(neighbor,-1)
+			if j>=0:
+				indices.append(j)
+		indptr.append(len(indices))
+	clusters=[]
+	for component in ConnectedComponents(indptr,indices):
+		cluster=[]
+		for i in component:
+			cluster.append(pointids[i])
+		clusters.append(cluster)
+	return clusters
+
+def ContingencyFmeasure(classlabels,clusterlabels,classnumber,clusternumber):
+	#The F-measure of a clustering from the sparse class-by-cluster contingency table of the points.
+	#classlabels and clusterlabels are integer arrays giving the class and the cluster of every point, -1 if none.
+	#Also returns the best cluster of each class (-1 if none) and its F-measure.
+	classlabels=np.asarray(classlabels,dtype=np.int64)
+	clusterlabels=np.asarray(clusterlabels,dtype=np.int64)
+	classsizes=np.bincount(classlabels[classlabels>=0],minlength=classnumber)
+	clustersizes=np.bincount(clusterlabels[clusterlabels>=0],minlength=clusternumber)
+	both=(classlabels>=0) & (clusterlabels>=0)
+	keys,counts=np.unique(classlabels[both]*clusternumber + clusterlabels[both],return_counts=True)
+	rowclasses=keys // max(clusternumber,1)
+	rowclusters=keys % max(clusternumber,1)
+	values=(2*counts).astype(np.float64)/(classsizes[rowclasses] + clustersizes[rowclusters]).astype(np.float64)
+	bestscores=np.zeros(classnumber,dtype=np.float64)
+	bestclusters=np.full(classnumber,-1,dtype=np.int64)
+	if len(keys) > 0:
+		starts=np.flatnonzero(np.concatenate(([True],rowclasses[1:]!=rowclasses[:-1])))
+		segmentbest=np.maximum.reduceat(values,starts)
+		segmentclasses=rowclasses[starts]
+		bestscores[segmentclasses]=segmentbest
+		#the first cluster reaching the maximum in each class
+		lengths=np.diff(np.append(starts,len(values)))
+		positions=np.flatnonzero(values==np.repeat(segmentbest,lengths))
+		segments=np.searchsorted(starts,positions,side="right") - 1
+		segments,first=np.unique(segments,return_index=True)
+		bestclusters[segmentclasses[segments]]=rowclusters[positions[first]]
+	f=0
+	n=0
+	for c in range(classnumber):
+		n=n + int(classsizes[c])
+		f=f + (int(classsizes[c])*float(bestscores[c]))
+	return float(f)/float(n),bestclusters,bestscores
+
+def ComputeClassFmeasure(classes,clusters):
+	#The F-measure of the clusters (lists of point ids) for the classes (class name: point ids).
+	#Also returns the best cluster index of every class with its F-measure, for diagnostics.
+	pointindex={}
+	clusterlabels=[]
+	c=0
+	for cluster in clusters:
+		for pointid in cluster:
+			pointindex[pointid]=len(clusterlabels)
+			clusterlabels.append(c)
+		c=c+1
+	classlabels=[-1]*len(clusterlabels)
+	c=0
+	for classname in classes.keys():
+		for pointid in classes[classname]:
+			k=pointindex.get(pointid,-1)
+			if k==-1:
+				#the point is not in any cluster
+				classlabels.append(c)
+				clusterlabels.append(-1)
+			else:
+				classlabels[k]=c
+		c=c+1
+	fmeasure,bestclusters,bestscores=ContingencyFmeasure(classlabels,clusterlabels,len(classes),len(clusters))
+	bestclusterdict={}
+	c=0
+	for classname in classes.keys():
+		bestclusterdict[classname]=(int(bestclusters[c]),float(bestscores[c]))
+		c=c+1
+	return fmeasure,bestclusterdict
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# FILE: jobs.py
+# CREATE DATE: 18 oct 2026
+#A scheduler running chains of shell commands, like an alignment followed by a tree, for many sequences concurrently.
+#Each command is given the number of threads it uses, and commands are started while the total number of threads
+#in use does not exceed maxthreads. The commands of a chain are run one after another, and a command is skipped
+#if its output file already exists, unless the chain is redone. When a command fails, its output file and the output
+#files of the next commands of the chain are removed and the rest of the chain is not run.
+import os
+import time
+import subprocess
+
+class JobScheduler:
+	def __init__(self,maxthreads):
+		self.maxthreads=max(1,maxthreads)
+		self.chains=[]
+
+	def AddChain(self,name,steps,redo=False):
+		#steps: a list of (command,threads,outputfilename). The command is always run if outputfilename=="" or redo==True
+		self.chains.append((name,list(steps),redo))
+
+	def Run(self,onfinish=None):
+		#run all the chains and call onfinish(name) as each of them is finished or has failed
+		waiting=list(self.chains)
+		self.chains=[]
+		running=[]
+		used=0
+		while len(waiting) > 0 or len(running) > 0:
+			#start the next commands while there are free threads
+			while len(waiting) > 0:
+				name,steps,redo=waiting[0]
+				while len(steps) > 0 and redo==False and steps[0][2]!="" and os.path.exists(steps[0][2]):
+					steps=steps[1:]
+				if len(steps)==0:
+					waiting.pop(0)
+					if onfinish!=None:
+						onfinish(name)
+					continue
+				command,threads,outputfilename=steps[0]
+				threads=min(max(1,threads),self.maxthreads)
+				if used + threads > self.maxthreads:
+					break
+				waiting.pop(0)
+				print(command)
+				process=subprocess.Popen(command,shell=True)
+				running.append((process,name,steps,redo,threads))
+				used=used + threads
+			#wait for a command to finish
+			finished=[]
+			if len(running)==1:
+				running[0][0].wait()
+			while len(finished)==0 and len(running) > 0:
+				for job in running:
+					if job[0].poll()!=None:
+						finished.append(job)
+				if len(finished)==0:
+					time.sleep(0.05)
+			for job in finished:
+				process,name,steps,redo,threads=job
+				running.remove(job)
+				used=used - threads
+				if process.returncode!=0:
+					#the output of a failed command is incomplete, and the next commands would use it
+					print("The command " + steps[0][0] + " has failed with status " + str(process.returncode) + ".")
+					for step in steps:
+						if step[2]!="" and os.path.exists(step[2]):
+							os.remove(step[2])
+					if onfinish!=None:
+						onfinish(name)
+					continue
+				#the chain is continued before new chains are started
+				waiting.insert(0,(name,steps[1:],redo))
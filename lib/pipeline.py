@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# FILE: pipeline.py
+# CREATE DATE: 18 oct 2026
+#A scheduler running the stages of a pipeline, functions reading and writing files, as a DAG in one process.
+#The stages are added in the order of the workflow, and a stage depends on the earlier stages writing its input files,
+#writing its output files or reading its output files. A stage is started when the stages it depends on are finished,
+#in a forked process while fewer than maxprocesses stages are running, so that the data loaded before by this
+#process, like the similarity matrices, are shared with it. With maxprocesses=1 the stages are run one after another
+#in this process.
+#A stage is skipped when it has been run with the same arguments and the same checksums of its input files, its output
+#files exist and none of the stages it depends on has been run. The arguments and the checksums of the stages are saved
+#in the state file.
+import os
+import sys
+import json
+import time
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+from lib.refindex import GetChecksum
+
+class Stage:
+	def __init__(self,name,function,arguments,inputs,outputs):
+		self.name=name
+		#the stage is run as function(arguments)
+		self.function=function
+		self.arguments=list(arguments)
+		self.inputs=[os.path.abspath(filename) for filename in inputs]
+		self.outputs=[os.path.abspath(filename) for filename in outputs]
+		#a function called in this process before the stage is started, to load the data shared with the stage
+		self.preload=None
+		#the arguments added and the files removed when the stage is run again, so that the results kept by the stage
+		#from its last run are not reused
+		self.redoarguments=[]
+		self.redofiles=[]
+		self.dependencies=[]
+
+def RunStage(stage,arguments):
+	try:
+		stage.function(arguments)
+	except SystemExit as e:
+		#the scripts exit after printing the reason
+		if e.code!=None and e.code!=0:
+			return False
+	except Exception:
+		traceback.print_exc()
+		return False
+	if "matplotlib.pyplot" in sys.modules:
+		sys.modules["matplotlib.pyplot"].close("all")
+	return True
+
+def RunForkedStage(stage,arguments):
+	sys.stdout.flush()
+	if RunStage(stage,arguments):
+		sys.exit(0)
+	sys.exit(1)
+
+class Pipeline:
+	def __init__(self,statefilename,checksumfilename,maxprocesses=1):
+		self.statefilename=statefilename
+		self.checksumfilename=checksumfilename
+		self.maxprocesses=max(1,maxprocesses)
+		self.stages=[]
+		self.state={}
+		if os.path.exists(statefilename):
+			try:
+				with open(statefilename) as json_file:
+					self.state=json.load(json_file)
+			except ValueError:
+				self.state={}
+
+	def AddStage(self,stage):
+		for other in self.stages:
+			if other.name==stage.name:
+				raise ValueError("The stage name " + stage.name + " is used twice.")
+			if len(set(stage.inputs) & set(other.outputs)) > 0 or len(set(stage.outputs) & set(other.outputs)) > 0 or len(set(stage.outputs) & set(other.inputs)) > 0:
+				stage.dependencies.append(other)
+		self.stages.append(stage)
+
+	def GetChecksums(self,stage):
+		checksums={}
+		for filename in stage.inputs:
+			checksum=""
+			if os.path.exists(filename):
+				checksum=GetChecksum(filename,self.checksumfilename)
+			checksums[filename]=checksum
+		return checksums
+
+	def IsUpToDate(self,stage,checksums):
+		if not (stage.name in self.state.keys()):
+			return False
+		record=self.state[stage.name]
+		if record["arguments"]!=stage.arguments or record["inputs"]!=checksums:
+			return False
+		for filename in stage.outputs:
+			if not os.path.exists(filename):
+				return False
+		return True
+
+	def SaveState(self):
+		tmpfilename=os.path.join(os.path.dirname(self.statefilename),"tmp." + str(os.getpid()) + "." + os.path.basename(self.statefilename))
+		with open(tmpfilename,"w") as json_file:
+			json.dump(self.state,json_file,indent=2)
+		os.replace(tmpfilename,self.statefilename)
+
+	def Start(self,stage):
+		#the arguments of the stage to run, or None if it is up to date
+		checksums=self.GetChecksums(stage)
+		if self.IsUpToDate(stage,checksums):
+			return None,checksums
+		arguments=stage.arguments
+		if stage.name in self.state.keys():
+			arguments=arguments + stage.redoarguments
+			for filename in stage.redofiles:
+				if os.path.exists(filename):
+					os.remove(filename)
+			del self.state[stage.name]
+			self.SaveState()
+		if stage.preload!=None:
+			stage.preload()
+		print("Running stage " + stage.name + ": " + " ".join(arguments))
+		return arguments,checksums
+
+	def Finish(self,stage,success,starttime,checksums):
+		#a stage has failed if it has not written all its output files
+		for filename in stage.outputs:
+			if not os.path.exists(filename) or os.path.getmtime(filename) < starttime - 1:
+				success=False
+		if success:
+			self.state[stage.name]={"arguments":stage.arguments,"inputs":checksums}
+			self.SaveState()
+			print("The stage " + stage.name + " is finished in " + str(round(time.time()-starttime,2)) + " s.")
+		else:
+			print("The stage " + stage.name + " has failed.")
+		return success
+
+	def Run(self,redo=False):
+		#run the stages and return the names of those that have failed or could not be run
+		if redo:
+			self.state={}
+		waiting=list(self.stages)
+		running=[]
+		finished=[]
+		ran=[]
+		failed=[]
+		context=multiprocessing.get_context("fork")
+		while len(waiting) > 0 or len(running) > 0:
+			#start the stages whose dependencies are finished while there are free processes
+			for stage in list(waiting):
+				if len(running) >= self.maxprocesses:
+					break
+				if len([other for other in stage.dependencies if other.name in failed]) > 0:
+					waiting.remove(stage)
+					failed.append(stage.name)
+					print("The stage " + stage.name + " is not run as the stages it depends on have failed.")
+					continue
+				if len([other for other in stage.dependencies if not (other.name in finished)]) > 0:
+					continue
+				waiting.remove(stage)
+				if len([other for other in stage.dependencies if other.name in ran]) > 0 and stage.name in self.state.keys():
+					#the stage is run again when the stages it depends on have been run
+					self.state[stage.name]["arguments"]=None
+				starttime=time.time()
+				arguments,checksums=self.Start(stage)
+				if arguments==None:
+					print("The stage " + stage.name + " is up to date.")
+					finished.append(stage.name)
+					continue
+				ran.append(stage.name)
+				if self.maxprocesses==1:
+					if self.Finish(stage,RunStage(stage,arguments),starttime,checksums):
+						finished.append(stage.name)
+					else:
+						failed.append(stage.name)
+					continue
+				sys.stdout.flush()
+				process=context.Process(target=RunForkedStage,args=(stage,arguments))
+				process.start()
+				running.append((process,stage,starttime,checksums))
+			if len(running)==0:
+				continue
+			#wait for a stage to finish
+			wait([job[0].sentinel for job in running])
+			for job in list(running):
+				process,stage,starttime,checksums=job
+				if process.is_alive():
+					continue
+				process.join()
+				running.remove(job)
+				if self.Finish(stage,process.exitcode==0,starttime,checksums):
+					finished.append(stage.name)
+				else:
+					failed.append(stage.name)
+		return failed
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# FILE: profiling.py
+# CREATE DATE: 18 oct 2026
+#The profile of a command: the wall time, the CPU time, the peak memory and the numbers of items (sequences, hits,
+#edges, clades, clusters...) of its stages, saved as a json report. A stage is marked in the code with
+#	with profiling.Stage("name") as stage:
+#		...
+#		stage.Count(sequences=n)
+#and is only measured after Enable(). The stages of the same name are added up, and a stage includes the stages run in it.
+#The CPU time of the child processes, like blastn and makeblastdb, is counted separately when they are finished.
+#The peak memory of a stage is the peak resident set size of the process during the stage where Linux lets it be
+#reset (/proc/self/clear_refs), and otherwise the peak since the start of the process (ru_maxrss).
+#The stages run in forked worker processes are not reported, only the stage of this process waiting for them.
+#The stages are not measured from several threads at the same time.
+import sys
+import time
+import json
+import resource
+
+enabled=False
+command=""
+arguments=[]
+starttime=0
+startcputime=0
+startchildcputime=0
+stages={}
+running=[]
+peakrss=0
+resetpeak=True
+
+def GetPeakRSS():
+	#the peak resident set size of the process in bytes since its start or the last reset
+	try:
+		with open("/proc/self/status") as statusfile:
+			for line in statusfile:
+				if line.startswith("VmHWM:"):
+					return int(line.split()[1])*1024
+	except OSError:
+		pass
+	maxrss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform=="darwin":
+		return maxrss
+	return maxrss*1024
+
+def ResetPeakRSS():
+	global resetpeak,peakrss
+	peakrss=max(peakrss,GetPeakRSS())
+	if not resetpeak:
+		return
+	try:
+		with open("/proc/self/clear_refs","w") as clearfile:
+			clearfile.write("5")
+	except OSError:
+		resetpeak=False
+
+def GetChildCPUTime():
+	usage=resource.getrusage(resource.RUSAGE_CHILDREN)
+	return usage.ru_utime + usage.ru_stime
+
+class Stage:
+	def __init__(self,name,**items):
+		self.name=name
+		self.items=dict(items)
+		self.peakrss=0
+
+	def Count(self,**items):
+		for name,number in items.items():
+			self.items[name]=self.items.get(name,0) + number
+
+	def __enter__(self):
+		if not enabled:
+			return self
+		if len(running) > 0:
+			parent=running[-1]
+			parent.peakrss=max(parent.peakrss,GetPeakRSS())
+		ResetPeakRSS()
+		stages.setdefault(self.name,{"calls":0,"wall time (s)":0,"cpu time (s)":0,"child cpu time (s)":0,"peak rss (MB)":0,"items":{}})
+		self.peakrss=GetPeakRSS()
+		self.starttime=time.perf_counter()
+		self.cputime=time.process_time()
+		self.childcputime=GetChildCPUTime()
+		running.append(self)
+		return self
+
+	def __exit__(self,exctype,excvalue,tb):
+		if not (self in running):
+			return False
+		self.peakrss=max(self.peakrss,GetPeakRSS())
+		running.remove(self)
+		if len(running) > 0:
+			parent=running[-1]
+			parent.peakrss=max(parent.peakrss,self.peakrss)
+		record=stages[self.name]
+		record["calls"]=record["calls"] + 1
+		record["wall time (s)"]=record["wall time (s)"] + time.perf_counter() - self.starttime
+		record["cpu time (s)"]=record["cpu time (s)"] + time.process_time() - self.cputime
+		record["child cpu time (s)"]=record["child cpu time (s)"] + GetChildCPUTime() - self.childcputime
+		record["peak rss (MB)"]=max(record["peak rss (MB)"],self.peakrss/(1024*1024))
+		for name,number in self.items.items():
+			record["items"][name]=record["items"].get(name,0) + number
+		return False
+
+def Enable(commandname,commandarguments):
+	global enabled,command,arguments,starttime,startcputime,startchildcputime,peakrss
+	enabled=True
+	command=commandname
+	arguments=list(commandarguments)
+	stages.clear()
+	del running[:]
+	peakrss=GetPeakRSS()
+	starttime=time.perf_counter()
+	startcputime=time.process_time()
+	startchildcputime=GetChildCPUTime()
+
+def GetReport():
+	report={"command":command,"arguments":arguments,
+			"wall time (s)":round(time.perf_counter() - starttime,4),
+			"cpu time (s)":round(time.process_time() - startcputime,4),
+			"child cpu time (s)":round(GetChildCPUTime() - startchildcputime,4),
+			"peak rss (MB)":round(max(peakrss,GetPeakRSS())/(1024*1024),2),
+			"stages":[]}
+	for name in stages.keys():
+		record=stages[name]
+		report["stages"].append({"stage":name,"calls":record["calls"],
+			"wall time (s)":round(record["wall time (s)"],4),
+			"cpu time (s)":round(record["cpu time (s)"],4),
+			"child cpu time (s)":round(record["child cpu time (s)"],4),
+			"peak rss (MB)":round(record["peak rss (MB)"],2),
+			"items":record["items"]})
+	return report
+
+def SaveReport(reportfilename):
+	global enabled
+	report=GetReport()
+	enabled=False
+	with open(reportfilename,"w") as json_file:
+		json.dump(report,json_file,indent=2)
+	print("The profile of the stages of " + command + " is saved in " + reportfilename + ".")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# FILE: quantilesketch.py
+# CREATE DATE: 18 oct 2026
+#A mergeable quantile sketch (KLL) of a stream of scores. The items of the level h of the sketch stand for 2^h scores
+#each. When a level holds more items than its capacity, the items are sorted and every other one, from a random
+#start, is moved to the level above. The capacities decrease by 2/3 from k at the top level down, so the sketch keeps
+#O(k log(n/k)) items and the rank of a value is estimated within about n*1.7/k. The number and the minimum of the
+#scores are kept exactly. Two sketches of the same size are merged by adding up their levels. The random starts are
+#drawn from the own generator of each sketch, seeded by seed, so that the estimates are the same in every run.
+import numpy as np
+
+class QuantileSketch:
+	def __init__(self,k=200,seed=0):
+		self.k=k
+		self.rng=np.random.default_rng(seed)
+		self.levels=[np.empty(0,dtype=np.float64)]
+		self.count=0
+		self.minimum=np.inf
+
+	def __len__(self):
+		return self.count
+
+	def Capacity(self,level):
+		return max(2,int(np.ceil(self.k*(2.0/3)**(len(self.levels)-level-1))))
+
+	def Update(self,scores):
+		scores=np.asarray(scores,dtype=np.float64)
+		if len(scores)==0:
+			return
+		self.count=self.count + len(scores)
+		self.minimum=min(self.minimum,float(scores.min()))
+		self.levels[0]=np.concatenate((self.levels[0],scores))
+		self.Compress()
+
+	def Merge(self,other):
+		while len(self.levels) < len(other.levels):
+			self.levels.append(np.empty(0,dtype=np.float64))
+		for h in range(len(other.levels)):
+			self.levels[h]=np.concatenate((self.levels[h],other.levels[h]))
+		self.count=self.count + other.count
+		self.minimum=min(self.minimum,other.minimum)
+		self.Compress()
+
+	def Compress(self):
+		h=0
+		while h < len(self.levels):
+			items=self.levels[h]
+			if len(items) <= self.Capacity(h):
+				h=h+1
+				continue
+			newlevel=(h==len(self.levels)-1)
+			if newlevel:
+				self.levels.append(np.empty(0,dtype=np.float64))
+			items=np.sort(items)
+			#an odd item stays at the level
+			end=len(items) - len(items) % 2
+			start=int(self.rng.integers(0,2))
+			self.levels[h+1]=np.concatenate((self.levels[h+1],items[start:end:2]))
+			self.levels[h]=items[end:]
+			h=h+1
+			#a new level lowers the capacities of the levels below
+			if newlevel:
+				h=0
+
+	def GetScore(self,position):
+		#the estimated score at the position (from 0) of the scores in increasing order
+		scores=np.concatenate(self.levels)
+		weights=np.concatenate([np.full(len(self.levels[h]),2**h,dtype=np.int64) for h in range(len(self.levels))])
+		order=np.argsort(scores,kind="stable")
+		ranks=np.cumsum(weights[order])
+		i=min(int(np.searchsorted(ranks,position,side="right")),len(ranks)-1)
+		return float(scores[order[i]])
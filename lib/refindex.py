@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# FILE: refindex.py
+# CREATE DATE: 18 oct 2026
+#A folder of BLAST databases of the reference sequences, reused between the runs.
+#The database of a reference fasta file is saved in ref.<checksum>/db, where checksum is the sha1 of the file content,
+#so that it is rebuilt when the file changes. The checksums are kept in checksums.json by path, size and modification time.
+#The databases of subsets of the references (the sequences of a taxon) are made when first needed in sub.<key>/db,
+#where key is given by the content of the sequences. They are counted while in use, and the least recently used
+#of those not in use are removed when there are more than maxsubdbs of them.
+import os
+import glob
+import json
+import shutil
+import hashlib
+from Bio import SeqIO
+from lib.blast import MakeBlastDb,BlastError
+from lib.blastcache import GetSeqDigests,GetKey
+
+def GetChecksum(filename,checksumfilename):
+	#the sha1 of the file content, kept in the json file checksumfilename by path, size and modification time
+	checksums={}
+	if os.path.exists(checksumfilename):
+		try:
+			with open(checksumfilename) as json_file:
+				checksums=json.load(json_file)
+		except ValueError:
+			checksums={}
+	path=os.path.abspath(filename)
+	stat=os.stat(filename)
+	if path in checksums.keys():
+		size,mtime,checksum=checksums[path]
+		if size==stat.st_size and mtime==stat.st_mtime:
+			return checksum
+	sha1=hashlib.sha1()
+	with open(filename,"rb") as file:
+		for block in iter(lambda: file.read(1 << 20),b""):
+			sha1.update(block)
+	checksum=sha1.hexdigest()
+	checksums[path]=[stat.st_size,stat.st_mtime,checksum]
+	tmpfilename=os.path.join(os.path.dirname(checksumfilename),"tmp." + str(os.getpid()) + "." + os.path.basename(checksumfilename))
+	with open(tmpfilename,"w") as json_file:
+		json.dump(checksums,json_file,indent=2)
+	os.replace(tmpfilename,checksumfilename)
+	return checksum
+
+class ReferenceIndex:
+	def __init__(self,indexpath,maxsubdbs=1000):
+		self.indexpath=indexpath
+		self.maxsubdbs=maxsubdbs
+		self.refcounts={}
+		if not os.path.exists(indexpath):
+			os.makedirs(indexpath,exist_ok=True)
+
+	def GetChecksum(self,fastafilename):
+		return GetChecksum(fastafilename,self.indexpath + "/checksums.json")
+
+	def BuildDb(self,dbpath,fastafilename,seqrecords=None):
+		#make the database in a temporary folder which is then renamed, so that an incomplete database is never used
+		if os.path.exists(dbpath):
+			if len(glob.glob(dbpath + "/db.n*")) > 0:
+				os.utime(dbpath)
+				return dbpath + "/db"
+			#a folder without database files, left by a failed build
+			shutil.rmtree(dbpath,ignore_errors=True)
+		tmppath=self.indexpath + "/tmp." + str(os.getpid()) + "." + os.path.basename(dbpath)
+		if os.path.exists(tmppath):
+			shutil.rmtree(tmppath)
+		os.makedirs(tmppath)
+		if seqrecords!=None:
+			fastafilename=tmppath + "/db.fasta"
+			SeqIO.write(seqrecords,fastafilename,"fasta")
+		try:
+			MakeBlastDb(fastafilename,tmppath + "/db")
+			if len(glob.glob(tmppath + "/db.n*"))==0:
+				raise BlastError("makeblastdb has not made the BLAST database " + tmppath + "/db.")
+		except BlastError:
+			shutil.rmtree(tmppath,ignore_errors=True)
+			raise
+		if seqrecords!=None:
+			os.remove(fastafilename)
+		try:
+			os.rename(tmppath,dbpath)
+		except OSError:
+			#the same database has been made by another process
+			shutil.rmtree(tmppath,ignore_errors=True)
+		return dbpath + "/db"
+
+	def GetDb(self,fastafilename):
+		#the BLAST database of the sequences of the fasta file
+		dbpath=self.indexpath + "/ref." + self.GetChecksum(fastafilename)
+		if len(glob.glob(dbpath + "/db.n*")) > 0:
+			print("The existing BLAST db " + dbpath + "/db of " + fastafilename + " is used.")
+		return self.BuildDb(dbpath,fastafilename)
+
+	def AcquireSubDb(self,seqrecords):
+		#the BLAST database of the given sequences, which is kept until it is released
+		seqrecords=list(seqrecords)
+		dbpath=self.indexpath + "/sub." + GetKey(GetSeqDigests(seqrecords))
+		db=self.BuildDb(dbpath,"",seqrecords)
+		self.refcounts[dbpath]=self.refcounts.get(dbpath,0) + 1
+		return db
+
+	def ReleaseSubDb(self,db,cleanup=True):
+		#cleanup=False when the databases are used by several processes, which do not know each other's counts
+		dbpath=os.path.dirname(db)
+		self.refcounts[dbpath]=self.refcounts.get(dbpath,0) - 1
+		if self.refcounts[dbpath] <= 0:
+			del self.refcounts[dbpath]
+			if cleanup:
+				self.Cleanup()
+
+	def Cleanup(self):
+		#remove the least recently used databases of subsets that are not in use until there are at most maxsubdbs of them
+		dbpaths=[]
+		for dbpath in glob.glob(self.indexpath + "/sub.*"):
+			try:
+				dbpaths.append((os.stat(dbpath).st_mtime,dbpath))
+			except OSError:
+				continue
+		dbpaths.sort()
+		n=len(dbpaths)
+		for mtime,dbpath in dbpaths:
+			if n <= self.maxsubdbs:
+				break
+			if dbpath in self.refcounts.keys():
+				continue
+			shutil.rmtree(dbpath,ignore_errors=True)
+			n=n-1
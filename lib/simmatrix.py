@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# FILE: simmatrix.py
+# CREATE DATE: 18 oct 2026
+#The similarity matrix of the sequences. Only the non-zero BLAST scores are kept, in a CSR layout
+#over integer sequence indices: the scores of the sequence i are scores[indptr[i]:indptr[i+1]],
+#against the sequences indices[indptr[i]:indptr[i+1]]. The matrix is symmetric, both directions are stored,
+#and the similarity of a sequence to itself is always 1 and not stored.
+#The matrix is saved either in the text format of "id id score" lines or in a binary format: the magic BINARYSIMMAGIC,
+#the length of a json header (8 bytes), the json header giving the offset of each array from the end of the header,
+#then the ids separated by new lines and the arrays indptr, indices and scores (float32 or float16), aligned to 8 bytes.
+#The arrays of a binary file are memory-mapped when loaded.
+#After KeepSims() the matrices loaded by LoadSim are kept by path, size and modification time and reused while
+#their files are unchanged, so that the stages of a pipeline run in one process load a matrix once.
+import os
+import json
+import numpy as np
+from array import array
+from lib.blast import ReadBlastOutput
+from lib import profiling
+
+class SimMatrix:
+	def __init__(self,seqids,indptr,indices,scores):
+		self.seqids=list(seqids)
+		self.seqindex={}
+		i=0
+		for seqid in self.seqids:
+			self.seqindex[seqid]=i
+			i=i+1
+		self.indptr=indptr
+		self.indices=indices
+		self.scores=scores
+
+	def __len__(self):
+		return len(self.seqids)
+
+	def __contains__(self,seqid):
+		return seqid in self.seqindex
+
+	def GetIndex(self,seqid):
+		return self.seqindex.get(seqid,-1)
+
+	def GetIndices(self,seqids):
+		indices=[]
+		for seqid in seqids:
+			indices.append(self.seqindex.get(seqid,-1))
+		return np.array(indices,dtype=np.int64)
+
+	def EdgeNumber(self):
+		return int(len(self.indices)/2)
+
+	def Row(self,i):
+		start=self.indptr[i]
+		end=self.indptr[i+1]
+		return self.indices[start:end],self.scores[start:end]
+
+	def GetScore(self,seqid1,seqid2):
+		i=self.seqindex.get(seqid1,-1)
+		j=self.seqindex.get(seqid2,-1)
+		if i==-1 or j==-1:
+			return 0
+		if i==j:
+			return 1
+		cols,scores=self.Row(i)
+		k=np.searchsorted(cols,j)
+		if k < len(cols) and cols[k]==j:
+			return round(float(scores[k]),4)
+		return 0
+
+	def LoadNeighbors(self,seqids,threshold):
+		#the neighbors of the given sequences within the given sequences with a score >= threshold, in the order of seqids
+		seqids=list(seqids)
+		indptr,indices=self.LoadNeighborIndices(seqids,threshold)
+		neighbordict={}
+		i=0
+		for seqid in seqids:
+			neighbordict.setdefault(seqid,[])
+			for k in range(indptr[i],indptr[i+1]):
+				neighbordict[seqid].append(seqids[indices[k]])
+			i=i+1
+		return neighbordict
+
+	def LoadNeighborIndices(self,seqids,threshold):
+		#the neighbors of the given sequences within the given sequences with a score >= threshold, as their positions
+		#in seqids in a CSR layout (indptr,indices). The neighbors of a sequence are in the order of seqids, so that a
+		#depth-first traversal visits the sequences in the same order whatever the order of the similarity matrix.
+		oldindices=self.GetIndices(seqids)
+		present=oldindices>=0
+		newindex=np.full(len(self.seqids),-1,dtype=np.int64)
+		newindex[oldindices[present]]=np.arange(len(oldindices),dtype=np.int64)[present]
+		kept=np.flatnonzero(self.scores >= np.float32(threshold))
+		rows=newindex[np.searchsorted(self.indptr,kept,side="right") - 1]
+		cols=newindex[self.indices[kept]]
+		kept=(rows>=0) & (cols>=0)
+		rows=rows[kept]
+		cols=cols[kept]
+		indptr=np.zeros(len(oldindices)+1,dtype=np.int64)
+		np.cumsum(np.bincount(rows,minlength=len(oldindices)),out=indptr[1:])
+		return indptr.tolist(),cols[np.lexsort((cols,rows))].tolist()
+
+	def Edges(self,minscore=None):
+		#the edges (i,j,score) with i<j, optionally only those with score >= minscore
+		rows=np.repeat(np.arange(len(self.seqids),dtype=np.int64),np.diff(self.indptr))
+		mask=rows < self.indices
+		if minscore!=None:
+			mask=mask & (self.scores >= np.float32(minscore))
+		return rows[mask],self.indices[mask].astype(np.int64),self.scores[mask]
+
+	def SubMatrix(self,seqids):
+		#the similarity matrix of the given sequences, in the given order. Sequences without any score get an empty row.
+		seqids=list(seqids)
+		return self.Slice(self.GetIndices(seqids),seqids)
+
+	def Slice(self,oldindices,seqids=None):
+		#the similarity matrix of the sequences of the given indices in this matrix (-1 for a sequence without any score),
+		#in the given order, with the given ids or else their ids in this matrix
+		oldindices=np.asarray(oldindices,dtype=np.int64)
+		if seqids==None:
+			seqids=[self.seqids[i] for i in oldindices.tolist()]
+		present=oldindices>=0
+		newindex=np.full(len(self.seqids),-1,dtype=np.int64)
+		newindex[oldindices[present]]=np.arange(len(seqids),dtype=np.int64)[present]
+		rows=np.arange(len(seqids),dtype=np.int64)[present]
+		starts=self.indptr[oldindices[present]]
+		lengths=self.indptr[oldindices[present]+1] - starts
+		total=int(lengths.sum())
+		offsets=np.repeat(starts - np.cumsum(lengths) + lengths,lengths) + np.arange(total,dtype=np.int64)
+		rows=np.repeat(rows,lengths)
+		cols=newindex[self.indices[offsets]]
+		scores=self.scores[offsets]
+		kept=cols>=0
+		return BuildCSR(seqids,rows[kept],cols[kept],scores[kept])
+
+def BuildCSR(seqids,rows,cols,scores):
+	#rows,cols must already be symmetric, without duplicates and diagonal
+	n=len(seqids)
+	order=np.lexsort((cols,rows))
+	rows=rows[order]
+	indptr=np.zeros(n+1,dtype=np.int64)
+	np.cumsum(np.bincount(rows,minlength=n),out=indptr[1:])
+	return SimMatrix(seqids,indptr,np.asarray(cols[order],dtype=np.int32),np.asarray(scores[order],dtype=np.float32))
+
+def BuildSimMatrix(seqids,rows,cols,scores):
+	#build a symmetric matrix from the pairs (rows[k],cols[k]) with the maximum score of each pair
+	rows=np.asarray(rows,dtype=np.int64)
+	cols=np.asarray(cols,dtype=np.int64)
+	scores=np.asarray(scores,dtype=np.float32)
+	offdiagonal=rows!=cols
+	rows=rows[offdiagonal]
+	cols=cols[offdiagonal]
+	scores=scores[offdiagonal]
+	allrows=np.concatenate((rows,cols))
+	allcols=np.concatenate((cols,rows))
+	allscores=np.concatenate((scores,scores))
+	order=np.lexsort((-allscores,allcols,allrows))
+	allrows=allrows[order]
+	allcols=allcols[order]
+	allscores=allscores[order]
+	first=np.ones(len(allrows),dtype=bool)
+	first[1:]=(allrows[1:]!=allrows[:-1]) | (allcols[1:]!=allcols[:-1])
+	allrows=allrows[first]
+	allcols=allcols[first]
+	allscores=allscores[first]
+	n=len(seqids)
+	indptr=np.zeros(n+1,dtype=np.int64)
+	np.cumsum(np.bincount(allrows,minlength=n),out=indptr[1:])
+	return SimMatrix(seqids,indptr,allcols.astype(np.int32),allscores)
+
+def GetSeqIndex(seqid,seqids,seqindex):
+	i=seqindex.get(seqid,-1)
+	if i==-1:
+		i=len(seqids)
+		seqindex[seqid]=i
+		seqids.append(seqid)
+	return i
+
+BINARYSIMMAGIC=b"DNBCSIM1"
+
+def IsBinarySim(simfilename):
+	simfile=open(simfilename,"rb")
+	magic=simfile.read(len(BINARYSIMMAGIC))
+	simfile.close()
+	return magic==BINARYSIMMAGIC
+
+keepsims=False
+loadedsims={}
+
+def KeepSims(keep=True):
+	global keepsims
+	keepsims=keep
+	if not keep:
+		loadedsims.clear()
+
+def LoadSim(simfilename):
+	with profiling.Stage("sim load") as stage:
+		simmatrix=LoadSimFile(simfilename)
+		stage.Count(sequences=len(simmatrix),edges=simmatrix.EdgeNumber())
+	return simmatrix
+
+def LoadSimFile(simfilename):
+	if keepsims:
+		path=os.path.abspath(simfilename)
+		stat=os.stat(simfilename)
+		if path in loadedsims.keys():
+			size,mtime,simmatrix=loadedsims[path]
+			if size==stat.st_size and mtime==stat.st_mtime:
+				return simmatrix
+	if IsBinarySim(simfilename):
+		simmatrix=LoadBinarySim(simfilename)
+	else:
+		simmatrix=LoadSims([simfilename])
+	if keepsims:
+		loadedsims[path]=[stat.st_size,stat.st_mtime,simmatrix]
+	return simmatrix
+
+def LoadSims(simfilenames):
+	#load the similarity matrices of the files into one, with the highest score of each pair
+	seqids=[]
+	seqindex={}
+	rows=array('i')
+	cols=array('i')
+	scores=array('f')
+	for simfilename in simfilenames:
+		simfile=open(simfilename)
+		for line in simfile:
+			texts=line.rstrip().split(" ")
+			if len(texts) < 3:
+				continue
+			rows.append(GetSeqIndex(texts[0],seqids,seqindex))
+			cols.append(GetSeqIndex(texts[1],seqids,seqindex))
+			scores.append(float(texts[2]))
+		simfile.close()
+	return BuildSimMatrix(seqids,np.frombuffer(rows,dtype=np.int32),np.frombuffer(cols,dtype=np.int32),np.frombuffer(scores,dtype=np.float32))
+
+def SaveSim(simmatrix,simfilename,minsim=0):
+	with profiling.Stage("sim save") as stage:
+		simfile=open(simfilename,"w")
+		t=np.float32(minsim)
+		for i in range(len(simmatrix.seqids)):
+			seqid=simmatrix.seqids[i]
+			simfile.write(seqid + " " + seqid + " 1\n")
+			cols,scores=simmatrix.Row(i)
+			mask=scores>=t
+			for j,score in zip(cols[mask].tolist(),scores[mask].tolist()):
+				simfile.write(seqid + " " + simmatrix.seqids[j] + " " + str(round(score,4)) + "\n")
+		simfile.close()
+		stage.Count(sequences=len(simmatrix),edges=simmatrix.EdgeNumber())
+
+def SaveBinarySim(simmatrix,simfilename,minsim=0,scoretype="float32"):
+	#save the matrix in the binary format, only with the scores >= minsim
+	with profiling.Stage("sim save") as stage:
+		indptr=np.asarray(simmatrix.indptr,dtype=np.int64)
+		indices=np.asarray(simmatrix.indices,dtype=np.int32)
+		scores=np.asarray(simmatrix.scores,dtype=np.float32)
+		if minsim > 0:
+			mask=scores>=np.float32(minsim)
+			rows=np.repeat(np.arange(len(simmatrix.seqids),dtype=np.int64),np.diff(indptr))
+			indptr=np.zeros(len(simmatrix.seqids)+1,dtype=np.int64)
+			np.cumsum(np.bincount(rows[mask],minlength=len(simmatrix.seqids)),out=indptr[1:])
+			indices=indices[mask]
+			scores=scores[mask]
+		ids=np.frombuffer("\n".join(simmatrix.seqids).encode(),dtype=np.uint8)
+		arrays=[("ids",ids),("indptr",indptr),("indices",indices),("scores",scores.astype(scoretype))]
+		header={"sequence number":len(simmatrix.seqids),"arrays":{}}
+		offset=0
+		for name,data in arrays:
+			header["arrays"][name]=[offset,str(data.dtype),len(data)]
+			offset=offset + data.nbytes
+			offset=offset + (-offset % 8)
+		headertext=json.dumps(header).encode()
+		headertext=headertext + b" "*(-(len(BINARYSIMMAGIC) + 8 + len(headertext)) % 8)
+		simfile=open(simfilename,"wb")
+		simfile.write(BINARYSIMMAGIC)
+		simfile.write(np.array([len(headertext)],dtype="<u8").tobytes())
+		simfile.write(headertext)
+		for name,data in arrays:
+			simfile.write(data.tobytes())
+			simfile.write(b"\0"*(-simfile.tell() % 8))
+		simfile.close()
+		stage.Count(sequences=len(simmatrix),edges=int(len(indices)/2))
+
+def LoadBinarySim(simfilename):
+	simfile=open(simfilename,"rb")
+	simfile.seek(len(BINARYSIMMAGIC))
+	headerlength=int(np.frombuffer(simfile.read(8),dtype="<u8")[0])
+	header=json.loads(simfile.read(headerlength).decode())
+	simfile.close()
+	#the offsets of the arrays are given from the end of the header
+	start=len(BINARYSIMMAGIC) + 8 + headerlength
+	arrays={}
+	for name,(offset,dtype,length) in header["arrays"].items():
+		if length==0:
+			arrays[name]=np.zeros(0,dtype=dtype)
+		else:
+			arrays[name]=np.memmap(simfilename,dtype=dtype,mode="r",offset=start + offset,shape=(length,))
+	seqids=[]
+	if header["sequence number"] > 0:
+		seqids=bytes(arrays["ids"]).decode().split("\n")
+	return SimMatrix(seqids,arrays["indptr"],arrays["indices"],arrays["scores"])
+
+def LoadSimFromBlastOutput(blastoutput,seqids,mincoverage):
+	#read a BLAST output in outfmt 6. The score of a pair is the highest identity, reduced for the alignments shorter than mincoverage.
+	return LoadSimFromBlastHits(ReadBlastOutput(blastoutput),seqids,mincoverage)
+
+def LoadSimFromBlastHits(hits,seqids,mincoverage):
+	seqids=list(seqids)
+	seqindex={}
+	i=0
+	for seqid in seqids:
+		seqindex[seqid]=i
+		i=i+1
+	queries=[]
+	for seqid in hits.queryids:
+		queries.append(GetSeqIndex(seqid,seqids,seqindex))
+	refs=[]
+	for seqid in hits.refids:
+		refs.append(GetSeqIndex(seqid,seqids,seqindex))
+	scores=[]
+	for score in hits.Scores(mincoverage).tolist():
+		scores.append(round(score,4))
+	rows=np.array(queries,dtype=np.int64)[hits.queries]
+	cols=np.array(refs,dtype=np.int64)[hits.refs]
+	return BuildSimMatrix(seqids,rows,cols,np.array(scores,dtype=np.float32))
+
+def ReducePairs(rows,cols,scores):
+	#the highest score of each pair, with rows < cols
+	rows,cols=np.minimum(rows,cols),np.maximum(rows,cols)
+	order=np.lexsort((-scores,cols,rows))
+	rows=rows[order]
+	cols=cols[order]
+	scores=scores[order]
+	first=np.ones(len(rows),dtype=bool)
+	first[1:]=(rows[1:]!=rows[:-1]) | (cols[1:]!=cols[:-1])
+	return rows[first],cols[first],scores[first]
+
+def StreamSimFromBlastLines(lines,seqids,mincoverage,minsim=0,chunksize=1000000):
+	#Read BLAST hits in outfmt 6 as they arrive. The pairs are reduced to their highest score every chunksize hits,
+	#and the hits with a score lower than minsim are not kept.
+	seqids=list(seqids)
+	seqindex={}
+	i=0
+	for seqid in seqids:
+		seqindex[seqid]=i
+		i=i+1
+	with profiling.Stage("blast parsing") as stage:
+		rows=np.zeros(0,dtype=np.int64)
+		cols=np.zeros(0,dtype=np.int64)
+		scores=np.zeros(0,dtype=np.float32)
+		chunkrows=array('i')
+		chunkcols=array('i')
+		chunkscores=array('f')
+		for line in lines:
+			if line.rstrip()=="":
+				continue
+			words=line.split("\t")
+			pos1=int(words[6])
+			pos2=int(words[7])
+			sim=float(words[2])/100
+			coverage=abs(pos2-pos1)
+			score=sim
+			if coverage < mincoverage:
+				score=float(score * coverage)/mincoverage
+			score=round(score,4)
+			if score < minsim:
+				continue
+			i=GetSeqIndex(words[0].rstrip(),seqids,seqindex)
+			j=GetSeqIndex(words[1].rstrip(),seqids,seqindex)
+			if i==j:
+				continue
+			chunkrows.append(i)
+			chunkcols.append(j)
+			chunkscores.append(score)
+			if len(chunkrows) >= chunksize:
+				rows,cols,scores=ReducePairs(np.concatenate((rows,np.frombuffer(chunkrows,dtype=np.int32))),np.concatenate((cols,np.frombuffer(chunkcols,dtype=np.int32))),np.concatenate((scores,np.frombuffer(chunkscores,dtype=np.float32))))
+				chunkrows=array('i')
+				chunkcols=array('i')
+				chunkscores=array('f')
+		rows,cols,scores=ReducePairs(np.concatenate((rows,np.frombuffer(chunkrows,dtype=np.int32))),np.concatenate((cols,np.frombuffer(chunkcols,dtype=np.int32))),np.concatenate((scores,np.frombuffer(chunkscores,dtype=np.float32))))
+		stage.Count(edges=len(rows))
+	return BuildSimMatrix(seqids,rows,cols,scores)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# FILE: taxonomyindex.py
+# CREATE DATE: 18 oct 2026
+#The classification of the sequences over integer sequence indices: the sequence i is seqids[i], and its taxon at a rank
+#is names[rank][codes[rank][i]], with the code -1 for a sequence without a taxon at the rank ("" or "unidentified").
+#The taxa of a rank are numbered in the order of their first sequence.
+#The clades of a rank among some of the sequences are given in a CSR layout: the sequences of the clade k are
+#indices[offsets[k]:offsets[k+1]], in their given order or grouped by their taxa at a lower rank, and the clades are in the
+#order of their first sequence.
+import numpy as np
+
+class TaxonomyIndex:
+	def __init__(self,seqids):
+		self.seqids=list(seqids)
+		self.codes={}
+		self.names={}
+
+	def __len__(self):
+		return len(self.seqids)
+
+	def AddRank(self,rank,classnames):
+		#the taxa of the sequences at the rank, given in the order of the sequences
+		codes=np.full(len(self.seqids),-1,dtype=np.int32)
+		names=[]
+		nameindex={}
+		i=0
+		for classname in classnames:
+			if classname!="" and classname!="unidentified":
+				code=nameindex.get(classname,-1)
+				if code==-1:
+					code=len(names)
+					nameindex[classname]=code
+					names.append(classname)
+				codes[i]=code
+			i=i+1
+		self.codes[rank]=codes
+		self.names[rank]=names
+
+	def GetSeqIds(self,indices):
+		seqids=self.seqids
+		return [seqids[i] for i in np.asarray(indices).tolist()]
+
+	def Clades(self,rank,indices=None,subrank=None):
+		#the clades of the rank among the given sequences (all of them by default) as (codes,offsets,indices).
+		#The sequences without a taxon at the rank are left out. If subrank is given, the sequences of a clade are
+		#grouped by their taxa at the subrank, in the order of the first sequence of each taxon in the clade.
+		if indices is None:
+			indices=np.arange(len(self.seqids),dtype=np.int64)
+		indices=np.asarray(indices,dtype=np.int64)
+		codes=self.codes[rank][indices]
+		indices=indices[codes>=0]
+		codes=codes[codes>=0]
+		cladecodes,first,labels=np.unique(codes,return_index=True,return_inverse=True)
+		#renumber the clades in the order of their first sequence
+		order=np.argsort(first,kind="stable")
+		positions=np.empty(len(order),dtype=np.int64)
+		positions[order]=np.arange(len(order),dtype=np.int64)
+		labels=positions[labels.reshape(-1)]
+		offsets=np.zeros(len(order)+1,dtype=np.int64)
+		np.cumsum(np.bincount(labels,minlength=len(order)),out=offsets[1:])
+		if subrank==None:
+			return cladecodes[order],offsets,indices[np.argsort(labels,kind="stable")]
+		#the position of the first sequence of the subclade of each sequence in its clade
+		subcodes=self.codes[subrank][indices].astype(np.int64) + 1
+		pairs,first,pairlabels=np.unique(labels*(len(self.names[subrank])+1) + subcodes,return_index=True,return_inverse=True)
+		return cladecodes[order],offsets,indices[np.lexsort((first[pairlabels.reshape(-1)],labels))]
@@ -6,6 +6,10 @@ import os
 import sys, argparse
 from Bio import SeqIO
 import multiprocessing
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.simmatrix import LoadSim,SaveSim,LoadSimFromBlastOutput
+from lib.clustering import ClusterNeighbors,ComputeClassFmeasure
+from lib import profiling
 
 parser=argparse.ArgumentParser(prog='cluster.py',  
 							   usage="%(prog)s [options] -i fastafile -t threshold -mc mincoverage -c classificationfilename -p classificationposition -o output",
@@ -21,22 +25,23 @@ parser.add_argument('-c','--classification', default="", help='the classificatio
 #parser.add_argument('-p','--classificationpos', type=int, default=0, help='the classification position to load the classification.')
 parser.add_argument('-rank','--classificationrank', default="", help='the classification rank to evaluate the clustering result.')
 parser.add_argument('-sim','--simfilename', help='The similarity matrix of the sequences if exists.')
-parser.add_argument('-maxsimmatrixsize','--maxSimMatrixSize', type=int, default=20000, help='The maximum number of sequences to load or compute a full similarity matrix. In case the number of sequences is greater than this number, only similarity values greater than 0 will be loaded to avoid memory problems.')
+parser.add_argument('-maxsimmatrixsize','--maxSimMatrixSize', type=int, default=20000, help='Ignored, kept for compatibility. The similarity matrix is always loaded as a sparse matrix of the similarity values greater than 0.')
 parser.add_argument('-idcolumnname','--idcolumnname',default="ID", help='the column name of sequence id in the classification file.')
 
-args=parser.parse_args()
-fastafilename= args.input
-threshold=args.cutoff
-mincoverage = args.minalignmentlength
-classificationfilename=args.classification
-rank=args.classificationrank
-#classificationpos=args.classificationpos
-simfilename=args.simfilename
-outputpath=args.out
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)
-
-nproc=multiprocessing.cpu_count()
+def ParseArguments(argv=None):
+	global args,fastafilename,threshold,mincoverage,classificationfilename,rank,simfilename,outputpath,nproc
+	args=parser.parse_args(argv)
+	fastafilename= args.input
+	threshold=args.cutoff
+	mincoverage = args.minalignmentlength
+	classificationfilename=args.classification
+	rank=args.classificationrank
+	#classificationpos=args.classificationpos
+	simfilename=args.simfilename
+	outputpath=args.out
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
+	nproc=multiprocessing.cpu_count()
 
 def GetBase(filename):
 	return filename[:-(len(filename)-filename.rindex("."))] 
@@ -67,39 +72,6 @@ def GetSeqIndex(seqname,seqlist):
 		i = i + 1
 	return -1
 	
-def LoadSim(simfilename):
-	simmatrix = {} #we use dictionary to reduce the memory constraints 
-	simfile = open(simfilename)
-	seqids=[]
-	for line in simfile:
-		numbers=line.rstrip().split(" ")
-		i=numbers[0]
-		j=numbers[1]
-		seqids.append(i)
-		seqids.append(j)
-		if i not in simmatrix.keys():
-			simmatrix.setdefault(i, {})
-		simmatrix[i][j]=float(numbers[2])
-	seqids=list(set(seqids))	
-	for seqid1 in seqids:
-		if not (seqid1 in simmatrix.keys()):
-			simmatrix.setdefault(seqid1, {})
-			simmatrix[seqid1][seqid1]=1	
-		if len(seqids) < args.maxSimMatrixSize: #load full matrix	
-			for seqid2 in seqids:
-				if not seqid2 in simmatrix[seqid1].keys():
-					#simmatrix[seqid1].setdefault(seqid2,0)
-					simmatrix[seqid1][seqid2]=0
-	simfile.close()		
-	return simmatrix
-	
-def SaveSim(simmatrix,simfilename):
-	simfile=open(simfilename,"w")
-	for i in simmatrix.keys():
-		for j in simmatrix[i].keys():
-			simfile.write(str(i) + " " + str(j) + " " + str(simmatrix[i][j]) + "\n")
-	simfile.close()	
-	
 def ComputeSim(fastafilename,seqrecords,mincoverage):
 	blastoutput = fastafilename + ".blast.out"		
 	blastdb=fastafilename + ".db"		
@@ -107,12 +79,14 @@ def ComputeSim(fastafilename,seqrecords,mincoverage):
 	print("Comparing the sequences of " + fastafilename + " using Blast...")
 	makedbcommand = "makeblastdb -in " + fastafilename + " -dbtype \'nucl\' " +  " -out " + blastdb
 	print(makedbcommand)
-	os.system(makedbcommand)
+	with profiling.Stage("makeblastdb"):
+		os.system(makedbcommand)
 	blastcommand = "blastn -query " + fastafilename + " -db  " + blastdb + " -task blastn-short -outfmt 6 -out " + blastoutput + " -num_threads " + str(nproc)
 	if mincoverage >=400:
 		blastcommand = "blastn -query " + fastafilename + " -db " + blastdb + " -outfmt 6 -out " + blastoutput + " -num_threads " + str(nproc)
 	print(blastcommand)
-	os.system(blastcommand)
+	with profiling.Stage("blastn",sequences=len(seqrecords)):
+		os.system(blastcommand)
 	if not os.path.exists(blastoutput):
 		print("Cannot compare the sequences of " + fastafilename + " using Blast...")
 		logfile=open(GetWorkingBase((os.path.basename(args.input))) + ".predict.log","w")
@@ -121,70 +95,16 @@ def ComputeSim(fastafilename,seqrecords,mincoverage):
 		logfile.write("No output for the BLAST command: " + blastcommand + "\n")
 		logfile.write("Please rerun prediction for " + os.path.basename(fastafilename) + ".")
 		logfile.close()
-		return {}
+		return None
 	print("Reading Blast results of " + fastafilename + "...")
-	simmatrix={}
-	for seqid1 in seqrecords.keys():
-		simmatrix.setdefault(seqid1,{})
-		for seqid2 in seqrecords.keys():
-			if seqid1==seqid2:
-				simmatrix[seqid1][seqid2]=1
-			elif len(seqrecords.keys()) < args.maxSimMatrixSize: #load full matrix	
-				simmatrix[seqid1][seqid2]=0
-	#read blast output
-	blastoutputfile = open(blastoutput)
-	score=0
-	for line in blastoutputfile:
-		if line.rstrip()=="":
-			continue
-		words = line.split("\t")
-		i = words[0].rstrip()
-		j = words[1].rstrip()
-		pos1 = int(words[6])
-		pos2 = int(words[7])
-		iden = float(words[2]) 
-		sim=float(iden)/100
-		coverage=abs(pos2-pos1)
-		score=sim
-		if coverage < mincoverage:
-			score=float(score * coverage)/mincoverage
-		if len(seqrecords.keys()) < args.maxSimMatrixSize: #the full sim matrix has been loaded 
-			if simmatrix[i][j] < score:
-				simmatrix[i][j]=round(score,4)
-				simmatrix[j][i]=round(score,4)
-		else:		
-			if j in simmatrix[i].keys():
-				if simmatrix[i][j] < score:
-					simmatrix[i][j]=round(score,4)
-					simmatrix[j][i]=round(score,4)
-			else:
-				simmatrix[i][j]=round(score,4)
-				simmatrix[j][i]=round(score,4)	
-		#simmatrix[j][i]=score
+	simmatrix=LoadSimFromBlastOutput(blastoutput,seqrecords.keys(),mincoverage)
 	os.system("rm " + blastoutput)
 	os.system("rm " + blastdb + "*")
 	#os.system("rm " + blastdb + ".*")
 	return simmatrix
 
 def LoadNeighbors(seqids,subsimmatrix,threshold):
-	neighbordict={}
-	for seqid in seqids:
-		neighbordict.setdefault(seqid, [])
-	if len(subsimmatrix.keys()) < args.maxSimMatrixSize:	 #the full matrix has been loaded
-		for i in seqids:
-			for j in seqids:
-				if subsimmatrix[i][j] >= threshold:
-					neighbordict[i].append(j)
-					neighbordict[j].append(i)
-	else:
-		for i in seqids:
-			for j in seqids:
-				if j in subsimmatrix[i].keys():
-					if subsimmatrix[i][j] >= threshold:
-						neighbordict[i].append(j)
-						neighbordict[j].append(i)					
-	#os.system("rm out.txt")
-	return neighbordict
+	return subsimmatrix.LoadNeighbors(seqids,threshold)
 
 def LoadPoints(neigbordict,seqrecords):
 	points={}
@@ -193,37 +113,26 @@ def LoadPoints(neigbordict,seqrecords):
 		points[seqid]=point
 	return points
 
-def ExpandCluster(root,cluster,points):
-	for i in root.neighbors:
-		if points[i].flag==False:
-			points[i].flag=True
-			cluster.pointids.append(i)
-			ExpandCluster(points[i],cluster,points)		
-
 def Cluster(points,clusters):
+	neighbordict={}
 	for pointid in points.keys():
-		if points[pointid].flag==False:
-			points[pointid].flag=True
-			cluster = ClusterDef(len(clusters),[])
-			cluster.pointids.append(pointid)
-			ExpandCluster(points[pointid], cluster,points)
-			clusters.append(cluster)			
-		
+		neighbordict[pointid]=points[pointid].neighbors
+	with profiling.Stage("clustering",sequences=len(points)) as stage:
+		for pointids in ClusterNeighbors(neighbordict):
+			for pointid in pointids:
+				points[pointid].flag=True
+			cluster = ClusterDef(len(clusters),pointids)
+			clusters.append(cluster)
+		stage.Count(clusters=len(clusters))
+
 def ComputeFmeasure(classes,clusters):
 	#compute F-measure
-	f=0
-	n=0
-	for classname in classes.keys():
-		group=classes[classname]
-		m = 0
-		for cluster in clusters:
-			i = len(set(group) & set(cluster.pointids))
-			v = float(2*i)/float((len(group) + len(cluster.pointids)))
-			if m < v:
-				m=v		
-		n = n + len(group)
-		f = f +	(len(group)*m)	
-	return float(f)/float(n) 
+	clusterpointids=[]
+	for cluster in clusters:
+		clusterpointids.append(cluster.pointids)
+	with profiling.Stage("f-measure",clades=len(classes),clusters=len(clusters)):
+		fmeasure,bestclusterdict=ComputeClassFmeasure(classes,clusterpointids)
+	return fmeasure
 
 def GetTaxonName(description,rank):
 	taxonname=""
@@ -360,30 +269,37 @@ def GetPosition(classificationfilename,rank):
 		isError=True
 	return seqidpos,pos,isError
 
-if __name__ == "__main__":
+def main(argv=None):
+	global simfilename
+	ParseArguments(argv)
 	outputname=GetWorkingBase(fastafilename) + ".clustered"	
 	if simfilename=="" or simfilename==None:
 		simfilename=GetWorkingBase(fastafilename) + ".sim"
-	seqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
-	sys.setrecursionlimit(len(seqrecords)*2)
+	with profiling.Stage("fasta load") as stage:
+		seqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
+		stage.Count(sequences=len(seqrecords))
 	#seqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
 	classes = {}
 	classification={}
-	if classificationfilename!="":
-		seqidpos,classificationpos,isError=GetPosition(classificationfilename,rank)
-		if isError==False:
-			classes,classification=LoadClasses(seqrecords.keys(),classificationfilename,classificationpos,seqidpos)
-	else:
-		classes,classification=LoadClassesFromDescription(seqrecords,rank)	
+	with profiling.Stage("classification load") as stage:
+		if classificationfilename!="":
+			seqidpos,classificationpos,isError=GetPosition(classificationfilename,rank)
+			if isError==False:
+				classes,classification=LoadClasses(seqrecords.keys(),classificationfilename,classificationpos,seqidpos)
+		else:
+			classes,classification=LoadClassesFromDescription(seqrecords,rank)	
+		stage.Count(clades=len(classes))
 	#load similarity matrix
 	#simmatrix = [[0 for x in range(len(seqrecords))] for y in range(len(seqrecords))]
-	simmatrix={} 
+	simmatrix=None
 	if os.path.exists(simfilename):
 		print("Loading similarity matrix " + simfilename)
 		simmatrix=LoadSim(simfilename)
 	else:	
 		print("Computing similarity matrix...")
 		simmatrix=ComputeSim(fastafilename,seqrecords,mincoverage)
+		if simmatrix==None:
+			sys.exit()
 		print("Save similarity matrix " + simfilename)
 		SaveSim(simmatrix,simfilename)
 	#load neighbors
@@ -397,7 +313,9 @@ if __name__ == "__main__":
 		print("Threshold\tFmeasure")
 		print(str(threshold) + "\t" + str(fmeasure))
 	print("Saving clusters...")	
-	SaveClusters(clusters,seqrecords,classification,outputname)
+	with profiling.Stage("output writing"):
+		SaveClusters(clusters,seqrecords,classification,outputname)
 	print("The clustering result is saved in file " + outputname + ".")
 
-
+if __name__ == "__main__":
+	main()
@@ -15,6 +15,8 @@ import json
 from Bio import SeqIO
 #import random
 import multiprocessing
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import profiling
 parser=argparse.ArgumentParser(prog='computeBestCutoffs.py',  
 							   usage="%(prog)s [options] -i cutoffs -c classificationfile -o output",
 							   description='''Script that computes best cutoffs of the taxa given in the cutoffs and classification file for sequence identification at different taxonomic levels.''',
@@ -31,19 +33,19 @@ parser.add_argument('-cutoffs','--cutoffs', help='The json file containing the c
 parser.add_argument('-prefix','--prefix', help='the prefix of output filenames')
 parser.add_argument('-savebestcutoffsascutoffs','--savebestcutoffsascutoffs', default="yes", help='the prefix of output filenames')
 
-args=parser.parse_args()
-classificationfilename=args.classification
-fastafilename=args.fasta
-cutoffsfilename=args.input
-outputpath=args.out
-prefix=args.prefix
-#minGroupNo=args.mingroupno
-#minSeqNo=args.minseqno
-
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)
-
-nproc=multiprocessing.cpu_count()
+def ParseArguments(argv=None):
+	global args,classificationfilename,fastafilename,cutoffsfilename,outputpath,prefix,nproc
+	args=parser.parse_args(argv)
+	classificationfilename=args.classification
+	fastafilename=args.fasta
+	cutoffsfilename=args.input
+	outputpath=args.out
+	prefix=args.prefix
+	#minGroupNo=args.mingroupno
+	#minSeqNo=args.minseqno
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
+	nproc=multiprocessing.cpu_count()
 
 def GetBase(filename):
 	return filename[:-(len(filename)-filename.rindex("."))]
@@ -209,6 +211,7 @@ def LoadClassification(classificationfilename):
 def LoadClassificationFromDescription(fastafilename):
 	if fastafilename == "":
 		return {}
+	classificationdict={}
 	#load sequences
 	seqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
 	for seqid in seqrecords.keys():
@@ -683,7 +686,9 @@ def SaveCutoffsForTaxa(classificationdict,jsonoutputname_taxa,txtoutputname_taxa
 			json.dump(newclassificationdict,json_file,indent=2)
 		else:
 			json.dump(newclassificationdict,json_file,encoding='latin1',indent=2)
-if __name__ == "__main__":
+def main(argv=None):
+	global prefix
+	ParseArguments(argv)
 	if prefix=="" or prefix==None:
 		prefix=GetBase(os.path.basename(cutoffsfilename))
 	jsonoutputname_rank=GetWorkingBase(prefix) + ".best.json"		
@@ -697,17 +702,20 @@ if __name__ == "__main__":
 		with open(cutoffsfilename) as cutoffsfile:
 			cutoffs = json.load(cutoffsfile)
 	classificationdict={}	
-	if classificationfilename!="":	
-		classificationdict= LoadClassification(classificationfilename)
-	elif fastafilename!="":
-		classificationdict= LoadClassificationFromDescription(fastafilename)
-	else:
-		print("Please give provide a tab-delimited formated file containing taxonomic classification using -c or a FASTA file with sequence description containing taxonomic classification using -f.")
-		sys.exit()
-	if args.savebestcutoffsascutoffs=="yes":
-		count,total,count1,total1,globaltotal,globalcount=SaveBestCutoffsAsCutoffs(cutoffs,classificationdict,jsonoutputname_rank,txtoutputname_rank,problematicoutputname,problematicoutputname1)
-	else:
-		count,total,count1,total1,globaltotal,globalcount=SaveBestCutoffs(cutoffs,classificationdict,jsonoutputname_rank,txtoutputname_rank,problematicoutputname,problematicoutputname1)
+	with profiling.Stage("classification load") as stage:
+		if classificationfilename!="":	
+			classificationdict= LoadClassification(classificationfilename)
+		elif fastafilename!="":
+			classificationdict= LoadClassificationFromDescription(fastafilename)
+		else:
+			print("Please give provide a tab-delimited formated file containing taxonomic classification using -c or a FASTA file with sequence description containing taxonomic classification using -f.")
+			sys.exit()
+		stage.Count(clades=len(classificationdict))
+	with profiling.Stage("best cut-offs"):
+		if args.savebestcutoffsascutoffs=="yes":
+			count,total,count1,total1,globaltotal,globalcount=SaveBestCutoffsAsCutoffs(cutoffs,classificationdict,jsonoutputname_rank,txtoutputname_rank,problematicoutputname,problematicoutputname1)
+		else:
+			count,total,count1,total1,globaltotal,globalcount=SaveBestCutoffs(cutoffs,classificationdict,jsonoutputname_rank,txtoutputname_rank,problematicoutputname,problematicoutputname1)
 	if globaltotal >0:	
 		print("The number of taxa having higher or equal prediction confidence than the global confidence: " + str(globalcount) + "/" + str(globaltotal) + " (" + str(round(globalcount*100/globaltotal,2)) +"%).")
 	if total >0:
@@ -722,7 +730,11 @@ if __name__ == "__main__":
 	#Add cutoffs and confidence measures to classificationdict
 	AddCutoffsToTaxonomy(classificationdict, cutoffs)	
 	if classificationdict!={}:
-		SaveCutoffsForTaxa(classificationdict,jsonoutputname_taxa,txtoutputname_taxa)
+		with profiling.Stage("output writing"):
+			SaveCutoffsForTaxa(classificationdict,jsonoutputname_taxa,txtoutputname_taxa)
 		print("The best similarity cut-offs to assign sequences to the taxa given in the classification file are saved in json and text format files " + jsonoutputname_taxa + " and " + txtoutputname_taxa + ".")
 		
-	
\ No newline at end of file
+	
+
+if __name__ == "__main__":
+	main()
@@ -18,9 +18,11 @@ parser.add_argument('-i','--input', required=True, help='A list of cutoffs filen
 parser.add_argument('-o','--out', help='The merged file of cutoffs.')
 
 
-args=parser.parse_args()
-dictionarylist= args.input
-outputfilename=args.out
+def ParseArguments(argv=None):
+	global args,dictionarylist,outputfilename
+	args=parser.parse_args(argv)
+	dictionarylist= args.input
+	outputfilename=args.out
 
 
 def SaveCutoffs(mergeddict,outputfilename):
@@ -73,37 +75,40 @@ def SaveCutoffs(mergeddict,outputfilename):
 	textfile.close()
 	print("The outputs are saved in " + outputfilename + " and " + textoutput + ".")
 ####MAIN####
-dictionaries=[]
-if "," in dictionarylist:
-	dictionaries=dictionarylist.split(",")
-else:
-	dictionaries.append(dictionarylist)	
-mergeddict={}	
-for dictionaryname in dictionaries:
-	cutoffdict={}
-	#load classes
-	with open(dictionaryname,encoding='latin1') as json_file:
-		cutoffdict = json.load(json_file)
-	if cutoffdict!={}:	
-		for rank in cutoffdict.keys():
-			if not (rank in mergeddict.keys()):
-				mergeddict.setdefault(rank,{})
-			mergeddatasets=mergeddict[rank]	
-			datasets=cutoffdict[rank]
-			for datasetname in datasets.keys():
-				dataset=datasets[datasetname]
-				confidence=0
-				if "confidence" in dataset.keys():
-					confidence=float(dataset["confidence"])
-				if not (datasetname in mergeddatasets.keys()):
-					mergeddatasets.setdefault(datasetname,{})
-				mergeddataset=mergeddatasets[datasetname]
-				mergedconfidence=0
-				if "confidence" in mergeddataset.keys():
-					mergedconfidence=float(mergeddataset["confidence"])
-				if mergedconfidence < confidence:
-					mergeddataset=dataset.copy()
-				mergeddatasets[datasetname]=mergeddataset	
-SaveCutoffs(mergeddict,outputfilename)
-
+def main(argv=None):
+	ParseArguments(argv)
+	dictionaries=[]
+	if "," in dictionarylist:
+		dictionaries=dictionarylist.split(",")
+	else:
+		dictionaries.append(dictionarylist)	
+	mergeddict={}	
+	for dictionaryname in dictionaries:
+		cutoffdict={}
+		#load classes
+		with open(dictionaryname,encoding='latin1') as json_file:
+			cutoffdict = json.load(json_file)
+		if cutoffdict!={}:	
+			for rank in cutoffdict.keys():
+				if not (rank in mergeddict.keys()):
+					mergeddict.setdefault(rank,{})
+				mergeddatasets=mergeddict[rank]	
+				datasets=cutoffdict[rank]
+				for datasetname in datasets.keys():
+					dataset=datasets[datasetname]
+					confidence=0
+					if "confidence" in dataset.keys():
+						confidence=float(dataset["confidence"])
+					if not (datasetname in mergeddatasets.keys()):
+						mergeddatasets.setdefault(datasetname,{})
+					mergeddataset=mergeddatasets[datasetname]
+					mergedconfidence=0
+					if "confidence" in mergeddataset.keys():
+						mergedconfidence=float(mergeddataset["confidence"])
+					if mergedconfidence < confidence:
+						mergeddataset=dataset.copy()
+					mergeddatasets[datasetname]=mergeddataset	
+	SaveCutoffs(mergeddict,outputfilename)
 
+if __name__ == "__main__":
+	main()
@@ -7,13 +7,18 @@
 import os, argparse
 import sys
 from Bio import SeqIO
-import matplotlib.pyplot as plt
-plt.rc('font',size=6)
 #from matplotlib.patches import Polygon
 import numpy as np
 import multiprocessing
 import json
 import random
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.simmatrix import LoadSim,SaveSim,LoadSimFromBlastHits
+from lib.blast import ReadBlastOutput
+from lib.blastcache import BlastCache
+from lib.clustering import SweepFmeasures,ConnectedComponents,ContingencyFmeasure,MergeComplexes
+from lib.taxonomyindex import TaxonomyIndex
+from lib import profiling
 
 parser=argparse.ArgumentParser(prog='predict.py', 
 							   usage="%(prog)s [options] -i fastafile -c classificationfile -p classificationposition -st startingthreshold -et endthreshold -s step -ml minalignmentlength",
@@ -34,6 +39,8 @@ parser.add_argument('-et','--endthreshold', type=float, default=0, help='ending
 parser.add_argument('-s','--step', type=float, default=0.001, help='the step to be increased for the threshold after each step of the prediction.')
 parser.add_argument('-ml','--minalignmentlength', type=int,default=400, help='Minimum sequence alignment length required for BLAST. For short barcode sequences like ITS2 (ITS1) sequences, minalignmentlength should probably be set to smaller, 50 for instance.')
 parser.add_argument('-sim','--simfilename', help='The similarity matrix of the sequences if exists.')
+parser.add_argument('-blastcache','--blastcache', default="", help='The folder to cache the BLAST results for the next runs. If blastcache=="", the BLAST results are not cached.')
+parser.add_argument('-blastcachesize','--blastcachesize', type=int, default=10000, help='The maximum size in MB of the BLAST cache. The least recently used results are removed first.')
 #parser.add_argument('-hp','--higherclassificationpositions', default="", help='The prediction is based on the whole dataset if hp="". Otherwise it will be predicted based on different datasets obtained at the higher classifications, separated by ",".')
 parser.add_argument('-higherrank','--higherclassificationranks', default="", help='The prediction is done on the whole dataset if higherranks="". Otherwise it will be predicted for different datasets obtained at the higher classifications, separated by ",".')
 parser.add_argument('-mingroupno','--mingroupno', type=int, default=10, help='The minimum number of groups needed for prediction.')
@@ -43,35 +50,39 @@ parser.add_argument('-maxproportion','--maxproportion', type=float, default=1, h
 parser.add_argument('-taxa','--taxa', default="", help='The selected taxa separated by commas for local prediction. If taxa=="", all the clades at the given higher positions are selected for prediction.')
 parser.add_argument('-removecomplexes','--removecomplexes',default="", help='If removecomplexes="yes", indistinguishable groups will be removed before the prediction.')
 parser.add_argument('-redo','--redo', default="", help='Recompute F-measure for the current parameters.')
+parser.add_argument('-ncpus','--ncpus', type=int, default=1, help='The number of processes to predict the cut-offs of the datasets obtained at the higher classifications in parallel.')
+parser.add_argument('-incremental','--incremental', default="yes", help='If incremental="yes", the F-measures of all the thresholds are computed in one sweep over the similarity scores. Otherwise the sequences are clustered again for every threshold.')
 parser.add_argument('-idcolumnname','--idcolumnname',default="ID", help='the column name of sequence id in the classification file.')
 parser.add_argument('-display','--display',default="", help='If display=="yes" then the plot figure is displayed.')
 
-args=parser.parse_args()
-fastafilename= args.input
-classificationfilename=args.classification
-#classificationpos=args.classificationpositions
-#higherclassificationpos=args.higherclassificationpositions
-classificationranks=args.classificationranks
-higherclassificationranks=args.higherclassificationranks
-threshold = args.startingthreshold
-endthreshold=args.endthreshold
-step=args.step
-mincoverage=args.minalignmentlength
-outputfolder=args.out
-simfilename=args.simfilename
-minGroupNo=args.mingroupno
-minSeqNo=args.minseqno
-#taxa=args.taxa
-prefix=args.prefix
-label=args.label
-outputpath=args.out
-redo=args.redo
-
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)
-
-
-nproc=multiprocessing.cpu_count()
+def ParseArguments(argv=None):
+	global args,fastafilename,classificationfilename,classificationranks,higherclassificationranks,threshold,endthreshold,step,mincoverage,outputfolder,simfilename,minGroupNo,minSeqNo,prefix,label,outputpath,redo,blastcache,nproc
+	args=parser.parse_args(argv)
+	fastafilename= args.input
+	classificationfilename=args.classification
+	#classificationpos=args.classificationpositions
+	#higherclassificationpos=args.higherclassificationpositions
+	classificationranks=args.classificationranks
+	higherclassificationranks=args.higherclassificationranks
+	threshold = args.startingthreshold
+	endthreshold=args.endthreshold
+	step=args.step
+	mincoverage=args.minalignmentlength
+	outputfolder=args.out
+	simfilename=args.simfilename
+	minGroupNo=args.mingroupno
+	minSeqNo=args.minseqno
+	#taxa=args.taxa
+	prefix=args.prefix
+	label=args.label
+	outputpath=args.out
+	redo=args.redo
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
+	blastcache=None
+	if args.blastcache!="":
+		blastcache=BlastCache(args.blastcache,args.blastcachesize*1024*1024)
+	nproc=multiprocessing.cpu_count()
 
 def GetBase(filename):
 	return filename[:-(len(filename)-filename.rindex("."))]  
@@ -87,18 +98,6 @@ def GetWorkingBase(filename):
 	path=outputpath + "/" + filename
 	return path
 
-class PointDef:
-	def __init__(self, id,flag,neighbors,seqrecord):
-		self.id=id
-		self.flag=flag
-		self.neighbors = neighbors
-		self.seqrecord=seqrecord
-
-class ClusterDef:
-	def __init__(self, id, pointids):
-		self.id=id
-		self.pointids=pointids
-
 def GetSeqIndex(seqname,seqlist):
 	i=0
 	for seq in seqlist:
@@ -107,53 +106,32 @@ def GetSeqIndex(seqname,seqlist):
 		i = i + 1
 	return -1
 	
-def LoadSim(simfilename):
-	simmatrix = {} #we use dictionary to reduce the memory constraints 
-	simfile = open(simfilename)
-	seqids=[]
-	for line in simfile:
-		numbers=line.rstrip().split(" ")
-		i=numbers[0]
-		j=numbers[1]
-		seqids.append(i)
-		seqids.append(j)
-		if i not in simmatrix.keys():
-			simmatrix.setdefault(i, {})
-		simmatrix[i][j]=float(numbers[2])
-	seqids=list(set(seqids))	
-	for seqid1 in seqids:
-		if not (seqid1 in simmatrix.keys()):
-			simmatrix.setdefault(seqid1, {})
-			simmatrix[seqid1][seqid1]=1	
-		#if len(seqids) < args.maxSimMatrixSize: #load full matrix
-		for seqid2 in seqids:
-			if not seqid2 in simmatrix[seqid1].keys():
-				#simmatrix[seqid1].setdefault(seqid2,0)
-				simmatrix[seqid1][seqid2]=0
-	simfile.close()		
-	return simmatrix
-
-def SaveSim(simmatrix,simfilename):
-	simfile=open(simfilename,"w")
-	for i in simmatrix.keys():
-		for j in simmatrix[i].keys():
-			simfile.write(str(i) + " " + str(j) + " " + str(simmatrix[i][j]) + "\n")
-	simfile.close()
-	
-def ComputeSim(fastafilename,seqrecords,mincoverage):
+def ComputeSim(fastafilename,seqids,mincoverage):
+	task="blastn-short"
+	if mincoverage >=400:
+		task="megablast"
+	if blastcache!=None:
+		hits=blastcache.Load([seqrecords[seqid] for seqid in seqids],None,task)
+		if hits!=None:
+			print("The BLAST results of " + fastafilename + " are loaded from the cache " + args.blastcache + ".")
+			return LoadSimFromBlastHits(hits,seqids,mincoverage)
 	blastoutput = fastafilename + ".blast.out"		
 	blastdb=fastafilename + ".db"		
 	#blast
 	print("Comparing the sequences of " + fastafilename + " using Blast...")
 	makedbcommand = "makeblastdb -in " + fastafilename + " -dbtype \'nucl\' " +  " -out " + blastdb
 	print(makedbcommand)
-	os.system(makedbcommand)
+	with profiling.Stage("makeblastdb"):
+		dbstatus=os.system(makedbcommand)
 	blastcommand = "blastn -query " + fastafilename + " -db  " + blastdb + " -task blastn-short -outfmt 6 -out " + blastoutput + " -num_threads " + str(nproc)
 	if mincoverage >=400:
 		blastcommand = "blastn -query " + fastafilename + " -db " + blastdb + " -outfmt 6 -out " + blastoutput + " -num_threads " + str(nproc)
 	print(blastcommand)
-	os.system(blastcommand)
-	if not os.path.exists(blastoutput):
+	with profiling.Stage("blastn",sequences=len(seqids)):
+		status=os.system(blastcommand)
+	#the output of a failed run is incomplete, so it is neither used nor cached
+	if dbstatus!=0 or status!=0 or not os.path.exists(blastoutput):
+		os.system("rm -f " + blastoutput + " " + blastdb + "*")
 		print("Cannot compare the sequences of " + fastafilename + " using Blast...")
 		logfile=open(GetWorkingBase((os.path.basename(args.input))) + ".predict.log","w")
 		logfile.write("Cannot compare the sequences of " + fastafilename + " using Blast...")
@@ -161,116 +139,43 @@ def ComputeSim(fastafilename,seqrecords,mincoverage):
 		logfile.write("No output for the BLAST command: " + blastcommand + "\n")
 		logfile.write("Please rerun prediction for " + os.path.basename(fastafilename) + ".")
 		logfile.close()
-		return {}
+		return None
 	print("Reading Blast results of " + fastafilename + "...")
-	simmatrix={}
-	for seqid1 in seqrecords.keys():
-		simmatrix.setdefault(seqid1,{})
-		for seqid2 in seqrecords.keys():
-			if seqid1==seqid2:
-				simmatrix[seqid1][seqid2]=1
-			#elif len(seqrecords.keys()) < args.maxSimMatrixSize: #load full matrix
-			else:
-				simmatrix[seqid1][seqid2]=0
-	#read blast output
-	blastoutputfile = open(blastoutput)
-	score=0
-	for line in blastoutputfile:
-		if line.rstrip()=="":
-			continue
-		words = line.split("\t")
-		i = words[0].rstrip()
-		j = words[1].rstrip()
-		pos1 = int(words[6])
-		pos2 = int(words[7])
-		iden = float(words[2]) 
-		sim=float(iden)/100
-		coverage=abs(pos2-pos1)
-		score=sim
-		if coverage < mincoverage:
-			score=float(score * coverage)/mincoverage
-		if simmatrix[i][j] < score:
-			simmatrix[i][j] = round(score, 4)
-			simmatrix[j][i] = round(score, 4)
-		# if len(seqrecords.keys()) < args.maxSimMatrixSize: #the full sim matrix has been loaded
-		# 	if simmatrix[i][j] < score:
-		# 		simmatrix[i][j]=round(score,4)
-		# 		simmatrix[j][i]=round(score,4)
-		# else:
-		# 	if j in simmatrix[i].keys():
-		# 		if simmatrix[i][j] < score:
-		# 			simmatrix[i][j]=round(score,4)
-		# 			simmatrix[j][i]=round(score,4)
-		# 	else:
-		# 		simmatrix[i][j]=round(score,4)
-		# 		simmatrix[j][i]=round(score,4)
+	hits=ReadBlastOutput(blastoutput)
+	if blastcache!=None:
+		blastcache.Save([seqrecords[seqid] for seqid in seqids],None,task,hits)
+	simmatrix=LoadSimFromBlastHits(hits,seqids,mincoverage)
 	os.system("rm " + blastoutput)
 	os.system("rm " + blastdb + "*")
 	#os.system("rm " + blastdb + ".*")
 	return simmatrix
 
-def LoadNeighbors(seqids,subsimmatrix,threshold):
-	neighbordict={}
-	for seqid in seqids:
-		neighbordict.setdefault(seqid, [])
-	for i in seqids:
-		for j in seqids:
-			if subsimmatrix[i][j] >= threshold:
-				neighbordict[i].append(j)
-				neighbordict[j].append(i)
-	# if len(subsimmatrix.keys()) < args.maxSimMatrixSize:	 #the full matrix has been loaded
-	# 	for i in seqids:
-	# 		for j in seqids:
-	# 			if subsimmatrix[i][j] >= threshold:
-	# 				neighbordict[i].append(j)
-	# 				neighbordict[j].append(i)
-	# else:
-	# 	for i in seqids:
-	# 		for j in seqids:
-	# 			if j in subsimmatrix[i].keys():
-	# 				if subsimmatrix[i][j] >= threshold:
-	# 					neighbordict[i].append(j)
-	# 					neighbordict[j].append(i)
-	return neighbordict
-
-def LoadPoints(neigbordict,seqrecords):
-	points={}
-	for seqid in  seqrecords.keys():
-		point = PointDef(seqid,False,neigbordict[seqid],seqrecords[seqid])
-		points[seqid]=point
-	return points
-
-def ExpandCluster(root,cluster,points):
-	for i in root.neighbors:
-		if points[i].flag==False:
-			points[i].flag=True
-			cluster.pointids.append(i)
-			ExpandCluster(points[i],cluster,points)		
-
-def Cluster(points,clusters):
-	for pointid in points.keys():
-		if points[pointid].flag==False:
-			points[pointid].flag=True
-			cluster = ClusterDef(len(clusters),[])
-			cluster.pointids.append(pointid)
-			ExpandCluster(points[pointid], cluster,points)
-			clusters.append(cluster)
-			
-def ComputeFmeasure(classes,clusters):
-	#compute F-measure
-	f=0
-	n=0
-	for classname in classes.keys():
-		group=classes[classname]
-		m = 0
-		for cluster in clusters:
-			i = len(set(group) & set(cluster.pointids))
-			v = float(2*i)/float((len(group) + len(cluster.pointids)))
-			if m < v:
-				m=v		
-		n = n + len(group)
-		f = f +	(len(group)*m)	
-	return float(f)/float(n)
+def LoadNeighbors(subsimmatrix,threshold):
+	#the neighbors of the sequences with a score >= threshold, in a CSR layout
+	kept=subsimmatrix.scores >= np.float32(threshold)
+	keptnumbers=np.zeros(len(kept)+1,dtype=np.int64)
+	np.cumsum(kept,out=keptnumbers[1:])
+	return keptnumbers[subsimmatrix.indptr].tolist(),subsimmatrix.indices[kept].tolist()
+
+def Cluster(indptr,indices):
+	#the cluster of each sequence and the number of clusters
+	n=len(indptr)-1
+	clusterlabels=np.empty(n,dtype=np.int64)
+	with profiling.Stage("clustering",sequences=n) as stage:
+		c=0
+		for component in ConnectedComponents(indptr,indices):
+			clusterlabels[component]=c
+			c=c+1
+		stage.Count(clusters=c)
+	return clusterlabels,c
+
+def ComputeFmeasure(offsets,clusterlabels,clusternumber):
+	#compute F-measure of the clusters for the classes given by their offsets
+	classnumber=len(offsets)-1
+	classlabels=np.repeat(np.arange(classnumber,dtype=np.int64),np.diff(offsets))
+	with profiling.Stage("f-measure",clades=classnumber,clusters=clusternumber):
+		fmeasure,bestclusters,bestscores=ContingencyFmeasure(classlabels,clusterlabels,classnumber,clusternumber)
+	return fmeasure
 
 def LoadClassification(classificationfilename,rank,higherranklist):
 	allclassification={}
@@ -300,46 +205,29 @@ def LoadClassification(classificationfilename,rank,higherranklist):
 	classificationfile.close()
 	return allclassification
 
-def LoadClasses(records,rank,allclassification):
-	classification={}
-	classes={}
-	for seqid in records.keys():
-		description=seqrecords[seqid].description
-		classname=""
-		if allclassification=={}:
-			classname=GetTaxonName(description,rank)
-		else:
-			try:
-				classname = allclassification[seqid][rank]
-			except KeyError:
-				continue
-		classification[seqid]=classname
-		if classname in classes.keys():
-			classes[classname].append(seqid)
-		else:
-			classes.setdefault(classname,[seqid]) 
-	return classes,classification
+def LoadTaxonomyIndex(rank,higherranklist,allclassification):
+	#the taxa of the sequences at the rank and the higher ranks, from the classification or else from the descriptions
+	taxonomyindex=TaxonomyIndex(seqrecords.keys())
+	for classificationrank in [rank] + higherranklist:
+		classnames=[]
+		for seqid in taxonomyindex.seqids:
+			if classificationfilename=="":
+				classnames.append(GetTaxonName(seqrecords[seqid].description,classificationrank))
+			else:
+				classnames.append(allclassification.get(seqid,{}).get(classificationrank,""))
+		taxonomyindex.AddRank(classificationrank,classnames)
+	return taxonomyindex
 
-def LoadClassesFromClassification(records,classification):
-	classes={}
-	for seqid in records.keys():
-		try:
-			classname=classification[seqid]
-		except KeyError:
-			continue
-		if classname in classes.keys():
-			classes[classname].append(seqid)
-		else:
-			classes.setdefault(classname,[seqid])
-	return classes
+def LoadClasses(taxonomyindex,rank,members):
+	#the classes of the sequences of a dataset, as (codes,offsets,members) with the members grouped by class
+	return taxonomyindex.Clades(rank,members)
 
-def ComputeMaxProportion(classes,seqno):
+def ComputeMaxProportion(offsets,seqno):
 	maxproportion=0
+	sizes=np.diff(offsets).tolist()
 	if seqno==0:
-		for classname in classes.keys():
-			seqno=seqno + len(classes[classname])
-	for classname in classes.keys():
-		n=len(classes[classname])
+		seqno=sum(sizes)
+	for n in sizes:
 		if maxproportion < float(n/seqno):
 			maxproportion= round(float(n/seqno),4)
 	return maxproportion
@@ -351,87 +239,70 @@ def isfloat(value):
   except ValueError:
     return False
 
-def ComputeSubSim(datasetname,records,simmatrix):
-#	if datasetname=="All":
-#		return simmatrix
-#	subsimmatrix={}
-	if simmatrix!={}:
-#		for seqid1 in records.keys():
-#			subsimmatrix.setdefault(seqid1,{})
-#			for seqid2 in records.keys():
-#				subsimmatrix[seqid1][seqid2]=simmatrix[seqid1][seqid2]	
-		return simmatrix
+def ComputeSubSim(datasetname,members,simmatrix):
+	seqids=taxonomyindex.GetSeqIds(members)
+	if simmatrix!=None:
+		return simmatrix.Slice(simindices[members],seqids)
 	else:
 		#save sequence records to a fasta file
 		subfastafilename=GetWorkingBase(datasetname) + ".fasta"
-		SeqIO.write(records.values(), subfastafilename, "fasta")			
-		subsimmatrix=ComputeSim(subfastafilename,records,mincoverage)
-		if subsimmatrix!={}:
+		SeqIO.write([seqrecords[seqid] for seqid in seqids], subfastafilename, "fasta")			
+		subsimmatrix=ComputeSim(subfastafilename,seqids,mincoverage)
+		if subsimmatrix!=None:
 			os.system("rm " + subfastafilename)
 	return subsimmatrix
 
-def MergeComplexes(complexes,classes):
-	removednames=[]
-	complexnames=[]
-	for comp in complexes:
-		for classname in comp:
-			if not (classname in complexnames):
-				complexnames.append(classname)
-	namepoints={}
-	for classname in complexnames:
-		namepoint = PointDef(classname,False,[],None)
-		namepoints.setdefault(classname,namepoint)	
-	#Load neighbor for points
-	for comp in complexes:
-		for classname in comp:
-			for classname2 in comp:
-				if not classname2 in namepoints[classname].neighbors:
-					namepoints[classname].neighbors.append(classname2)			
-	nameclusters=[]	
-	Cluster(namepoints,nameclusters)	
-	for namecluster in nameclusters:
-		maxseqnumber=0
-		ref=""
-		for complexname in namecluster.pointids:
-			seqnumber=len(classes[complexname])
-			if seqnumber>=maxseqnumber:
-				maxseqnumber=seqnumber
-				ref=complexname
-		for complexname in namecluster.pointids:
-			if complexname!=ref:
-				removednames.append(complexname)
-	return removednames	
-
-def RemoveComplexes(records,classification,subsimmatrix):
-	distinguishablerecords={}
-	newclasses={}
-	#load neighbors
-	neighbordict = LoadNeighbors(records.keys(),subsimmatrix,1)	
+def RemoveComplexes(offsets,subsimmatrix):
+	#the sequences of the classes that are not in a complex with a larger class, and their class offsets
+	classlabels=np.repeat(np.arange(len(offsets)-1,dtype=np.int64),np.diff(offsets))
 	#cluster
-	points=LoadPoints(neighbordict,records)
-	clusters=[]
-	Cluster(points,clusters)	
+	indptr,indices=LoadNeighbors(subsimmatrix,1)
+	with profiling.Stage("clustering",sequences=len(subsimmatrix)) as stage:
+		clusters=ConnectedComponents(indptr,indices)
+		stage.Count(clusters=len(clusters))
 	#compute complexes
 	complexes=[]
+	labels=classlabels.tolist()
 	for cluster in clusters:
-		speciescomplex=[]
-		for seqid in cluster.pointids:
-			seqrecord = records[seqid]
-			classname=classification[seqid]
-			if not classname in speciescomplex:
-				speciescomplex.append(classname)
-		complexes.append(speciescomplex)
+		complexes.append(list(dict.fromkeys([labels[i] for i in cluster])))
 	#merge complexes
-	complexnames=MergeComplexes(complexes,classes)
+	complexnames=MergeComplexes(complexes,np.diff(offsets).tolist())
 	#remove complexes
-	for seqid in records.keys():
-		seqrecord=records[seqid]
-		if not classification[seqid] in complexnames:
-			distinguishablerecords.setdefault(seqid,seqrecord)
-	newclasses=LoadClassesFromClassification(distinguishablerecords,classification)		
-	return distinguishablerecords,newclasses
+	removed=np.zeros(len(offsets)-1,dtype=bool)
+	removed[np.array(complexnames,dtype=np.int64)]=True
+	points=np.flatnonzero(~removed[classlabels])
+	newoffsets=np.zeros(int((~removed).sum())+1,dtype=np.int64)
+	np.cumsum(np.diff(offsets)[~removed],out=newoffsets[1:])
+	return points,newoffsets
+
+def LoadSubSim(datasetname,members,offsets,simmatrix):
+	#compute sub simmatrix
+	subsimmatrix=ComputeSubSim(datasetname,members,simmatrix)
+	#remove complexes if required	
+	if args.removecomplexes=="yes":
+		if subsimmatrix==None:
+			print("Cannot compute the similarity matrix for " + datasetname + ".")
+			sys.exit()
+		points,offsets=RemoveComplexes(offsets,subsimmatrix)
+		subsimmatrix=subsimmatrix.Slice(points)
+	return subsimmatrix,offsets
+
+def ComputeFmeasures(offsets,submatrix,thresholds):
+	#cluster the sequences at all the thresholds at once, adding the similarity scores from the highest to the lowest
+	groups=[]
+	for k in range(len(offsets)-1):
+		groups.append(list(range(offsets[k],offsets[k+1])))
+	rows,cols,scores=submatrix.Edges(min(thresholds))
+	#the clusterings and their F-measures are computed together
+	with profiling.Stage("clustering",sequences=len(submatrix),edges=len(rows),clades=len(groups),thresholds=len(thresholds)):
+		fmeasures=SweepFmeasures(groups,len(submatrix),rows,cols,scores,thresholds)
+	fmeasuredict={}
+	for t,fmeasure in zip(thresholds,fmeasures):
+		fmeasuredict[str(t)]=round(fmeasure,4)
+	return fmeasuredict
 
-def Predict(datasetname,prediction_datasetname,records,classes,classification,simmatrix):
+def Predict(datasetname,prediction_datasetname,members,offsets,simmatrix):
+	#members are the indices of the sequences of the dataset grouped by class, and offsets the offsets of the classes
 	thresholds=[]
 	fmeasures=[]	
 	t=round(threshold,4)
@@ -448,37 +319,47 @@ def Predict(datasetname,prediction_datasetname,records,classes,classification,si
 		optthreshold = 0
 		bestFmeasure = 0
 	isError=False		
-	subsimmatrix={}	
-	print("Number of sequences for prediction: " + str(len(records)))
+	submatrix=None	
+	seqno=len(members)
+	sweptfmeasuredict={}
+	print("Number of sequences for prediction: " + str(seqno))
+	if args.incremental=="yes":
+		#the thresholds without F-measure
+		missingthresholds=[]
+		while t <= endthreshold:
+			if not (str(t) in fmeasuredict.keys() and args.redo==""):
+				missingthresholds.append(t)
+			t=round(t+step,4)
+		t=round(threshold,4)
+		if len(missingthresholds) > 0:
+			submatrix,offsets=LoadSubSim(datasetname,members,offsets,simmatrix)
+			if submatrix==None:
+				isError=True
+			else:
+				seqno=len(submatrix)
+				print("Computing F-measures for thresholds from " + str(missingthresholds[0]) + " to " + str(missingthresholds[-1]))
+				sweptfmeasuredict=ComputeFmeasures(offsets,submatrix,missingthresholds)
 	#compute optimal threshold
-	while t <= endthreshold:
+	while t <= endthreshold and isError==False:
 		print("Computing F-measure for threshold " + str(t))
 		fmeasure=0
 		#if str(t) in fmeasuredict.keys() and datasetdict['fasta filename']==fastafilename and datasetdict['classification filename']==classificationfilename:
 		if str(t) in fmeasuredict.keys() and args.redo=="":
 			fmeasure=fmeasuredict[str(t)]
+		elif str(t) in sweptfmeasuredict.keys():
+			fmeasure=sweptfmeasuredict[str(t)]
+			fmeasuredict[str(t)]=fmeasure
 		else:
-			if subsimmatrix=={}:
-				#remove complexes if required	
-				if args.removecomplexes=="yes":
-					#compute sub simmatrix
-					subsimmatrix=ComputeSubSim(datasetname,records,simmatrix)
-					if subsimmatrix=={}:
-						print("Cannot compute the similarity matrix for " + datasetname + ".")
-						sys.exit()
-					records,classes=RemoveComplexes(records,classification,subsimmatrix)
-				else:	
-					#compute sub simmatrix
-					subsimmatrix=ComputeSubSim(datasetname,records,simmatrix)
-					if subsimmatrix=={}:
-						isError=True	
-						break
+			if submatrix==None:
+				submatrix,offsets=LoadSubSim(datasetname,members,offsets,simmatrix)
+				if submatrix==None:
+					isError=True	
+					break
+				seqno=len(submatrix)
 			#compute fmeasure
-			neighbordict = LoadNeighbors(records.keys(),subsimmatrix,t)	
-			points=LoadPoints(neighbordict,records)
-			clusters=[]
-			Cluster(points,clusters)	
-			fmeasure=round(ComputeFmeasure(classes,clusters),4)
+			indptr,indices = LoadNeighbors(submatrix,t)	
+			clusterlabels,clusternumber=Cluster(indptr,indices)	
+			fmeasure=round(ComputeFmeasure(offsets,clusterlabels,clusternumber),4)
 			fmeasuredict[str(t)]=fmeasure
 		if fmeasure > bestFmeasure or (fmeasure==bestFmeasure and optthreshold >t) :
 			bestFmeasure=fmeasure
@@ -492,11 +373,50 @@ def Predict(datasetname,prediction_datasetname,records,classes,classification,si
 		prediction_datasetname['cut-off']=optthreshold
 		prediction_datasetname['confidence']=bestFmeasure
 		#prediction_datasetname['min alignment length']=mincoverage
-		prediction_datasetname['sequence number']=len(records)
-		prediction_datasetname['group number']=len(classes)
+		prediction_datasetname['sequence number']=seqno
+		prediction_datasetname['group number']=len(offsets)-1
 		prediction_datasetname['fmeasures']=fmeasuredict
 	return thresholds,fmeasures,optthreshold,bestFmeasure,isError
 
+def PredictDataset(datasetname):
+	members,offsets,seqno,maxproportion=tasks[datasetname]
+	datasetdict={}
+	if datasetname in prediction_datasets.keys():
+		datasetdict = prediction_datasets[datasetname]
+	print("Predicting optimal threshold to separate sequences at the " + rank + " level for " + datasetname)
+	thresholds,fmeasures,optthreshold,bestFmeasure,isError=Predict(datasetname,datasetdict,members,offsets,simmatrix)	
+	return datasetdict,thresholds,fmeasures,optthreshold,bestFmeasure,isError
+
+def InitWorker(ncpus):
+	#share the cpus for BLAST between the workers
+	global nproc
+	nproc=max(1,int(nproc/ncpus))
+
+def PredictDatasetInWorker(datasetname):
+	try:
+		return datasetname,PredictDataset(datasetname)
+	except SystemExit:
+		return datasetname,None
+
+def PredictDatasets(datasetnames,ncpus):
+	results={}
+	if ncpus <= 1 or len(datasetnames) < 2:
+		for datasetname in datasetnames:
+			results[datasetname]=PredictDataset(datasetname)
+		return results
+	#the largest datasets are predicted first. The workers are forked so that they share the similarity matrix and the datasets
+	datasetnames=sorted(datasetnames,key=lambda datasetname: len(tasks[datasetname][0]),reverse=True)
+	ncpus=min(ncpus,len(datasetnames))
+	pool=multiprocessing.get_context("fork").Pool(ncpus,initializer=InitWorker,initargs=(ncpus,))
+	for datasetname,result in pool.imap_unordered(PredictDatasetInWorker,datasetnames):
+		if result==None:
+			pool.terminate()
+			sys.exit()
+		results[datasetname]=result
+	pool.close()
+	pool.join()
+	return results
+
 def GetPositionList(classificationfilename,ranklist,higherranklist):
 	positionlist=[]
 	higherpositionlist=[]
@@ -579,151 +499,34 @@ def GetTaxonName(description,rank):
 		taxonname=kingdom		
 	return taxonname
 
-def SelectList(higherclasses,maxseqno):
-	##we make sure that most classes having at least one sequence selected
-	selectedids = []
-	for higherclassname in higherclasses.keys():
-		seqids=[]
-		classes=higherclasses[higherclassname]
-		for classname in classes.keys():
-			for seqid in classes[classname]:
-				seqids.append(seqid)
-		tmpids = []
-		if maxseqno > 0 and maxseqno < len(seqids):
-			# if maxseqno < len(classes.keys()):
-			# 	selectedclassnames = random.sample(list(classes.keys()), k=maxseqno)
-			# 	for classname in selectedclassnames:
-			# 		tmp=random.sample(classes[classname], k=1)
-			# 		tmpids.append(tmp[0])
-			# else:
-			# 	m=int(maxseqno/len(classes.keys()))
-			# 	for classname in classes.keys():
-			# 		tmp=classes[classname]
-			# 		if m < len(classes[classname]):
-			# 			tmp = random.sample(classes[classname], k=m)
-			# 		tmpids=tmpids + tmp
-			# 	notyetselected = list(set(seqids) - set(tmpids))
-			# 	furtherselected = random.sample(notyetselected, k=maxseqno - len(tmpids))
-			# 	tmpids = tmpids + furtherselected
-			tmpids = random.sample(seqids, k=maxseqno)
-			selectedids = selectedids + tmpids
-		else:
-			selectedids=selectedids + seqids
-	return selectedids
-
-def GenerateDatasetsForPredictionFromDescription(seqrecords,rank,higherrank,taxa,maxseqno):
-	taxalist=[]
-	if "," in taxa:
-		taxalist=taxa.split(",")
-	elif taxa!="":
-		taxalist.append(taxa)
-	datasets={}
-	higherclasses={}
-	for seqid in seqrecords.keys():
-		description=seqrecords[seqid].description
-		classname=GetTaxonName(description,rank)
-		higherclassname=GetTaxonName(description,higherrank)
-		if (len(taxalist) >0) and higherclassname!="" and not (higherclassname in taxalist) :
-			continue
-		if classname != "" and higherclassname !="" and classname != "unidentified" and higherclassname !="unidentified":
-			if not higherclassname in higherclasses.keys():
-				higherclasses.setdefault(higherclassname, {})
-			if not (classname in higherclasses[higherclassname].keys()):
-				higherclasses[higherclassname].setdefault(classname,[])
-			higherclasses[higherclassname][classname].append(seqid)
-	selectedseqids=SelectList(higherclasses,maxseqno)
-	for seqid in selectedseqids:
-		description = seqrecords[seqid].description
-		higherclassname = GetTaxonName(description, higherrank)
-		if not higherclassname in datasets.keys():
-			datasets.setdefault(higherclassname, {})
-		datasets[higherclassname][seqid] = seqrecords[seqid]
-	return datasets
-
-def GenerateDatasetsFromDescription(seqrecords,rank,higherranks,taxa,maxseqno):
-	alldatasets={}
-	if len(higherranks) !=0:		
-		for higherrank in higherranks:
-			datasets=GenerateDatasetsForPredictionFromDescription(seqrecords,rank,higherrank,taxa,maxseqno)
-			alldatasets.update(datasets)
-		return alldatasets	
-	else:
-		alldatasets.setdefault("All",{})
-		classes={}
-		for seqid in seqrecords.keys():
-			description=seqrecords[seqid].description
-			classname=GetTaxonName(description,rank)
-			if classname != "" and classname != "unidentified":
-				#alldatasets["All"][seqid]=seqrecords[seqid]
-				if not (classname in classes.keys()):
-					classes.setdefault(classname, [])
-				classes[classname].append(seqid)
-		higherclasses = {}
-		higherclasses.setdefault("All", classes)
-		selectedseqids=SelectList(higherclasses,maxseqno)
-		for seqid in selectedseqids:
-			alldatasets["All"][seqid] = seqrecords[seqid]
-	return alldatasets
+def SelectList(members,maxseqno):
+	##the sequences of a dataset, grouped by class, of which at most maxseqno are selected at random
+	if maxseqno > 0 and maxseqno < len(members):
+		return members[random.sample(range(len(members)), k=maxseqno)]
+	return members
 
-def GenerateDatasetsForHigherTaxa(seqrecords,allclassification,higherrank,taxa,maxseqno):
+def GenerateDatasets(taxonomyindex,rank,higherranklist,taxa,maxseqno):
+	#the datasets as the indices of their sequences, one for each clade at the higher ranks or else one for all the sequences
 	taxalist=[]
 	if "," in taxa:
 		taxalist=taxa.split(",")
 	elif taxa!="":
 		taxalist.append(taxa)
 	datasets={}
-	higherclasses={}
-	for seqid in seqrecords.keys():
-		try:
-			higherclassname=allclassification[seqid][higherrank]
-		except KeyError:
-			continue
-		else:
-			if higherclassname=="" or higherclassname=="unidentified":
-				continue
+	codes,offsets,members=taxonomyindex.Clades(rank)
+	if len(higherranklist)==0:
+		datasets["All"]=SelectList(members,maxseqno)
+		return datasets
+	members=np.flatnonzero(taxonomyindex.codes[rank]>=0)
+	for higherrank in higherranklist:
+		highercodes,higheroffsets,highermembers=taxonomyindex.Clades(higherrank,members,rank)
+		highernames=taxonomyindex.names[higherrank]
+		for k in range(len(highercodes)):
+			higherclassname=highernames[highercodes[k]]
 			if (len(taxalist) > 0) and not (higherclassname in taxalist):
 				continue
-			if not higherclassname in higherclasses.keys():
-				higherclasses.setdefault(higherclassname, {})
-			classname = allclassification[seqid][rank]
-			if not (classname in higherclasses[higherclassname].keys()):
-				higherclasses[higherclassname].setdefault(classname,[])
-			higherclasses[higherclassname][classname].append(seqid)
-	selectedseqids=SelectList(higherclasses,maxseqno)
-	for seqid in selectedseqids:
-		higherclassname = allclassification[seqid][higherrank]
-		if not higherclassname in datasets.keys():
-			datasets.setdefault(higherclassname, {})
-		datasets[higherclassname][seqid] = seqrecords[seqid]
+			datasets[higherclassname]=SelectList(highermembers[higheroffsets[k]:higheroffsets[k+1]],maxseqno)
 	return datasets
-	
-def GenerateDatasets(seqrecords,allclassification,higherranklist,taxa,maxseqno):
-	alldatasets={}
-	if len(higherranklist) !=0:
-		for higherrank in higherranklist:
-			datasets=GenerateDatasetsForHigherTaxa(seqrecords,allclassification,higherrank,taxa,maxseqno)
-			alldatasets.update(datasets)
-		return alldatasets
-	else:
-		alldatasets.setdefault("All",{})
-		classes={}
-		for seqid in seqrecords.keys():
-			classname=""
-			try:
-				classname=allclassification[seqid][rank]
-			except KeyError:
-				continue
-			else:
-				#alldatasets["All"][seqid] = seqrec
-				if not (classname in classes.keys()):
-					classes.setdefault(classname, [])
-				classes[classname].append(seqid)
-		higherclasses={}
-		higherclasses.setdefault("All",classes)
-		selectedseqids=SelectList(higherclasses,maxseqno)
-		for seqid in selectedseqids:
-			alldatasets["All"][seqid] = seqrecords[seqid]
-	return alldatasets
 
 def LoadPrediction(predictionfilename):
 	existingprediction={}
@@ -842,6 +645,8 @@ def SavePrediction(predictiondict,outputnamewithfmeasures,outputnamewithoutfmeas
 	textfile.close()
 	
 def PlotPrediction(datasetname,thresholdlist,fmeasurelist,optthresholds,bestFmeasures,features,datasetnames,figoutput):
+	import matplotlib.pyplot as plt
+	plt.rc('font',size=6)
 	if len(thresholdlist) >5:
 		fig, ax = plt.subplots(figsize=(6,3))
 	else:	
@@ -868,6 +673,8 @@ def PlotPrediction(datasetname,thresholdlist,fmeasurelist,optthresholds,bestFmea
 		plt.show()	
 	
 def PlotResults(prefix,optthresholds,bestFmeasures,features,datasetnames,localfigoutput):
+	import matplotlib.pyplot as plt
+	plt.rc('font',size=6)
 	#sort all according to increasing order of optthresholds
 	if len(optthresholds)==0:
 		return
@@ -903,7 +710,9 @@ def PlotResults(prefix,optthresholds,bestFmeasures,features,datasetnames,localfi
 	if args.display=="yes":
 		plt.show()	
 	
-if __name__ == "__main__":
+def main(argv=None):
+	global prefix,label,simfilename,seqrecords,simmatrix,simindices,taxonomyindex,rank,prediction_datasets,tasks
+	ParseArguments(argv)
 	if prefix=="" or prefix==None:
 		basename=os.path.basename(fastafilename)
 		prefix=basename[:-(len(basename)-basename.rindex("."))] 
@@ -930,14 +739,14 @@ if __name__ == "__main__":
 		print("Please specify the ranks for similarity cut-offs prediction by using -ranks.")	
 		sys.exit()		
 	#load sequences
-	seqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
-	if len(seqrecords) >100:
-		sys.setrecursionlimit(len(seqrecords)*2)
+	with profiling.Stage("fasta load") as stage:
+		seqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
+		stage.Count(sequences=len(seqrecords))
 	if simfilename=="" or simfilename==None:
 		simfilename=GetWorkingBase(prefix) + ".sim"
 		
 	#load similarity matrix
-	simmatrix={}
+	simmatrix=None
 	#load or compute simmatrix
 	if endthreshold >=threshold and endthreshold >0:
 		if os.path.exists(simfilename):
@@ -948,9 +757,14 @@ if __name__ == "__main__":
 		elif higherclassificationranks=="":	#predict globally
 			if len(seqrecords.keys()) <= args.maxseqno:
 				print("Computing similarity matrix...")
-				simmatrix=ComputeSim(fastafilename,seqrecords,mincoverage)
-				print("Save similarity matrix " + simfilename)
-				SaveSim(simmatrix,simfilename)
+				simmatrix=ComputeSim(fastafilename,list(seqrecords.keys()),mincoverage)
+				if simmatrix!=None:
+					print("Save similarity matrix " + simfilename)
+					SaveSim(simmatrix,simfilename)
+	#the indices of the sequences in the similarity matrix
+	simindices=None
+	if simmatrix!=None:
+		simindices=simmatrix.GetIndices(seqrecords.keys())
 	thresholdlist=[]
 	intrathresholdlist=[]
 	fmeasurelist=[]
@@ -979,10 +793,13 @@ if __name__ == "__main__":
 		if classificationfilename!="":
 			#pos=positionlist[i]
 			#load classification
-			allclassification=LoadClassification(classificationfilename,rank,higherranklist)
-			datasets=GenerateDatasets(seqrecords,allclassification,higherranklist,args.taxa,args.maxseqno)
-		else:
-			datasets=GenerateDatasetsFromDescription(seqrecords,rank,higherranklist,args.taxa,args.maxseqno)
+			with profiling.Stage("classification load") as stage:
+				allclassification=LoadClassification(classificationfilename,rank,higherranklist)
+				stage.Count(sequences=len(allclassification))
+		with profiling.Stage("dataset generation") as stage:
+			taxonomyindex=LoadTaxonomyIndex(rank,higherranklist,allclassification)
+			datasets=GenerateDatasets(taxonomyindex,rank,higherranklist,args.taxa,args.maxseqno)
+			stage.Count(sequences=len(taxonomyindex),clades=len(datasets))
 		if datasets=={}:
 			print("Please provide classification for the rank " + rank + ".")	
 			sys.exit()	
@@ -1009,37 +826,32 @@ if __name__ == "__main__":
 		else:
 			if os.path.exists(GetWorkingBase((os.path.basename(args.input))) + ".predict.log"):		
 				os.system("rm " + GetWorkingBase((os.path.basename(args.input))) + ".predict.log")
+			tasks={}
 			for datasetname in datasets.keys():
-				records=datasets[datasetname]
-				seqno=len(records)
+				members=datasets[datasetname]
+				seqno=len(members)
 				#load classification at the given rank
-				classes={}
-				classification={}
-				classes, classification=LoadClasses(records,rank,allclassification)
-				maxproportion=ComputeMaxProportion(classes, seqno)
+				codes,offsets,members=LoadClasses(taxonomyindex,rank,members)
+				maxproportion=ComputeMaxProportion(offsets, seqno)
 				#only predict when the numbers of the groups > 1
-				if len(classes) < 2:
+				if len(codes) < 2:
 					continue
 				#only proportion of the largest group is less than maxproportion
 				if maxproportion >= args.maxproportion:
 					continue
-				datasetdict={}
-				if datasetname in prediction_datasets.keys():
-					datasetdict = prediction_datasets[datasetname]
-				thresholds=[]
-				fmeasures=[]		
-				optthreshold=0
-				bestFmeasure=0
-				groupno=len(classes)
-				print("Predicting optimal threshold to separate sequences at the " + rank + " level for " + datasetname)
-				thresholds,fmeasures,optthreshold,bestFmeasure,isError=Predict(datasetname,datasetdict,records,classes,classification,simmatrix)	
+				tasks[datasetname]=(members,offsets,seqno,maxproportion)
+			with profiling.Stage("prediction",clades=len(tasks)):
+				results=PredictDatasets(list(tasks.keys()),args.ncpus)
+			for datasetname in tasks.keys():
+				members,offsets,seqno,maxproportion=tasks[datasetname]
+				datasetdict,thresholds,fmeasures,optthreshold,bestFmeasure,isError=results[datasetname]
+				groupno=len(offsets)-1
 				if isError==False:
 					datasetdict['min alignment length']=mincoverage
 					datasetdict['fasta filename']=fastafilename
 					datasetdict['classification filename']=classificationfilename
 					datasetdict['max proportion']=maxproportion
-					if not (datasetname in prediction_datasets.keys()):
-						prediction_datasets[datasetname]=datasetdict		
+					prediction_datasets[datasetname]=datasetdict		
 					if not (groupno < minGroupNo or seqno < minSeqNo or maxproportion > args.maxproportion):	#for visualization
 						thresholdlist.append(thresholds)
 						fmeasurelist.append(fmeasures)
@@ -1054,7 +866,8 @@ if __name__ == "__main__":
 	if len(ranklist) >0:		
 		if len(predictiondict.keys())>0:
 			outputwithoutfmeasures=GetBase(outputname) + ".cutoffs.json"	
-			SavePrediction(predictiondict,outputname,outputwithoutfmeasures)
+			with profiling.Stage("output writing"):
+				SavePrediction(predictiondict,outputname,outputwithoutfmeasures)
 			#SaveCutoffs(predictiondict,outputcutoffs)
 			print("Only cut-offs for the clades with the numbers of sequences and subclades greater than  " + str(minSeqNo) + " and " + str(minGroupNo) + ", and with the proportion of the largest group less than " + str(args.maxproportion) + ", are saved. If you wish to save cut-offs for clades with less numbers of sequences and groups, please reset minseqno, mingroupno, and maxproportion with -minseqno, -mingroupno, and -maxproportion.")
 			print("The prediction and cut-offs are saved in the files " + outputname + ", " + outputwithoutfmeasures + " and " + outputwithoutfmeasures + ".txt.")
@@ -1087,20 +900,26 @@ if __name__ == "__main__":
 	if len(higherranklist)==0 or len(thresholdlist)==1:
 		if len(higherranklist)==0:
 			#plot all predictions		
-			PlotPrediction(label,thresholdlist,fmeasurelist,optthresholds,bestFmeasures,features,datasetnames,globalfigoutput)	
+			with profiling.Stage("plotting"):
+				PlotPrediction(label,thresholdlist,fmeasurelist,optthresholds,bestFmeasures,features,datasetnames,globalfigoutput)	
 		elif len(thresholdlist) >0:
 			#plot all predictions		
-			PlotPrediction(label,thresholdlist,fmeasurelist,optthresholds,bestFmeasures,features,datasetnames,localfigoutput)	
+			with profiling.Stage("plotting"):
+				PlotPrediction(label,thresholdlist,fmeasurelist,optthresholds,bestFmeasures,features,datasetnames,localfigoutput)	
 		else:
 			print("Please check the parameters.")
 	else:	
 		
 		if len(optthresholds) >0:
 			#barplot the prediction results only
-			PlotResults(label,optthresholds,bestFmeasures,features,datasetnames,localfigoutput)
+			with profiling.Stage("plotting"):
+				PlotResults(label,optthresholds,bestFmeasures,features,datasetnames,localfigoutput)
 		else:
 			print("Please check the parameters.")	
 	if os.path.exists(GetWorkingBase((os.path.basename(args.input))) + ".predict.log"):		
 		print("Please check the file " + GetWorkingBase((os.path.basename(args.input))) + ".predict.log for the prediction.")		
 	
 	
+
+if __name__ == "__main__":
+	main()
@@ -6,6 +6,11 @@ import os
 import sys, argparse
 from Bio import SeqIO
 import multiprocessing
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.simmatrix import LoadSim,SaveSim,StreamSimFromBlastLines
+from lib.blast import RunBlast
+from lib.clustering import ConnectedComponents,MergeComplexes
+from lib import profiling
 nproc=multiprocessing.cpu_count()
 parser=argparse.ArgumentParser(prog='removeComplexes.py',  
 							   usage="%(prog)s [options] -i fastafile -t threshold -c classification -p position -out outputname",
@@ -22,17 +27,19 @@ parser.add_argument('-rank','--classificationrank', default="", help='the classi
 parser.add_argument('-sim','--simfilename', help='The similarity matrix of the sequences if exists.')
 parser.add_argument('-idcolumnname','--idcolumnname',default="ID", help='the column name of sequence id in the classification file.')
 
-args=parser.parse_args()
-fastafilename= args.input
-threshold=args.cutoff
-mincoverage = args.minalignmentlength
-classificationfilename=args.classification
-#classificationpos=args.classificationpos
-rank=args.classificationrank
-outputpath=args.out
-simfilename=args.simfilename
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)
+def ParseArguments(argv=None):
+	global args,fastafilename,threshold,mincoverage,classificationfilename,rank,outputpath,simfilename
+	args=parser.parse_args(argv)
+	fastafilename= args.input
+	threshold=args.cutoff
+	mincoverage = args.minalignmentlength
+	classificationfilename=args.classification
+	#classificationpos=args.classificationpos
+	rank=args.classificationrank
+	outputpath=args.out
+	simfilename=args.simfilename
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
 
 def GetBase(filename):
 	return filename[:-(len(filename)-filename.rindex("."))] 
@@ -43,13 +50,6 @@ def GetWorkingBase(filename):
 	path=outputpath + "/" + basename
 	return path
 
-class PointDef:
-	def __init__(self, id,flag,neighbors,seqrecord):
-		self.id=id
-		self.flag=flag
-		self.neighbors = neighbors
-		self.seqrecord=seqrecord
-
 class ClusterDef:
 	def __init__(self, id, pointids):
 		self.id=id
@@ -63,108 +63,24 @@ def GetSeqIndex(seqname,seqlist):
 		i = i + 1
 	return -1
 
-def LoadSim(simfilename):
-	simmatrix = {} #we use dictionary to reduce the memory constraints 
-	simfile = open(simfilename)
-	for line in simfile:
-		numbers=line.rstrip().split(" ")
-		i=numbers[0]
-		j=numbers[1]
-		if i not in simmatrix.keys():
-			simmatrix.setdefault(i, {})
-		if j not in simmatrix[i].keys():
-			simmatrix[i].setdefault(j, 0)
-		if float(numbers[2]) > simmatrix[i][j]:
-			simmatrix[i][j]=float(numbers[2])
-	simfile.close()		
-	return simmatrix
-
-def SaveSim(simmatrix,simfilename):
-	simfile=open(simfilename,"w")
-	for i in simmatrix.keys():
-		for j in simmatrix[i].keys():
-			simfile.write(str(i) + " " + str(j) + " " + str(simmatrix[i][j]) + "\n")
-	simfile.close()
-	
 def ComputeSim(fastafilename,seqrecords,mincoverage):
-	simmatrix={}
-	for seqid in seqrecords.keys():
-		simmatrix.setdefault(seqid,{})
-		simmatrix[seqid][seqid]=1
-	#blast
-	makedbcommand = "makeblastdb -in " + fastafilename + " -dbtype \'nucl\' " +  " -out db"
-	os.system(makedbcommand)
-	blastcommand = "blastn -query " + fastafilename + " -db  db -task blastn-short -outfmt 6 -out out.txt -num_threads " + str(nproc)
+	task="blastn-short"
 	if mincoverage >=300:
-		blastcommand = "blastn -query " + fastafilename + " -db  db -outfmt 6 -out out.txt -num_threads " + str(nproc)
-	os.system(blastcommand)
-	
-	#read blast output
-	blastoutputfile = open("out.txt")
-	score=0
-	for line in blastoutputfile:
-		if line.rstrip()=="":
-			continue
-		words = line.split("\t")
-		i = words[0].rstrip()
-		j = words[1].rstrip()
-		pos1 = int(words[6])
-		pos2 = int(words[7])
-		iden = float(words[2]) 
-		sim=float(iden)/100
-		coverage=abs(pos2-pos1)
-		score=sim
-		if coverage < mincoverage:
-			score=float(score * coverage)/mincoverage	
-		if j in simmatrix[i].keys():
-			if simmatrix[i][j] < score:
-				simmatrix[i][j]=round(score,4)
-				simmatrix[j][i]=round(score,4)
-		else:
-			simmatrix[i][j]=round(score,4)
-			simmatrix[j][i]=round(score,4)
-		#simmatrix[j][i]=score
-	os.system("rm out.txt")
+		task="megablast"
+	#read the hits from the output of blast as they arrive
+	simmatrix=StreamSimFromBlastLines(RunBlast(fastafilename,fastafilename,task,nproc),seqrecords.keys(),mincoverage)
 	return simmatrix
 
 def LoadNeighbors(seqids,simmatrix,threshold):
-	neighbordict={}
-	for seqid in seqids:
-		neighbordict.setdefault(seqid, [])
-	for i in seqids:
-		for j in seqids:
-			if not j in simmatrix[i].keys():
-				continue
-			if simmatrix[i][j] >= threshold:
-				if (j not in neighbordict[i]):
-					neighbordict[i].append(j)
-				if (i not in neighbordict[j]):
-					neighbordict[j].append(i)
-	#os.system("rm out.txt")
-	return neighbordict
-
-def LoadPoints(neigbordict,seqrecords):
-	points={}
-	for seqid in  seqrecords.keys():
-		point = PointDef(seqid,False,neigbordict[seqid],seqrecords[seqid])
-		points[seqid]=point
-	return points
+	#the neighbors of the sequences as their indices in seqids, only from the scores >= threshold
+	return simmatrix.LoadNeighborIndices(seqids,threshold)
 
-def ExpandCluster(root,cluster,points):
-	for i in root.neighbors:
-		if points[i].flag==False:
-			points[i].flag=True
-			cluster.pointids.append(i)
-			ExpandCluster(points[i],cluster,points)
-			
-def Cluster(points,clusters):
-	for pointid in points.keys():
-		if points[pointid].flag==False:
-			points[pointid].flag=True
-			cluster = ClusterDef(len(clusters),[])
-			cluster.pointids.append(pointid)
-			ExpandCluster(points[pointid], cluster,points)
-			clusters.append(cluster)	
+def Cluster(seqids,indptr,indices,clusters):
+	with profiling.Stage("clustering",sequences=len(seqids),edges=int(len(indices)/2)) as stage:
+		for component in ConnectedComponents(indptr,indices):
+			cluster = ClusterDef(len(clusters),[seqids[i] for i in component])
+			clusters.append(cluster)
+		stage.Count(clusters=len(clusters))
 
 def ComputeFmeasure(classes,clusters):
 	#compute F-measure
@@ -272,66 +188,37 @@ def LoadClassesFromDescription(allseqrecords,rank):
 			classes.setdefault(classname,[seqid]) 
 	return seqrecords,classes,classification
 
-def MergeComplexes(complexes,classes):
-	removednames=[]
-	complexnames=[]
-	for comp in complexes:
-		for classname in comp:
-			if not (classname in complexnames):
-				complexnames.append(classname)
-	namepoints={}
-	for classname in complexnames:
-		namepoint = PointDef(classname,False,[],None)
-		namepoints.setdefault(classname,namepoint)	
-	#Load neighbor for points
-	for comp in complexes:
-		for classname in comp:
-			for classname2 in comp:
-				if not classname2 in namepoints[classname].neighbors:
-					namepoints[classname].neighbors.append(classname2)			
-	nameclusters=[]	
-	Cluster(namepoints,nameclusters)	
-	for namecluster in nameclusters:
-		maxseqnumber=0
-		ref=""
-		for complexname in namecluster.pointids:
-			seqnumber=len(classes[complexname])
-			if seqnumber>=maxseqnumber:
-				maxseqnumber=seqnumber
-				ref=complexname
-		for complexname in namecluster.pointids:
-			if complexname!=ref:
-				removednames.append(complexname)
-	return removednames
-
 def SaveClusters(clusters,seqrecords,classes,classification,output,outputfastafilename):
 	outputfile=open(output,"w")
 	outputfastafile=open(outputfastafilename,"w")
 	outputfile.write("ClusterID\tSequenceID\tClassification\tPrediction\n")
+	#the classes are merged by their indices
+	classnames=list(classes.keys())
+	classindex={}
+	classsizes=[]
+	for classname in classnames:
+		classindex[classname]=len(classsizes)
+		classsizes.append(len(classes[classname]))
 	complexes=[]
-	numberlist=[]
 	for cluster in clusters:
-		speciescomplex=[]
-		seqnumbers=[]
+		#the numbers of sequences of the classes of the cluster, in the order of their first sequence
+		seqnumbers={}
 		for seqid in cluster.pointids:
-			seqrecord = seqrecords[seqid]
 			classname=classification[seqid]
-			if classname in speciescomplex:
-				i=speciescomplex.index(classname)
-				seqnumbers[i]=seqnumbers[i] +1 
-			else:
-				speciescomplex.append(classname)
-				seqnumbers.append(1)
-		complexes.append(speciescomplex)
-		numberlist.append(seqnumbers)			
-		maxindex=seqnumbers.index(max(seqnumbers))
+			seqnumbers[classname]=seqnumbers.get(classname,0) + 1
+		speciescomplex=list(seqnumbers.keys())
+		complexes.append([classindex[classname] for classname in speciescomplex])
+		numbers=list(seqnumbers.values())
+		maxindex=numbers.index(max(numbers))
 		classname=speciescomplex[maxindex]
 		for id in cluster.pointids:
 			seqrecord = seqrecords[id]
 			outputfile.write(str(cluster.id) + "\t" + seqrecord.description + "\t" + classification[id] + "\t" + classname + "\n")		
 	outputfile.close()
 	#remove complexes
-	complexnames=MergeComplexes(complexes,classes)
+	complexnames=set()
+	for c in MergeComplexes(complexes,classsizes):
+		complexnames.add(classnames[c])
 	for seqid in seqrecords.keys():
 		seqrecord=seqrecords[seqid]
 		if not classification[seqid] in complexnames:
@@ -363,25 +250,30 @@ def GetPosition(classificationfilename,rank):
 		isError=True
 	return seqidpos,pos,isError
 	
-if __name__ == "__main__":
+def main(argv=None):
+	global simfilename
+	ParseArguments(argv)
 	outputfastafilename=GetWorkingBase(fastafilename) + ".diff.fasta"	
 	outputname=GetWorkingBase(fastafilename) + ".similar"
-	allseqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
-	sys.setrecursionlimit(len(allseqrecords)*2)
-	if classificationfilename!="":
-		seqidpos,classificationpos,isError=GetPosition(classificationfilename,rank)
-		if isError==True:
-			sys.exit()
-		seqrecords,classes,classification=LoadClasses(allseqrecords,classificationfilename,classificationpos,seqidpos)
-	else:
-		seqrecords,classes,classification=LoadClassesFromDescription(allseqrecords,rank)
+	with profiling.Stage("fasta load") as stage:
+		allseqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
+		stage.Count(sequences=len(allseqrecords))
+	with profiling.Stage("classification load") as stage:
+		if classificationfilename!="":
+			seqidpos,classificationpos,isError=GetPosition(classificationfilename,rank)
+			if isError==True:
+				sys.exit()
+			seqrecords,classes,classification=LoadClasses(allseqrecords,classificationfilename,classificationpos,seqidpos)
+		else:
+			seqrecords,classes,classification=LoadClassesFromDescription(allseqrecords,rank)
+		stage.Count(sequences=len(seqrecords),clades=len(classes))
 	if seqrecords=={}:
 		print("No classification names are available for the sequences at the rank " + rank + ".")
 		os.sys.exit()
 	#load similarity matrix
 	if simfilename=="" or simfilename==None:
 		simfilename=GetWorkingBase(fastafilename) + ".sim"
-	simmatrix={}
+	simmatrix=None
 	if os.path.exists(simfilename):
 		print("Loading similarity matrix " + simfilename)
 		simmatrix=LoadSim(simfilename)
@@ -394,17 +286,19 @@ if __name__ == "__main__":
 		SaveSim(simmatrix,simfilename)	
 	
 	#load neighbors
-	neighborlist = LoadNeighbors(seqrecords,simmatrix,threshold)
+	seqids=list(seqrecords.keys())
+	indptr,indices = LoadNeighbors(seqids,simmatrix,threshold)
 	print("Threshold\tFmeasure")
-	points=LoadPoints(neighborlist,seqrecords)
 	#cluster the sequences
 	clusters=[]
-	Cluster(points,clusters)
+	Cluster(seqids,indptr,indices,clusters)
 	fmeasure=ComputeFmeasure(classes,clusters)
 	print(str(threshold) + "\t" + str(fmeasure))
 	output=GetWorkingBase(fastafilename) + ".classified"
-	SaveClusters(clusters,seqrecords,classes,classification,outputname,outputfastafilename)
+	with profiling.Stage("output writing"):
+		SaveClusters(clusters,seqrecords,classes,classification,outputname,outputfastafilename)
 	print("The remained sequences are saved in file: " + outputfastafilename )
 	print("The clusters are saved in file: " + outputname )
 
-
+if __name__ == "__main__":
+	main()
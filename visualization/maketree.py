@@ -4,11 +4,10 @@ if sys.version_info[0] >= 3:
 	unicode = str
 import os, argparse
 from Bio import SeqIO
-from Bio import Phylo
 #import pylab
-import matplotlib.pyplot as plt
-plt.rc('font',size=4)
 import multiprocessing
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import profiling
 nproc=multiprocessing.cpu_count()
 
 parser=argparse.ArgumentParser(prog='maketree.py',  
@@ -26,15 +25,15 @@ parser.add_argument('-idcolumnname','--idcolumnname',default="ID", help='the col
 parser.add_argument('-alignmentmethod','--alignmentmethod',default="mafft", help='the alignment method: mafft or clustalo.')
 parser.add_argument('-display','--display',default="", help='If display=="yes" then the plot figure is displayed.')
 
-args=parser.parse_args()
-fastafilename= args.input
-classificationfilename= args.classification
-ranks=args.classificationranks
-outputpath=args.out
-
-outputpath=args.out
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)	
+def ParseArguments(argv=None):
+	global args,fastafilename,classificationfilename,ranks,outputpath
+	args=parser.parse_args(argv)
+	fastafilename= args.input
+	classificationfilename= args.classification
+	ranks=args.classificationranks
+	outputpath=args.out
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)	
 
 def GetBase(filename):
 	return filename[:-(len(filename)-filename.rindex("."))]
@@ -158,6 +157,9 @@ def PrintTree_ete(treefilename):
 # 	return names	
 # 	
 def PrintTree(treefilename,classificationdict):
+	from Bio import Phylo
+	import matplotlib.pyplot as plt
+	plt.rc('font',size=4)
 	figfilename=treefilename + ".png"
 	tree = Phylo.read(treefilename, "newick")
 	newtreefilename=treefilename
@@ -271,20 +273,31 @@ def GetPositionList(classificationfilename,rankslist):
 	return seqidpos,positionlist,isError
 
 ######MAIN
-ranklist=[]	
-if "," in ranks:
-	ranklist=ranks.split(",")
-elif ranks !="":
-	ranklist.append(ranks)
-classificationdict={}
-seqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
-if os.path.exists(classificationfilename):
-	seqidpos,positionlist,isError=GetPositionList(classificationfilename,ranks)
-	if isError==True:
-		sys.exit()
-	classificationdict=LoadClassification(seqrecords.keys(),classificationfilename,positionlist,seqidpos)	
-else:
-	classificationdict=LoadClassificationFromDescription(seqrecords,ranklist)
-#newfastafilename=CreateFastaFileWithClassification(fastafilename,classificationdict)
-treefilename=CreateTree(fastafilename,args.alignmentmethod,classificationdict)
+def main(argv=None):
+	global ranklist
+	ParseArguments(argv)
+	ranklist=[]	
+	if "," in ranks:
+		ranklist=ranks.split(",")
+	elif ranks !="":
+		ranklist.append(ranks)
+	classificationdict={}
+	with profiling.Stage("fasta load") as stage:
+		seqrecords=SeqIO.to_dict(SeqIO.parse(fastafilename, "fasta"))
+		stage.Count(sequences=len(seqrecords))
+	with profiling.Stage("classification load") as stage:
+		if os.path.exists(classificationfilename):
+			seqidpos,positionlist,isError=GetPositionList(classificationfilename,ranks)
+			if isError==True:
+				sys.exit()
+			classificationdict=LoadClassification(seqrecords.keys(),classificationfilename,positionlist,seqidpos)	
+		else:
+			classificationdict=LoadClassificationFromDescription(seqrecords,ranklist)
+		stage.Count(sequences=len(classificationdict))
+	#newfastafilename=CreateFastaFileWithClassification(fastafilename,classificationdict)
+	#the alignment and the tree are made by mafft/clustalo and iqtree
+	with profiling.Stage("tree",sequences=len(seqrecords)):
+		treefilename=CreateTree(fastafilename,args.alignmentmethod,classificationdict)
 
+if __name__ == "__main__":
+	main()
@@ -8,12 +8,13 @@ import os
 if sys.version_info[0] >= 3:
 	unicode = str
 import numpy
-import matplotlib.pyplot as plt
-plt.rc('font',size=6)
-from mpl_toolkits import mplot3d	
 from Bio import SeqIO
 import json
 import multiprocessing
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.simmatrix import LoadSim,SaveSim,StreamSimFromBlastLines
+from lib.blast import RunBlast
+from lib import profiling
 nproc=multiprocessing.cpu_count()
 
 parser=argparse.ArgumentParser(prog='visualize.py',  
@@ -42,26 +43,27 @@ parser.add_argument('-label','--label',default="", help='The label to display in
 parser.add_argument('-idcolumnname','--idcolumnname',default="ID", help='the column name of sequence id in the classification file.')
 parser.add_argument('-display','--display',default="", help='If display=="yes" then the plot figure is displayed.')
 
-args=parser.parse_args()
-fastafilename= args.input
-simfilename=args.simfilename
-coordfilename=args.coordinates
-classificationfilename=args.classification
-#classificationpos=args.classificationpos
-rank=args.classificationrank
-mincoverage=args.minalignmentlength
-minsim=args.minsim
-dim=args.dimension
-kneigh=args.kneigbors
-method=args.visualizationmethod
-size=args.size
-numberofdisplayedlabels=args.numberofdisplayedlabels
-outputpath=args.out
-prefix=args.prefix
-label=args.label
-
-if not os.path.exists(outputpath):
-	os.system("mkdir " + outputpath)	
+def ParseArguments(argv=None):
+	global args,fastafilename,simfilename,coordfilename,classificationfilename,rank,mincoverage,minsim,dim,kneigh,method,size,numberofdisplayedlabels,outputpath,prefix,label
+	args=parser.parse_args(argv)
+	fastafilename= args.input
+	simfilename=args.simfilename
+	coordfilename=args.coordinates
+	classificationfilename=args.classification
+	#classificationpos=args.classificationpos
+	rank=args.classificationrank
+	mincoverage=args.minalignmentlength
+	minsim=args.minsim
+	dim=args.dimension
+	kneigh=args.kneigbors
+	method=args.visualizationmethod
+	size=args.size
+	numberofdisplayedlabels=args.numberofdisplayedlabels
+	outputpath=args.out
+	prefix=args.prefix
+	label=args.label
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)	
 
 
 def GetBase(filename):
@@ -80,77 +82,12 @@ def GetWorkingBase(basename):
 	path=outputpath + "/" + basename
 	return path
 
-def LoadSim(simfilename,n):
-	simmatrix = {} #we use dictionary to reduce the memory constraints 
-	simfile = open(simfilename)
-	for line in simfile:
-		texts=line.rstrip().split(" ")
-		i=texts[0]
-		j=texts[1]
-		if i not in simmatrix.keys():
-			simmatrix.setdefault(i, {})
-		if j not in simmatrix[i].keys():
-			simmatrix[i].setdefault(j, 0)
-		if float(texts[2]) > simmatrix[i][j]:
-			simmatrix[i][j]=float(texts[2])
-	simfile.close()		
-	return simmatrix
-
-def SaveSim(simmatrix,simfilename,ms):
-	simfile=open(simfilename,"w")
-	for i in simmatrix.keys():
-		for j in simmatrix[i].keys():
-			if simmatrix[i][j] >= ms:
-				simfile.write(str(i) + " " + str(j) + " " + str(simmatrix[i][j]) + "\n")
-	simfile.close()
-
 def ComputeSim(fastafilename,seqids,mincoverage,minsim):
-	#scorematrix = [[0 for x in range(len(seqrecords))] for y in range(len(seqrecords))] 
-	simmatrix={}
-	for seqid in seqids:
-		simmatrix.setdefault(seqid,{})
-		simmatrix[seqid][seqid]=1
-#	simfilename=GetBase(fastafilename) + ".sim"
-#	simfile=open(simfilename,"w")
-	#blast
-	makedbcommand = "makeblastdb -in " + fastafilename + " -dbtype \'nucl\' " +  " -out db"
-	os.system(makedbcommand)
-	blastcommand = "blastn -query " + fastafilename + " -db  db -task blastn-short -outfmt 6 -out out.txt -num_threads " + str(nproc)
+	task="blastn-short"
 	if mincoverage >=300:
-		blastcommand = "blastn -query " + fastafilename + " -db  db -outfmt 6 -out out.txt -num_threads " + str(nproc)
-	os.system(blastcommand)
-	
-	#read blast output
-	blastoutputfile = open("out.txt")
-	for line in blastoutputfile:
-		if line.rstrip()=="":
-			continue
-		words = line.split("\t")
-#		queryid = words[0].rstrip()
-#		refid = words[1].rstrip()
-		i = words[0].rstrip()
-		j = words[1].rstrip()
-#		i = seqids.index(queryid)
-#		j = seqids.index(refid)
-		pos1 = int(words[6])
-		pos2 = int(words[7])
-		iden = float(words[2]) 
-		sim=float(iden)/100
-		coverage=abs(pos2-pos1)
-		score=sim
-		if coverage < mincoverage:
-			score=float(score * coverage)/mincoverage
-		if j in simmatrix[i].keys():
-			if simmatrix[i][j] < score:
-				simmatrix[i][j]=round(score,4)
-				simmatrix[j][i]=round(score,4)
-		else:
-			simmatrix[i][j]=round(score,4)
-			simmatrix[j][i]=round(score,4)
-#		if scorematrix[i][j] < score:
-#			scorematrix[i][j]=score
-#			scorematrix[j][i]=score
-	os.system("rm out.txt")
+		task="megablast"
+	#read the hits from the output of blast as they arrive. All the scores are kept as the full similarity matrix is saved.
+	simmatrix=StreamSimFromBlastLines(RunBlast(fastafilename,fastafilename,task,nproc),seqids,mincoverage)
 	return simmatrix
 
 def ComputeCoordinates(coordfilename,simfilename,dim,edgeNo,kneigh):
@@ -346,6 +283,9 @@ def VisualizeUsingDiVE(base,seqids,classification,features,coorfilename):
 	os.system("firefox " + base + "DiVE/index.html");
 	
 def Plot(prefix,seqids,coordfilename,labels,size,output):
+	import matplotlib.pyplot as plt
+	plt.rc('font',size=6)
+	from mpl_toolkits import mplot3d	
 	seqNo,dim,coordinates=LoadCoordinates(coordfilename)
 	all_data = {}
 	cmap = plt.get_cmap("tab20c")
@@ -441,12 +381,16 @@ def Plot(prefix,seqids,coordfilename,labels,size,output):
 	if args.display=="yes":
 		plt.show()		
 	
-if __name__ == "__main__":
+def main(argv=None):
+	global prefix,label,simfilename,coordfilename
+	ParseArguments(argv)
 	#load sequences
 	if prefix=="":
 		prefix=GetBase(os.path.basename(fastafilename))
 	base = sys.argv[0][0: sys.argv[0].rindex("/")+1]
-	seqrecords=list(SeqIO.parse(fastafilename, "fasta"))
+	with profiling.Stage("fasta load") as stage:
+		seqrecords=list(SeqIO.parse(fastafilename, "fasta"))
+		stage.Count(sequences=len(seqrecords))
 	seqids=[]
 	for rec in seqrecords:
 		seqids.append(rec.id)
@@ -475,7 +419,7 @@ if __name__ == "__main__":
 						SaveSim(simmatrix,simfilename_minsim,minsim)
 				else:		
 					print("Loading the exising similarities " + simfilename)
-					simmatrix=LoadSim(simfilename,minsim)
+					simmatrix=LoadSim(simfilename)
 					if minsim>0:
 						print("Saving similarity matrix " + simfilename_minsim )
 						SaveSim(simmatrix,simfilename_minsim,minsim)
@@ -486,7 +430,8 @@ if __name__ == "__main__":
 			edgeNo=int(len(seqrecords)/100)
 			if edgeNo <50:
 				edgeNo=50			
-			ComputeCoordinates(coordfilename,simfilename_minsim,dim,edgeNo,kneigh)
+			with profiling.Stage("coordinates",sequences=len(seqrecords)):
+				ComputeCoordinates(coordfilename,simfilename_minsim,dim,edgeNo,kneigh)
 			print("The coordinates are saved in file " + coordfilename)
 		else:
 			#use the existing simfilename.
@@ -507,7 +452,10 @@ if __name__ == "__main__":
 			labels,isError = LoadClassification(seqids,classificationfilename,rank,args.idcolumnname)		
 		else:
 			labels = LoadClassificationFromDescription(seqrecords,rank)		
-		Plot(label,seqids,coordfilename,labels,size,output)
+		with profiling.Stage("plotting"):
+			Plot(label,seqids,coordfilename,labels,size,output)
 		print("The visualization is saved in " + output + ".")
 			
 
+if __name__ == "__main__":
+	main()
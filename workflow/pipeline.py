@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# FILE: pipeline.py
+# CREATE DATE: 18 oct 2026
+import sys
+import os, argparse
+import json
+import importlib
+path=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,path)
+from lib.pipeline import Pipeline,Stage
+from lib.simmatrix import KeepSims,LoadSim
+
+parser=argparse.ArgumentParser(prog='pipeline.py',
+							   usage="%(prog)s [options] -i configfile",
+							   description='''Script that runs the commands of a workflow given in a json config file, like the selection of the sequences, the similarity matrix, the variation, the prediction of the cut-offs at different ranks and the classification, as the stages of a pipeline in one process. The stages not depending on each other are run in parallel, a similarity matrix is loaded once for all the stages using it, and the stages whose input files and options have not changed since the last run are skipped.''',
+							   epilog="""Written by Duong Vu duong.t.vu@gmail.com""",
+   )
+
+parser.add_argument('-i','--input', required=True, help='the json config file of the workflow. It gives the output folder (out), the number of stages run in parallel (ncpus), the options given to all the stages accepting them (options), and the list of stages (stages), each with its command, its options by their names without "-" and optionally its name.')
+parser.add_argument('-ncpus','--ncpus', type=int, default=0, help='The number of stages run in parallel. By default it is given by the config file, or 1.')
+parser.add_argument('-redo','--redo', default="", help='Run all the stages again if yes, also those whose input files and options have not changed.')
+
+#the folder and the script of the commands run by the pipeline, and whether their -o option is the output folder
+COMMANDS={"select":["aidscripts","selectsequences",False],
+		  "sim":["analysis","computeSim",True],
+		  "variation":["analysis","computeVariation",True],
+		  "remove":["prediction","removeComplexes",True],
+		  "predict":["prediction","predict",True],
+		  "best":["prediction","computeBestCutoffs",True],
+		  "merge":["prediction","mergeCutoffs",False],
+		  "search":["classification","search",True],
+		  "classify":["classification","classify",True]}
+
+def ParseArguments(argv=None):
+	global args,configfilename
+	args=parser.parse_args(argv)
+	configfilename=args.input
+
+def GetBase(filename):
+	if not ("." in filename):
+		return filename
+	return filename[:-(len(filename)-filename.rindex("."))]
+
+def LoadScript(command):
+	folder,scriptname,outfolder=COMMANDS[command]
+	scriptpath=os.path.join(path,folder)
+	if not (scriptpath in sys.path):
+		sys.path.insert(0,scriptpath)
+	return importlib.import_module(scriptname)
+
+def RunScript(command,arguments):
+	folder,scriptname,outfolder=COMMANDS[command]
+	script=LoadScript(command)
+	sys.argv=[os.path.join(path,folder,scriptname + '.py')] + arguments
+	script.main(arguments)
+
+def GetArguments(command,options,defaultoptions,outputpath):
+	script=LoadScript(command)
+	folder,scriptname,outfolder=COMMANDS[command]
+	names=list(options.keys())
+	for name in defaultoptions.keys():
+		if not (name in options.keys()) and ("-" + name) in script.parser._option_string_actions.keys():
+			names.append(name)
+	arguments=[]
+	if outfolder and not ("o" in names):
+		arguments=["-o",outputpath]
+	for name in names:
+		value=options.get(name,defaultoptions.get(name))
+		if type(value)==list:
+			value=",".join([str(v) for v in value])
+		arguments=arguments + ["-" + name,str(value)]
+	return arguments
+
+def GetPrefix(stageargs):
+	prefix=stageargs.prefix
+	if prefix=="" or prefix==None:
+		prefix=GetBase(os.path.basename(stageargs.input))
+	return prefix
+
+def GetOutputs(command,stageargs):
+	#the files written by the stage that are read by the other stages
+	outputs=[]
+	if command=="select":
+		outputs.append(stageargs.out)
+		if stageargs.classification!="":
+			outputs.append(GetBase(stageargs.out) + ".classification")
+	elif command=="sim":
+		outputs.append(stageargs.out + "/" + GetBase(os.path.basename(stageargs.input)) + ".sim")
+	elif command=="variation":
+		for rank in stageargs.classificationranks.split(","):
+			if rank!="":
+				outputs.append(stageargs.out + "/" + GetPrefix(stageargs) + "." + rank.lower() + ".variation")
+	elif command=="remove":
+		outputs.append(stageargs.out + "/" + GetBase(os.path.basename(stageargs.input)) + ".diff.fasta")
+	elif command=="predict":
+		outputs.append(stageargs.out + "/" + GetPrefix(stageargs) + ".predicted")
+		outputs.append(stageargs.out + "/" + GetPrefix(stageargs) + ".cutoffs.json")
+	elif command=="best":
+		outputs.append(stageargs.out + "/" + GetPrefix(stageargs) + ".best.json")
+		outputs.append(stageargs.out + "/" + GetPrefix(stageargs) + ".assign.json")
+	elif command=="merge":
+		outputs.append(stageargs.out)
+	elif command=="search":
+		outputs.append(stageargs.out + "/" + GetPrefix(stageargs) + "." + GetBase(os.path.basename(stageargs.reference)) + "_BLAST.bestmatch")
+	elif command=="classify":
+		prefix=stageargs.prefix
+		if prefix=="" or prefix==None:
+			prefix=GetBase(os.path.basename(stageargs.input))
+			if stageargs.globalcutoff > 0 and stageargs.cutoffs=="":
+				prefix=prefix + "." + str(stageargs.globalcutoff)
+		outputname=stageargs.out + "/" + prefix + ".classified"
+		if stageargs.classificationrank!="":
+			outputname=stageargs.out + "/" + prefix + "." + stageargs.classificationrank + ".classified"
+		if outputname==stageargs.input:
+			outputname=outputname + ".classified"
+		outputs.append(outputname)
+	return outputs
+
+def GetSimFilename(command,stageargs):
+	#the similarity matrix read by the stage
+	simfilename=""
+	if command in ["variation","remove","predict"]:
+		simfilename=stageargs.simfilename
+	if simfilename=="" or simfilename==None:
+		simfilename=""
+		if command=="remove":
+			simfilename=stageargs.out + "/" + GetBase(os.path.basename(stageargs.input)) + ".sim"
+		elif command=="predict":
+			simfilename=stageargs.out + "/" + GetPrefix(stageargs) + ".sim"
+	return simfilename
+
+def GetInputs(arguments,outputs,simfilename,previousoutputs):
+	#the files given by the options of the stage, which exist or are written by the earlier stages
+	inputs=[]
+	i=0
+	while i + 1 < len(arguments):
+		if arguments[i]!="-o":
+			for value in arguments[i+1].split(","):
+				filename=os.path.abspath(value)
+				if (filename in previousoutputs or os.path.isfile(filename)) and not (filename in outputs) and not (filename in inputs):
+					inputs.append(filename)
+		i=i+2
+	if simfilename!="":
+		filename=os.path.abspath(simfilename)
+		if (filename in previousoutputs or os.path.isfile(filename)) and not (filename in inputs):
+			inputs.append(filename)
+	return inputs
+
+def Preload(simfilename):
+	#the similarity matrix is loaded before the stage is started, and kept for the other stages
+	if os.path.exists(simfilename):
+		LoadSim(simfilename)
+
+def LoadPipeline(config,outputpath,ncpus):
+	pipeline=Pipeline(outputpath + "/" + GetBase(os.path.basename(configfilename)) + ".state.json",outputpath + "/checksums.json",ncpus)
+	defaultoptions=config.get("options",{})
+	previousoutputs=[]
+	i=0
+	for stageconfig in config["stages"]:
+		i=i+1
+		command=stageconfig.get("command","")
+		name=stageconfig.get("name",command + "." + str(i))
+		if not (command in COMMANDS.keys()):
+			print("The command " + command + " of the stage " + name + " is not run by the pipeline. The commands are " + ", ".join(COMMANDS.keys()) + ".")
+			return None
+		arguments=GetArguments(command,stageconfig.get("options",{}),defaultoptions,outputpath)
+		try:
+			stageargs=LoadScript(command).parser.parse_args(arguments)
+		except SystemExit:
+			print("The options of the stage " + name + " are not valid.")
+			return None
+		outputs=[os.path.abspath(filename) for filename in GetOutputs(command,stageargs)]
+		simfilename=GetSimFilename(command,stageargs)
+		inputs=GetInputs(arguments,outputs,simfilename,previousoutputs)
+		stage=Stage(name,lambda arguments,command=command: RunScript(command,arguments),arguments,inputs,outputs)
+		if simfilename!="":
+			stage.preload=lambda simfilename=simfilename: Preload(simfilename)
+		#the results of the earlier runs are not reused by a stage which is run again
+		if command=="predict" and stageargs.redo=="":
+			stage.redoarguments=["-redo","yes"]
+		elif command=="variation":
+			stage.redofiles=outputs
+		try:
+			pipeline.AddStage(stage)
+		except ValueError as e:
+			print(str(e))
+			return None
+		previousoutputs=previousoutputs + outputs
+	return pipeline
+
+def main(argv=None):
+	ParseArguments(argv)
+	with open(configfilename) as json_file:
+		config=json.load(json_file)
+	outputpath=config.get("out","dnabarcoder")
+	if not os.path.exists(outputpath):
+		os.system("mkdir " + outputpath)
+	ncpus=args.ncpus
+	if ncpus <=0:
+		ncpus=config.get("ncpus",1)
+	pipeline=LoadPipeline(config,outputpath,ncpus)
+	if pipeline==None:
+		sys.exit(1)
+	#the similarity matrices are loaded once for all the stages
+	KeepSims()
+	failed=pipeline.Run(args.redo=="yes")
+	if len(failed) > 0:
+		print("The stages " + ", ".join(failed) + " have failed or could not be run.")
+		sys.exit(1)
+	print("All the stages of " + configfilename + " are finished.")
+
+if __name__ == "__main__":
+	main()